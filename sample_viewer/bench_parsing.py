@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding=utf8
+from __future__ import with_statement
+
+# Compares parsing the bodies of the sample scanpaths with the csv module
+# (the way IView2PointFactory.from_component_list sees them) against the
+# columnar IView2PointFactory.from_delimited_lines.
+#
+# Run from this directory:
+#   python bench_parsing.py
+
+import csv
+import glob
+import time
+
+import numpy as np
+
+from gazehound import gazepoint
+from gazehound.readers.iview import IView2ScanpathReader
+
+REPEATS = 5
+
+
+def best_time(fx):
+    times = []
+    for i in range(REPEATS):
+        start = time.time()
+        result = fx()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+total_samples = 0
+total_csv = 0.0
+total_columnar = 0.0
+print("%-30s %10s %14s %16s %8s" % (
+    "file", "samples", "csv (smp/s)", "columnar (smp/s)", "speedup"))
+for filename in sorted(glob.glob("scanpaths/*.txt")):
+    lines = IView2ScanpathReader(filename=filename).content_lines
+    fact = gazepoint.IView2PointFactory()
+    csv_time, csv_points = best_time(lambda: fact.from_component_list(
+        csv.reader(lines, delimiter="\t")))
+    col_time, col_points = best_time(
+        lambda: fact.from_delimited_lines(lines))
+    assert np.array_equal(csv_points, col_points)
+
+    total_samples += len(lines)
+    total_csv += csv_time
+    total_columnar += col_time
+    print("%-30s %10d %14.0f %16.0f %8.2f" % (
+        filename, len(lines), len(lines)/csv_time, len(lines)/col_time,
+        csv_time/col_time))
+
+print("%-30s %10d %14.0f %16.0f %8.2f" % (
+    "all", total_samples, total_samples/total_csv,
+    total_samples/total_columnar, total_csv/total_columnar))
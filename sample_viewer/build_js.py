@@ -15,7 +15,7 @@ import json
 
 import gazehound
 from gazehound.readers.iview import IView2ScanpathReader
-from gazehound.readers.timeline import TimelineReader
+from gazehound.readers.batch import load_many, load_timelines
 from gazehound.viewing import Combiner
 
 
@@ -38,14 +38,13 @@ stim_images = {}
 
 output_wrapper = {}
 
-for snum in [s['name'] for s in SUBJECTS]:
+snums = [s['name'] for s in SUBJECTS]
+spaths = load_many(["scanpaths/scanpath_%s.txt" % snum for snum in snums],
+    try_order=[IView2ScanpathReader])
+tlines = load_timelines(["stim_timings/stims_%s.txt" % snum for snum in snums])
+
+for snum, spath, tline in zip(snums, spaths, tlines):
     print("Subject %s" % snum)
-    spath = None
-    tline = None
-    spfile = "scanpaths/scanpath_%s.txt" % snum
-    tlfile = "stim_timings/stims_%s.txt" % snum
-    tline = TimelineReader(filename=tlfile).timeline
-    spath = IView2ScanpathReader(filename=spfile).scanpath()
     # print("tl: %s, sp: %s" % (len(tline), len(spath)))
     decorated = Combiner(timeline=tline, scanpath=spath).viewings()
     
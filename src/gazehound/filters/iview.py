@@ -9,7 +9,7 @@
 from gazehound.event import Blink
 from gazehound.timeline import Timeline
 
-from copy import deepcopy
+from copy import copy, deepcopy
 
 import numpy as np
 
@@ -25,7 +25,13 @@ class Deblink(object):
         self.start_dy_threshold = start_dy_threshold
         self.end_dy_threshold = end_dy_threshold
 
-    def deblink(self, scanpath):
+    def __getstate__(self):
+        # What's left over from the last scanpath we looked at can be as
+        # big as that scanpath, and isn't worth pickling.
+        return dict((name, val) for name, val in self.__dict__.items()
+            if not name.startswith('_Deblink__'))
+
+    def deblink(self, scanpath, out_file=None):
         """
         Interpolates blinks out of scanpath.
 
@@ -33,18 +39,46 @@ class Deblink(object):
         and using its interpolable values for the rest of the points during
         the blink. Not using any averaging -- saccades during blinks are
         common, and averaging-type methods seem wrong to me here.
+
+        If out_file is given, the result's points are memory-mapped from
+        that .npy file rather than held in memory.
         """
-        blinks = self.blinks(scanpath)
-        pc = deepcopy(scanpath)
-        for b in blinks:
-            # Interpolate from the point before start_index -- no averaging.
-            if b.start_index > 0:
-                prev_pt = pc[b.start_index-1]
-                for point in pc[(b.start_index):(b.end_index+1)]:
-                    pc.copy_measures(prev_pt, point)
+        return self.process_in_place(working_copy(scanpath, out_file))
 
+    def process_in_place(self, pc):
+        """ Like deblink(), but changes pc's points and returns pc. """
+        starts, ends = self.blink_indexes(pc)
+        in_blink = self._blink_mask(starts, ends, 0, len(pc))
+        if np.any(in_blink):
+            self._fill_blinks(pc.points,
+                pc.measure_indexes(pc.interpolable_measures), in_blink)
         return pc
 
+    def _blink_mask(self, starts, ends, lo, hi):
+        """ Mask of the points from lo to hi in any of the blinks """
+        # Blinks starting at the first point have nothing to copy from.
+        keep = (starts > 0) & (ends >= starts) & (starts < hi) & (ends >= lo)
+        starts = np.maximum(starts[keep], lo) - lo
+        ends = np.minimum(ends[keep], hi - 1) - lo
+        # Mark the points in any blink: +1 at each start, -1 after each end.
+        edges = np.zeros(hi - lo + 1, dtype=int)
+        np.add.at(edges, starts, 1)
+        np.add.at(edges, ends + 1, -1)
+        return np.cumsum(edges[:-1]) > 0
+
+    def _fill_blinks(self, points, cols, in_blink, lo=0, last_good=0):
+        """
+        Copy the cols of the last good point before each blinking point
+        into it, in place. in_blink is a mask of points[lo:], and last_good
+        is the index of the last good point before lo.
+        """
+        # Blinks are handled in order, so when they overlap or touch, later
+        # ones copy what earlier ones copied -- that same point.
+        sources = np.maximum.accumulate(np.where(
+            in_blink, last_good, np.arange(lo, lo + len(in_blink))))
+        rows = np.flatnonzero(in_blink) + lo
+        points[np.ix_(rows, cols)] = points[np.ix_(sources[rows - lo], cols)]
+
     def blinks(self, scanpath):
         """
         Return a Timeline of Blinks. Each blink will have a start_index
@@ -55,19 +89,34 @@ class Deblink(object):
         Currently, the "guaranteed valid data" window is actually one point
         wider -- but that may not remain true in future versions.
         """
-        candidates = self.all_blink_candidates(scanpath)
-        expanded = self.expand_blinks(candidates, scanpath)
-        filtered = self.filter_for_length(expanded)
-        deduped = self.deduplicate(filtered)
-        return deduped
+        starts, ends = self.blink_indexes(scanpath)
+        return self._blink_timeline(starts, ends, scanpath)
+
+    def blink_indexes(self, scanpath):
+        """
+        Like blinks(), but return (start_indexes, end_indexes) arrays
+        instead of a Timeline.
+        """
+        times = self._times(scanpath)
+        starts, ends = self._candidate_indexes(scanpath)
+        starts, ends = self._expanded_indexes(starts, ends, len(times))
+        durations = times[ends] - times[starts]
+        keep = ((durations >= self.min_duration) &
+            (durations <= self.max_duration))
+        starts, ends = starts[keep], ends[keep]
+        keep = self._first_of_each_start(times[starts])
+        return (starts[keep], ends[keep])
 
     def all_blink_candidates(self, scanpath):
+        starts, ends = self._candidate_indexes(scanpath)
+        return self._blink_timeline(starts, ends, scanpath)
+
+    def _candidate_indexes(self, scanpath):
         # Basic algo is much like denoising:
         # 1: Find areas in which our measure is zero
         # 2: Take the derivative to find edges of those areas
         # 3: Starts and ends of the blink candidates are the indexes of
         #    the path in which dy > 0 and dy < 0, respectively.
-        candidates = []
         measures = ('x', 'y')
         arr = scanpath.as_array(measures).T # Transposing makes it all easier
         self.__arr = arr
@@ -88,52 +137,52 @@ class Deblink(object):
 
         edges = np.diff(candidate_times)
         starts = np.where(edges > 0)[0]
-        ends = np.where(edges < 0)[0]
-        time_idx = scanpath.measure_index('time')
-        for i in range(len(starts)):
-            si = starts[i]
-            ei = ends[i]-1
-            b = Blink(start=scanpath[si][time_idx], end=scanpath[ei][time_idx])
-            b.start_index = si
-            b.end_index = ei
-            candidates.append(b)
-
-        return Timeline(events=candidates)
+        ends = np.where(edges < 0)[0] - 1
+        return (starts, ends)
 
     def deduplicate(self, timeline):
-        new_blinks = []
-        for blink in timeline:
-            if len(new_blinks) == 0:
-                new_blinks.append(blink)
-            else:
-                if new_blinks[-1].start != blink.start:
-                    new_blinks.append(blink)
-        return Timeline(events=new_blinks)
+        keep = self._first_of_each_start([blink.start for blink in timeline])
+        return Timeline(events=[
+            blink for blink, k in zip(timeline, keep) if k])
+
+    def _first_of_each_start(self, start_times):
+        """ Mask of the blinks not starting when the one before them did """
+        start_times = np.asarray(start_times)
+        keep = np.ones(len(start_times), dtype=bool)
+        keep[1:] = start_times[1:] != start_times[:-1]
+        return keep
 
     def expand_blinks(self, blinks, scanpath):
-        expanded = [self.expand_blink_bidir(b, scanpath) for b in blinks]
-        return Timeline(events = [b for b in expanded if b is not None])
+        starts = np.array([b.start_index for b in blinks], dtype=int)
+        ends = np.array([b.end_index for b in blinks], dtype=int)
+        starts, ends = self._expanded_indexes(starts, ends, len(scanpath))
+        return self._blink_timeline(starts, ends, scanpath)
 
     def expand_blink_bidir(self, blink, scanpath):
-        try:
-            b = deepcopy(blink)
-            # A little tricky double-dereferencing here: we're looking for the
-            # index of the point
-            idx_before_blink = np.where(self.__below_start_dy_thresh_idx < b.start_index)[0]
-            pre_idx_idx = np.where(
-                self.__below_start_dy_thresh_idx < b.start_index)[0][-1]
-            # Add one -- this will the first point of "bad" data
-            b.start_index = self.__below_start_dy_thresh_idx[pre_idx_idx]+1
-            post_idx_idx = np.where(
-                self.__below_end_dy_thresh_idx > b.end_index)[0][0]
-            # Subtract two -- this will be the last point of bad data
-            b.end_index = self.__below_end_dy_thresh_idx[post_idx_idx]-2
-            time_idx = scanpath.measure_index('time')
-            b.start = scanpath[b.start_index][time_idx]
-            b.end = scanpath[b.end_index][time_idx]
-            return b
-        except IndexError:
+        expanded = self.expand_blinks([blink], scanpath)
+        if len(expanded) == 0:
             return None
+        return expanded[0]
+
+    def _expanded_indexes(self, starts, ends, n):
+        """
+        Move each blink's start back to just after the last point before
+        it where |dy| was under start_dy_threshold, and its end forward to
+        two points before the first point after it where |dy| was under
+        end_dy_threshold. Blinks without such points are dropped.
+        """
+        below_start = self.__below_start_dy_thresh_idx
+        below_end = self.__below_end_dy_thresh_idx
+        pre_idx_idx = np.searchsorted(below_start, starts, 'left') - 1
+        post_idx_idx = np.searchsorted(below_end, ends, 'right')
+        found = (pre_idx_idx >= 0) & (post_idx_idx < len(below_end))
+        # Add one -- this will the first point of "bad" data
+        new_starts = below_start[pre_idx_idx[found]] + 1
+        # Subtract two -- this will be the last point of bad data
+        new_ends = below_end[post_idx_idx[found]] - 2
+        # There's no point after the last one to start on.
+        in_path = new_starts < n
+        return (new_starts[in_path], new_ends[in_path])
 
     def filter_for_length(self, timeline):
         """ Does not alter timeline, returns a copy. """
@@ -142,6 +191,19 @@ class Deblink(object):
                 ev.duration >= self.min_duration and
                 ev.duration <= self.max_duration)])
 
+    def _times(self, scanpath):
+        return scanpath.points[:,scanpath.measure_index('time')]
+
+    def _blink_timeline(self, starts, ends, scanpath):
+        times = self._times(scanpath)
+        blinks = []
+        for si, ei in zip(starts, ends):
+            b = Blink(start=times[si], end=times[ei])
+            b.start_index = si
+            b.end_index = ei
+            blinks.append(b)
+        return Timeline(events=blinks)
+
 
 class Denoise(object):
     """
@@ -152,46 +214,83 @@ class Denoise(object):
     def __init__(self, max_noise_samples=2):
         self.max_noise_samples = max_noise_samples
 
-    def process(self, scanpath):
+    def process(self, scanpath, out_file=None):
         """
         Runs a denoising on the scanpath. Returns a copy of scanpath --
-        does not modify it.
+        does not modify it. If out_file is given, the copy's points are
+        memory-mapped from that .npy file rather than held in memory.
         """
-        sp = deepcopy(scanpath)
-        # We'll work on one at a time
-        for meas in sp.interpolable_measures:
-            meas_idx = sp.measure_index(meas)
-            arr = sp.as_array((meas,)).T.flatten()
-            # This array is 1 everywhere s_arr is zero
-            missing_mask = arr == 0
-            sp.points[:,meas_idx] = self._interp_masked(arr, missing_mask)
+        return self.process_in_place(working_copy(scanpath, out_file))
 
+    def process_in_place(self, sp):
+        """ Like process(), but changes sp's points and returns sp. """
+        cols = self._gap_columns(sp)
+        self._interp_columns(sp.points, cols, self._gaps(sp.points[:,cols]))
         return sp
 
+    def _gap_columns(self, sp):
+        """ The indexes of the columns of sp's points we fill gaps in """
+        return sp.measure_indexes(sp.interpolable_measures)
+
+    def _gaps(self, vals):
+        """ Mask of the gaps in vals, the values of _gap_columns() """
+        # Gaps are the zeroes in each measure, found all at once
+        return vals == 0
+
     def _interp_masked(self, arr, mask):
+        """ Interpolate over the masked points of a 1-d arr, in place """
+        self._interp_columns(arr[:,np.newaxis], [0], mask[:,np.newaxis])
+        return arr
+
+    def _interp_columns(self, points, cols, mask, wrap=True, last=None):
+        """
+        Linearly interpolate over the runs of masked points (no longer
+        than max_noise_samples) in the cols of points, in place. mask has
+        a column for each of cols.
+
+        As ever, a run at the start interpolates from the column's last
+        value (or last's, if that point is given; unless wrap is False,
+        when it's left alone), and a run at the end is left alone.
+        """
+        n = len(points)
+        if n == 0 or len(cols) == 0:
+            return points
         # Pad both ends with zeroes and take the derivative -- it'll be 1
-        # at the start of missing data and -1 at the end
-        padded = np.hstack((0, mask, 0))
-        edges = np.diff(padded)
-        starts = np.where(edges > 0)[0]
-        ends = np.where(edges < 0)[0]
+        # at the start of missing data and -1 at the end. Going through
+        # the transpose keeps each column's runs together, in order.
+        padded = np.zeros((len(cols), n + 2), dtype=np.int8)
+        padded[:,1:-1] = mask.T
+        edges = np.diff(padded, axis=1)
+        run_cols, starts = np.nonzero(edges > 0)
+        ends = np.nonzero(edges < 0)[1]
+        # And now, the things to correct are no longer than max_noise, and
+        # have a known point after them.
+        fix = ((ends - starts) <= self.max_noise_samples) & (ends < n)
+        if not wrap:
+            fix &= starts > 0
+        run_cols, starts, ends = run_cols[fix], starts[fix], ends[fix]
+        if len(starts) == 0:
+            return points
+
+        # Every point in every run, with its run's known points on either
+        # side: one long index set for all the runs in all the columns.
         lengths = ends - starts
-        # And now, the things to correct are no longer than max_noise
-        idxs_to_correct = np.where(lengths <= self.max_noise_samples)[0]
-        for c_idx in idxs_to_correct:
-            # Find the interp values...
-            known_x = [starts[c_idx]-1, ends[c_idx]]
-            interp_x = range(starts[c_idx], ends[c_idx])
-            # At this point, IndexErrors are OK -- they'll only fire
-            # on the last point.
-            try:
-                interp_y = np.interp(interp_x, known_x, arr[known_x])
-                # And save the data
-                for i in range(len(interp_x)):
-                    arr[interp_x[i]] = interp_y[i]
-            except IndexError:
-                pass
-        return arr
+        run_ids = np.repeat(np.arange(len(starts)), lengths)
+        rows = np.arange(lengths.sum()) + np.repeat(
+            starts - np.cumsum(lengths) + lengths, lengths)
+        cols = np.asarray(cols)[run_cols]
+        left = starts - 1
+        # Index -1 is the last point, as it always has been.
+        left_vals = points[left % n, cols].astype(float)
+        if last is not None:
+            wrapped = left < 0
+            left_vals[wrapped] = np.asarray(last)[cols[wrapped]]
+        right_vals = points[ends, cols].astype(float)
+        # The same arithmetic np.interp() uses, so the results match it.
+        slopes = (right_vals - left_vals) / (ends - left)
+        points[rows, cols[run_ids]] = (
+            slopes[run_ids] * (rows - left[run_ids]) + left_vals[run_ids])
+        return points
 
 
 class OutofboundsDenoiser(Denoise):
@@ -205,11 +304,48 @@ class OutofboundsDenoiser(Denoise):
         super(OutofboundsDenoiser, self).__init__(max_noise_samples)
         self.measure_bounds = measure_bounds
 
-    def process(self, scanpath):
-        sp = deepcopy(scanpath)
-        for measure, bounds in self.measure_bounds:
-            meas_idx = sp.measure_index(measure)
-            arr = sp.points[:,meas_idx]
-            mask = np.logical_or((arr < bounds[0]), (arr > bounds[1]))
-            sp.points[:,meas_idx] = self._interp_masked(arr, mask)
-        return sp
+    def process_in_place(self, sp):
+        stages = self._single_stages()
+        if len(stages) > 1:
+            for stage in stages:
+                stage.process_in_place(sp)
+            return sp
+        return super(OutofboundsDenoiser, self).process_in_place(sp)
+
+    def _single_stages(self):
+        """
+        Return a list of denoisers that, run in order, do what this one
+        does, none of them filtering a measure more than once. A measure
+        filtered twice sees the first filter's results.
+        """
+        measures = [measure for measure, bounds in self.measure_bounds]
+        if len(set(measures)) == len(measures):
+            return [self]
+        return [OutofboundsDenoiser([measure_bounds], self.max_noise_samples)
+            for measure_bounds in self.measure_bounds]
+
+    def _gap_columns(self, sp):
+        return sp.measure_indexes(
+            [measure for measure, bounds in self.measure_bounds])
+
+    def _gaps(self, vals):
+        lows = np.array([bounds[0] for measure, bounds in self.measure_bounds])
+        highs = np.array([bounds[1] for measure, bounds in self.measure_bounds])
+        return (vals < lows) | (vals > highs)
+
+
+def working_copy(scanpath, out_file=None):
+    """
+    Return a copy of scanpath that filters can change freely. With
+    out_file, the copy's points go to that .npy file (see
+    UniformelySampledScanpath.to_memmap) instead of into memory.
+    Uniformely-sampled scanpaths only have their points array copied.
+    """
+    if out_file is not None:
+        return scanpath.to_memmap(out_file)
+    if not scanpath.uniformely_sampled:
+        return deepcopy(scanpath)
+    sp = copy(scanpath)
+    sp.points = np.array(scanpath.points)
+    sp.headers = copy(scanpath.headers)
+    return sp
@@ -0,0 +1,269 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+#
+# This module splits one long scanpath into chunks and filters them with a
+# pool of worker processes.
+
+import os.path
+import atexit
+import shutil
+from copy import copy
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from gazehound.gazepoint import UniformelySampledScanpath
+from gazehound.filters.iview import (Deblink, Denoise, OutofboundsDenoiser,
+    working_copy)
+
+DEFAULT_CHUNK_SAMPLES = 200000
+
+
+class ParallelPipeline(object):
+    """
+    Does what a FilterPipeline of Denoise, OutofboundsDenoiser and Deblink
+    stages does, but runs each stage over chunks of about chunk_samples
+    points with a pool of jobs processes (by default, one per CPU).
+
+    Each chunk is read with a halo of the points around it -- as many as
+    the stage can reach: max_noise_samples points for a denoiser, and
+    max_duration's worth of points for a Deblink -- and only the points
+    inside the chunk are written back. The results are the same as the
+    serial filters', to the bit.
+
+    Workers share the points through memory-mapped .npy files, as
+    load_many() does, so no points go through a pipe; with out_file, that
+    file is the one they work on. The workers are shared_pool()'s, and are
+    only started if there's a Denoise or Deblink stage to run. Scanpaths
+    that aren't uniformely sampled, short ones, and (for Deblink) ones
+    whose times ever decrease are filtered serially, as are other stages
+    (such as a Recenter).
+    """
+
+    def __init__(self, stages, jobs=None, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        super(ParallelPipeline, self).__init__()
+        self.stages = list(stages)
+        self.jobs = jobs
+        self.chunk_samples = chunk_samples
+
+    def process(self, scanpath, out_file=None):
+        """
+        Return a copy of scanpath with every stage applied. If out_file is
+        given, the copy's points are memory-mapped from that .npy file.
+        """
+        bounds = chunk_bounds(len(scanpath), self.chunk_samples)
+        parallel_stages = [s for s in self.stages
+            if isinstance(s, (Deblink, Denoise))]
+        if (self.jobs == 1 or len(bounds) < 2 or not parallel_stages or
+                not scanpath.uniformely_sampled):
+            sp = working_copy(scanpath, out_file)
+            for stage in self.stages:
+                sp = stage.process_in_place(sp)
+            return sp
+
+        tmp_dir = tempfile.mkdtemp(prefix='gazehound-')
+        try:
+            # The working copy is mapped from the file the workers start on.
+            current = out_file or os.path.join(tmp_dir, "a.npy")
+            sp = working_copy(scanpath, current)
+            spare = None
+            if any(isinstance(s, Denoise) for s in parallel_stages):
+                spare = os.path.join(tmp_dir, "b.npy")
+                np.lib.format.open_memmap(spare, mode='w+',
+                    dtype=sp.points.dtype, shape=sp.points.shape)
+            pool = shared_pool(self.jobs)
+            for stage in self.stages:
+                if isinstance(stage, Deblink):
+                    self.__deblink(pool, stage, sp, current, bounds, tmp_dir)
+                elif isinstance(stage, Denoise):
+                    for single in _single_stages(stage):
+                        self.__denoise(pool, single, sp, current, spare,
+                            bounds)
+                        current, spare = spare, current
+                else:
+                    _in_place_serially(stage, sp, current)
+            if out_file is None:
+                sp.points = np.array(np.load(current, mmap_mode='r'))
+                sp.headers = copy(scanpath.headers)
+            elif current != out_file:
+                sp.points[:] = np.load(current, mmap_mode='r')
+                sp.points.flush()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return sp
+
+    def __denoise(self, pool, stage, sp, src_path, dst_path, bounds):
+        # Workers read their halos from src and write their chunks to dst,
+        # so no one reads a point someone else has changed.
+        halo = stage.max_noise_samples + 1
+        n = len(sp)
+        tasks = [(stage, src_path, dst_path, stage._gap_columns(sp),
+            (max(start - halo, 0), start, end, min(end + halo, n)))
+            for start, end in bounds]
+        pool.map(_denoise_chunk, tasks, chunksize=1)
+
+    def __deblink(self, pool, stage, sp, path, bounds, tmp_dir):
+        times = np.load(path, mmap_mode='r')[:,sp.measure_index('time')]
+        if not np.all(np.diff(times) >= 0):
+            _in_place_serially(stage, sp, path)
+            return
+        # First, find which points are in blinks...
+        mask_path = os.path.join(tmp_dir, "blinks.npy")
+        np.lib.format.open_memmap(
+            mask_path, mode='w+', dtype=bool, shape=(len(sp),))
+        tasks = [(stage, path, mask_path, sp.measures,
+            _blink_halo(times, start, end, stage.max_duration))
+            for start, end in bounds]
+        last_goods = pool.map(_blink_chunk, tasks, chunksize=1)
+        # ... then fill them in from the last good point before them, which
+        # may be in an earlier chunk. Those points don't change, so this
+        # can be done in place.
+        carried = np.maximum.accumulate([0] + last_goods[:-1])
+        cols = sp.measure_indexes(sp.interpolable_measures)
+        tasks = [(stage, path, mask_path, cols, start, end, last_good)
+            for (start, end), last_good in zip(bounds, carried)]
+        pool.map(_fill_chunk, tasks, chunksize=1)
+
+
+_pools = {}
+
+def shared_pool(jobs=None):
+    """
+    Return a multiprocessing.Pool of jobs processes (by default, one per
+    CPU). It's started the first time it's asked for and reused after
+    that, until close_pools() or exit.
+    """
+    if jobs not in _pools:
+        _pools[jobs] = multiprocessing.Pool(jobs)
+    return _pools[jobs]
+
+
+def close_pools():
+    """ Stop every pool shared_pool() has started. """
+    for pool in _pools.values():
+        pool.close()
+        pool.join()
+    _pools.clear()
+
+atexit.register(close_pools)
+
+
+def chunk_bounds(n, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+    """
+    Return a list of (start, end) pairs splitting n points into chunks of
+    at least chunk_samples (and at least two) points, except when there
+    are fewer than that.
+    """
+    chunk_count = max(n // max(chunk_samples, 2), 1)
+    edges = [(n * i) // chunk_count for i in range(chunk_count + 1)]
+    return zip(edges[:-1], edges[1:])
+
+
+def convolve_columns(padded, kernel, jobs=None,
+        chunk_samples=DEFAULT_CHUNK_SAMPLES):
+    """
+    Return np.convolve(kernel, column, mode='valid') for each column of
+    padded, as columns of an array, working on chunks in parallel.
+    """
+    n = len(padded) - len(kernel) + 1
+    tmp_dir = tempfile.mkdtemp(prefix='gazehound-')
+    try:
+        padded_path = os.path.join(tmp_dir, "padded.npy")
+        out_path = os.path.join(tmp_dir, "out.npy")
+        np.save(padded_path, np.ascontiguousarray(padded))
+        out = np.lib.format.open_memmap(out_path, mode='w+',
+            dtype=np.result_type(kernel, padded), shape=(n, padded.shape[1]))
+        del out
+        tasks = [(padded_path, out_path, kernel, start, end)
+            for start, end in chunk_bounds(n, chunk_samples)]
+        _pool_map(_convolve_chunk, tasks, jobs)
+        return np.array(np.load(out_path, mmap_mode='r'))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _single_stages(stage):
+    if isinstance(stage, OutofboundsDenoiser):
+        return stage._single_stages()
+    return [stage]
+
+
+def _blink_halo(times, start, end, max_duration):
+    """
+    Return (lo, start, end, hi): the points from lo to hi hold every blink
+    that could cover a point from start to end, and all that decides it.
+    """
+    # A blink lasts no more than max_duration, and is found from the point
+    # before its start to two points after its end.
+    lo = np.searchsorted(times, times[start] - max_duration, 'left') - 2
+    hi = np.searchsorted(times, times[end - 1] + max_duration, 'right') + 2
+    return (max(lo, 0), start, end, min(hi, len(times)))
+
+
+def _in_place_serially(stage, sp, path):
+    """ Run stage over a copy of sp whose points are mapped from path """
+    mapped = copy(sp)
+    mapped.points = np.load(path, mmap_mode='r+')
+    stage.process_in_place(mapped).points.flush()
+
+
+def _pool_map(fx, items, jobs):
+    return shared_pool(jobs).map(fx, items, chunksize=1)
+
+
+def _denoise_chunk(task):
+    stage, src_path, dst_path, cols, (lo, start, end, hi) = task
+    src = np.load(src_path, mmap_mode='r')
+    points = np.array(src[lo:hi])
+    # Runs at the edge of a halo are too long to fill in anyhow -- except
+    # at the very start, where we fill from the very last point.
+    last = None
+    if lo == 0:
+        last = np.array(src[-1])
+    stage._interp_columns(points, cols, stage._gaps(points[:,cols]),
+        wrap=(lo == 0), last=last)
+    dst = np.load(dst_path, mmap_mode='r+')
+    dst[start:end] = points[start-lo:end-lo]
+    dst.flush()
+
+
+def _blink_chunk(task):
+    stage, path, mask_path, measures, (lo, start, end, hi) = task
+    points = np.array(np.load(path, mmap_mode='r')[lo:hi])
+    starts, ends = stage.blink_indexes(
+        UniformelySampledScanpath(None, points, measures))
+    in_blink = stage._blink_mask(starts + lo, ends + lo, start, end)
+    mask = np.load(mask_path, mmap_mode='r+')
+    mask[start:end] = in_blink
+    mask.flush()
+    good = np.flatnonzero(~in_blink)
+    if len(good) == 0:
+        return 0
+    return start + good[-1]
+
+
+def _fill_chunk(task):
+    stage, path, mask_path, cols, start, end, last_good = task
+    in_blink = np.array(np.load(mask_path, mmap_mode='r')[start:end])
+    if not np.any(in_blink):
+        return
+    points = np.load(path, mmap_mode='r+')
+    stage._fill_blinks(points, cols, in_blink, start, last_good)
+    points.flush()
+
+
+def _convolve_chunk(task):
+    padded_path, out_path, kernel, start, end = task
+    padded = np.load(padded_path, mmap_mode='r')
+    out = np.load(out_path, mmap_mode='r+')
+    chunk = padded[start:end + len(kernel) - 1]
+    for col in range(padded.shape[1]):
+        out[start:end, col] = np.convolve(
+            kernel, np.ascontiguousarray(chunk[:,col]), mode='valid')
+    out.flush()
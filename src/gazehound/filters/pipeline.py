@@ -0,0 +1,112 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+#
+# This module chains filters over one working copy of a scanpath, instead
+# of each filter making its own copy.
+
+import numpy as np
+
+from gazehound import viewing
+from gazehound.filters.iview import working_copy
+
+
+class FilterPipeline(object):
+    """
+    Runs stages one after another over a single working copy of a
+    scanpath, so a chain like
+
+        FilterPipeline([OutofboundsDenoiser(...), Denoise(), Deblink(),
+            Recenter(timeline, 'fixation', 400, 300)])
+
+    needs about twice the memory of the raw data, however many stages it
+    has. The raw scanpath isn't changed.
+
+    Each stage must have a process_in_place(scanpath) method that changes
+    scanpath's points (and nothing else's) and returns scanpath.
+
+    With track_changes, process() also fills in provenance: a list of
+    (stage, sample_indexes) pairs, giving the indexes of the samples each
+    stage changed. That costs another copy of the points.
+    """
+
+    def __init__(self, stages, track_changes=False):
+        super(FilterPipeline, self).__init__()
+        self.stages = list(stages)
+        self.track_changes = track_changes
+        self.provenance = None
+
+    def process(self, scanpath, out_file=None):
+        """
+        Return a copy of scanpath with every stage applied. If out_file is
+        given, the copy's points are memory-mapped from that .npy file.
+        """
+        sp = working_copy(scanpath, out_file)
+        before = None
+        if self.track_changes:
+            self.provenance = []
+            before = np.array(sp.points)
+        for stage in self.stages:
+            sp = stage.process_in_place(sp)
+            if before is not None:
+                self.provenance.append(
+                    (stage, changed_samples(before, sp.points)))
+                before[...] = sp.points
+        return sp
+
+
+def changed_samples(before, after):
+    """
+    Return the indexes of the rows that differ between before and after.
+    NaNs are equal to each other here.
+    """
+    changed = (before != after) & ((before == before) | (after == after))
+    return np.flatnonzero(np.any(changed, axis=1))
+
+
+class Recenter(object):
+    """
+    A pipeline stage doing what Timeline.recenter_on() does to a combined
+    timeline, but to the samples of a scanpath: each time an event named
+    name is shown, find the offset that moves the center (method, within
+    bounds) of its points to (x_center, y_center), and shift its samples
+    and those of every event after it by that offset until the next one.
+    Samples outside every event aren't moved.
+    """
+
+    def __init__(self, timeline, name, x_center, y_center, bounds=None,
+                 method='median'):
+        super(Recenter, self).__init__()
+        self.timeline = timeline
+        self.name = name
+        self.x_center = x_center
+        self.y_center = y_center
+        self.bounds = bounds
+        self.method = method
+
+    def process_in_place(self, sp):
+        viewings = viewing.Combiner(
+            timeline=self.timeline, scanpath=sp).viewings()
+        event_ids = viewings.sample_event_ids()
+        if event_ids is None:
+            raise ValueError("Can't recenter a scanpath out of time order")
+        offsets = np.zeros((len(viewings), 2))
+        x_offset, y_offset = 0, 0
+        for i, pres in enumerate(viewings):
+            if pres.name == self.name:
+                inbounds = pres.scanpath.points_within(self.bounds)
+                result = getattr(inbounds, self.method)()
+                if result is not None and len(result) == 2:
+                    xpart, ypart = result
+                    x_offset = self.x_center - xpart
+                    y_offset = self.y_center - ypart
+            offsets[i] = (x_offset, y_offset)
+        rows = np.flatnonzero(event_ids >= 0)
+        x_i, y_i = sp.measure_indexes(('x', 'y'))
+        sp.points[rows, x_i] += offsets[event_ids[rows], 0]
+        sp.points[rows, y_i] += offsets[event_ids[rows], 1]
+        return sp
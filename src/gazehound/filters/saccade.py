@@ -11,6 +11,7 @@ from scipy.ndimage import maximum_filter1d as max_flt
 from scipy.stats import scoreatpercentile
 
 from gazehound.event import Saccade
+from gazehound.filters import parallel
 
 class AdaptiveDetector(object):
     """ 
@@ -26,7 +27,7 @@ class AdaptiveDetector(object):
     def __init__(self, scanpath, measures=('x', 'y'), 
             clip_speed_percent=99.5, minimum_fixation_ms=117,
             threshold_start_percent=99.5, threshold_sd_scale=3,
-            threshold_min_change=0.001, threshold_max_iters=10000):
+            threshold_min_change=0.001, threshold_max_iters=10000, jobs=1):
             
         self.scanpath = scanpath
         self.measures = measures
@@ -36,6 +37,8 @@ class AdaptiveDetector(object):
         self.threshold_sd_scale = threshold_sd_scale
         self.threshold_min_change = threshold_min_change
         self.threshold_max_iters = threshold_max_iters
+        # Processes to smooth with; None means one per CPU.
+        self.jobs = jobs
 
         self.__minimum_fixation_width = int(np.round(
             (self.scanpath.samples_per_second/1000.0) * minimum_fixation_ms
@@ -78,8 +81,8 @@ class AdaptiveDetector(object):
             scoreatpercentile(arr, percentiles[1]))
     
     def _compute_saccades(self):
-        self._p_diffs = np.apply_along_axis(
-            sgolay, 0, self._p_arr, self.__sg_filter_width, 2, 1)
+        self._p_diffs = sgolay_columns(
+            self._p_arr, self.__sg_filter_width, 2, 1, jobs=self.jobs)
         
         csp = self.clip_speed_percent
         clamped = self._clamp_to_percentile(
@@ -154,6 +157,33 @@ def sgolay(y, window_size, order, deriv=0):
        Cambridge University Press ISBN-13: 9780521880688
     """
 
+    m, half_window = sgolay_kernel(window_size, order, deriv)
+    return np.convolve( m, _sgolay_padded(y, half_window), mode='valid')
+
+
+def sgolay_columns(arr, window_size, order, deriv=0, jobs=1,
+        chunk_samples=parallel.DEFAULT_CHUNK_SAMPLES):
+    """
+    Run sgolay() down each column of arr. With jobs other than 1, long
+    columns are split into chunks of about chunk_samples points, which are
+    smoothed by a pool of jobs processes (by default, one per CPU). Each
+    chunk overlaps its neighbors by half a window, so the results are the
+    same either way.
+    """
+    if jobs == 1 or len(parallel.chunk_bounds(len(arr), chunk_samples)) < 2:
+        return np.apply_along_axis(
+            sgolay, 0, arr, window_size, order, deriv)
+    m, half_window = sgolay_kernel(window_size, order, deriv)
+    padded = np.column_stack(
+        [_sgolay_padded(col, half_window) for col in arr.T])
+    return parallel.convolve_columns(padded, m, jobs, chunk_samples)
+
+
+def sgolay_kernel(window_size, order, deriv=0):
+    """
+    Return (coefficients, half_window) for sgolay(), checking window_size
+    and order.
+    """
     try:
         window_size = np.abs(np.int(window_size))
         order = np.abs(np.int(order))
@@ -168,10 +198,12 @@ def sgolay(y, window_size, order, deriv=0):
     # precompute coefficients
     b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
     m = np.linalg.pinv(b).A[deriv]
+    return (m, half_window)
+
+
+def _sgolay_padded(y, half_window):
     # pad the signal at the extremes with
     # values taken from the signal itself
     firstvals = y[0] - np.abs( y[1:half_window+1][::-1] - y[0] )
     lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
-    y = np.concatenate((firstvals, y, lastvals))
-    return np.convolve( m, y, mode='valid')
-
+    return np.concatenate((firstvals, y, lastvals))
@@ -0,0 +1,386 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+#
+# This module runs the iView filters over blocks of points as they arrive
+# (from a tracker, or from a reader's point_blocks()), instead of over a
+# whole scanpath at once.
+
+import numpy as np
+
+from gazehound.gazepoint import UniformelySampledScanpath
+from gazehound.filters.iview import Deblink, OutofboundsDenoiser
+
+
+class StreamPipeline(object):
+    """
+    Runs stages (Denoise, OutofboundsDenoiser and Deblink filters) over
+    blocks of points, each block an array with a column for each of
+    measures. Feed blocks to push() and, at the end of the data, call
+    finish(); between them they return the cleaned points, in order and in
+    blocks of their own.
+
+    The cleaned points are those the whole-scanpath filters would give,
+    however the data is split into blocks, with one exception: a run of
+    noise at the very start of the data is left alone, as one at the very
+    end always has been. (The whole-scanpath filters fill it in from the
+    last point, which a stream doesn't have yet.)
+
+    Each stage only holds back points it can't decide about yet: no more
+    than max_noise_samples of them for a denoiser, and no more than
+    max_duration's worth (plus a couple of points) for a Deblink.
+    Time must not decrease from point to point.
+    """
+
+    def __init__(self, stages, measures, time_measures=('time', 'duration')):
+        super(StreamPipeline, self).__init__()
+        self.stages = list(stages)
+        self.streams = []
+        for stage in self.stages:
+            self.streams.extend(
+                streams_for(stage, measures, time_measures))
+
+    def push(self, points):
+        """ Take a block of points; return the points that are now clean """
+        for stream in self.streams:
+            points = stream.push(points)
+        return points
+
+    def finish(self):
+        """ Return the points still held back, once there are no more """
+        out = None
+        for stream in self.streams:
+            if out is None:
+                out = stream.finish()
+            else:
+                out = np.vstack((stream.push(out), stream.finish()))
+        return out
+
+    def filter_blocks(self, blocks):
+        """
+        Yield the cleaned points of an iterable of blocks, such as a
+        reader's point_blocks(), skipping empty blocks.
+        """
+        for block in blocks:
+            out = self.push(block)
+            if len(out) > 0:
+                yield out
+        out = self.finish()
+        if len(out) > 0:
+            yield out
+
+
+def streams_for(stage, measures, time_measures=('time', 'duration')):
+    """ Return a list of streams doing, in order, what stage does """
+    if isinstance(stage, Deblink):
+        return [DeblinkStream(stage, measures, time_measures)]
+    if isinstance(stage, OutofboundsDenoiser):
+        return [DenoiseStream(s, measures, time_measures)
+            for s in stage._single_stages()]
+    return [DenoiseStream(stage, measures, time_measures)]
+
+
+def measure_template(measures, time_measures=('time', 'duration')):
+    """
+    Return an empty scanpath with measures, for working out which columns
+    of a block a filter uses.
+    """
+    measures = tuple(measures)
+    template = UniformelySampledScanpath(
+        None, np.zeros((0, len(measures))), measures)
+    template.time_measures = tuple(time_measures)
+    return template
+
+
+class DenoiseStream(object):
+    """
+    Runs a Denoise (or an OutofboundsDenoiser that filters each measure
+    once) over blocks of points.
+
+    Between blocks, it keeps the last point it returned (the known point
+    before any open run of noise) and the points from the start of the
+    earliest open run that could still be filled in.
+    """
+
+    def __init__(self, denoiser, measures, time_measures=('time', 'duration')):
+        super(DenoiseStream, self).__init__()
+        self.denoiser = denoiser
+        self.width = len(measures)
+        self.cols = denoiser._gap_columns(
+            measure_template(measures, time_measures))
+        self.__reset()
+
+    def __reset(self):
+        # Our held-back points and their gaps, found before any filling
+        # in. If __has_last, __held[0] is the last point we returned.
+        self.__held = None
+        self.__held_gaps = None
+        self.__has_last = False
+
+    def push(self, points):
+        points = np.array(points)
+        gaps = self.denoiser._gaps(points[:,self.cols])
+        if self.__held is not None:
+            points = np.vstack((self.__held, points))
+            gaps = np.vstack((self.__held_gaps, gaps))
+        if len(points) == 0:
+            return points
+        # Runs at the start are either the start of the data, or the rest
+        # of a run too long to fill in -- leave them alone either way.
+        self.denoiser._interp_columns(points, self.cols, gaps, wrap=False)
+        keep = self.__open_run_start(gaps)
+        out = points[int(self.__has_last):keep]
+        self.__held = points[keep-1:].copy()
+        self.__held_gaps = gaps[keep-1:]
+        self.__has_last = True
+        return out
+
+    def finish(self):
+        """ Return the held-back points; runs open at the end stay put """
+        if self.__held is None:
+            return np.zeros((0, self.width))
+        out = self.__held[int(self.__has_last):]
+        self.__reset()
+        return out
+
+    def __open_run_start(self, gaps):
+        """
+        Return the index of the first point of the earliest run still open
+        at the end of gaps that might be filled in, or len(gaps) if there
+        isn't one.
+        """
+        n = len(gaps)
+        good = ~gaps
+        last_good = n - 1 - np.argmax(good[::-1], axis=0)
+        starts = np.where(np.any(good, axis=0), last_good + 1, 0)
+        open_runs = ((starts > 0) & (starts < n) &
+            (n - starts <= self.denoiser.max_noise_samples))
+        if not np.any(open_runs):
+            return n
+        return starts[open_runs].min()
+
+
+class _BlinkCandidate(object):
+    """ A run of zeroes that may turn out to be a blink """
+    __slots__ = ('start', 'end', 'new_start', 'new_end', 'start_time',
+        'passed')
+
+    def __init__(self, start, new_start):
+        self.start = start
+        self.new_start = new_start
+        self.end = None
+        self.new_end = None
+        self.start_time = None
+        self.passed = None
+
+
+class DeblinkStream(object):
+    """
+    Runs a Deblink over blocks of points.
+
+    Between blocks, it keeps the y value and index of the last point and of
+    the last point under start_dy_threshold; the blink candidates it hasn't
+    decided about yet; the blinks still covering points it's holding back;
+    and the last good point, to copy into them.
+
+    A candidate is decided once the point after its expanded end turns up,
+    or once it's gone on too long to be kept. A point is held back until
+    no undecided or future candidate can cover it -- no later than
+    max_duration after it, and usually straight away.
+    """
+
+    def __init__(self, deblinker, measures, time_measures=('time', 'duration')):
+        super(DeblinkStream, self).__init__()
+        self.deblinker = deblinker
+        self.width = len(measures)
+        template = measure_template(measures, time_measures)
+        self.x_i, self.y_i = template.measure_indexes(('x', 'y'))
+        self.t_i = template.measure_index('time')
+        self.cols = template.measure_indexes(template.interpolable_measures)
+        self.__reset()
+
+    def __reset(self):
+        self.__seen = 0
+        self.__last_y = None
+        self.__last_below_start = -1
+        self.__open = None
+        self.__in_run = False
+        self.__pending = []
+        self.__blinks = []
+        self.__last_start_time = None
+        self.__source = None
+        # Points from __buf_start on; those from __held_start on haven't
+        # been returned yet. The one before that, if any, is kept for its
+        # time.
+        self.__buf = None
+        self.__buf_start = 0
+        self.__held_start = 0
+
+    def push(self, points):
+        points = np.array(points)
+        if len(points) == 0:
+            return points
+        base = self.__seen
+        if self.__buf is None:
+            self.__buf = points
+        else:
+            self.__buf = np.vstack((self.__buf, points))
+        self.__seen += len(points)
+        self.__find_candidates(points, base)
+        self.__decide_by_time()
+        self.__settle_pending()
+        return self.__release(self.__safe_end())
+
+    def finish(self):
+        """
+        Return the held-back points, with any blinks filled in. Candidates
+        still undecided never found their end, so aren't blinks.
+        """
+        if self.__buf is None:
+            return np.zeros((0, self.width))
+        for cand in self.__pending:
+            if cand.passed is None:
+                cand.passed = False
+        self.__settle_pending()
+        out = self.__release(self.__seen)
+        self.__reset()
+        return out
+
+    def __time(self, i):
+        return self.__buf[i - self.__buf_start, self.t_i]
+
+    def __find_candidates(self, points, base):
+        dbl = self.deblinker
+        x, y = points[:,self.x_i], points[:,self.y_i]
+        # The same dy Deblink._candidate_indexes() finds, a block at a time
+        dy = np.empty(len(y))
+        if self.__last_y is None:
+            dy[0] = np.inf
+        else:
+            dy[0] = y[0] - self.__last_y
+        dy[1:] = np.diff(y)
+        self.__last_y = y[-1]
+        dy_a = np.abs(dy)
+        nonzero_ys = y <> 0
+        below_start = np.flatnonzero(
+            (dy_a <= dbl.start_dy_threshold) & nonzero_ys) + base
+        below_end = np.flatnonzero(
+            (dy_a <= dbl.end_dy_threshold) & nonzero_ys) + base
+
+        zeroed = (x == 0) & (y == 0)
+        edges = np.diff(np.hstack((int(self.__in_run), zeroed, 0)))
+        starts = np.flatnonzero(edges > 0) + base
+        ends = list(np.flatnonzero(edges < 0) - 1 + base)
+        runs = []
+        if self.__in_run:
+            runs.append(self.__open)
+        for start in starts:
+            pre_idx_idx = np.searchsorted(below_start, start, 'left') - 1
+            if pre_idx_idx >= 0:
+                pre = below_start[pre_idx_idx]
+            else:
+                pre = self.__last_below_start
+            cand = None
+            # A candidate expanding back over points already returned
+            # would be too long, as they were only returned once too much
+            # time had passed since them.
+            if pre >= 0 and pre + 1 >= self.__held_start:
+                cand = _BlinkCandidate(start, pre + 1)
+                self.__pending.append(cand)
+            runs.append(cand)
+        if len(below_start) > 0:
+            self.__last_below_start = below_start[-1]
+
+        self.__in_run = bool(zeroed[-1])
+        self.__open = None
+        if self.__in_run:
+            self.__open = runs.pop()
+        for cand, end in zip(runs, ends):
+            if cand is not None:
+                cand.end = end
+
+        for cand in self.__pending:
+            if cand.end is None or cand.passed is not None:
+                continue
+            post_idx_idx = np.searchsorted(below_end, cand.end, 'right')
+            if post_idx_idx < len(below_end):
+                cand.new_end = below_end[post_idx_idx] - 2
+                cand.start_time = self.__time(cand.new_start)
+                duration = self.__time(cand.new_end) - cand.start_time
+                cand.passed = (duration >= dbl.min_duration and
+                    duration <= dbl.max_duration)
+
+    def __decide_by_time(self):
+        # An undecided candidate's new_end will be at least the point
+        # before our last one.
+        if self.__seen < 2:
+            return
+        end_time = self.__time(self.__seen - 2)
+        for cand in self.__pending:
+            if cand.passed is None and (end_time - self.__time(
+                    cand.new_start) > self.deblinker.max_duration):
+                cand.passed = False
+
+    def __settle_pending(self):
+        """ Keep the decided candidates, in order, as Deblink would """
+        while self.__pending and self.__pending[0].passed is not None:
+            cand = self.__pending.pop(0)
+            if not cand.passed:
+                continue
+            if cand.start_time != self.__last_start_time:
+                self.__blinks.append((cand.new_start, cand.new_end))
+            self.__last_start_time = cand.start_time
+
+    def __safe_end(self):
+        """
+        Return the index of the first point a blink we don't know about yet
+        might cover.
+        """
+        held_times = self.__buf[self.__held_start - self.__buf_start:,
+            self.t_i]
+        last_time = held_times[-1]
+        # Future candidates expand back to after our last point under
+        # start_dy_threshold at the earliest, and can't reach further back
+        # than max_duration before our last point.
+        safe = max(self.__last_below_start + 1, self.__held_start +
+            np.searchsorted(held_times,
+                last_time - self.deblinker.max_duration, 'left'))
+        if self.__pending:
+            safe = min(safe, self.__pending[0].new_start)
+        return max(self.__held_start, min(safe, self.__seen))
+
+    def __release(self, end):
+        """ Fill in and return the points up to end """
+        start = self.__held_start
+        offset = start - self.__buf_start
+        out = self.__buf[offset:offset + end - start]
+        edges = np.zeros(len(out) + 1, dtype=int)
+        for blink_start, blink_end in self.__blinks:
+            # As in Deblink, blinks starting at the first point are skipped.
+            if blink_start > 0 and blink_end >= blink_start:
+                lo = max(blink_start, start)
+                hi = min(blink_end, end - 1)
+                if lo <= hi:
+                    edges[lo - start] += 1
+                    edges[hi - start + 1] -= 1
+        in_blink = np.cumsum(edges[:-1]) > 0
+        if np.any(in_blink):
+            sources = np.maximum.accumulate(
+                np.where(in_blink, -1, np.arange(len(out))))
+            rows = np.flatnonzero(in_blink & (sources >= 0))
+            out[np.ix_(rows, self.cols)] = out[np.ix_(sources[rows], self.cols)]
+            before = np.flatnonzero(in_blink & (sources < 0))
+            out[np.ix_(before, self.cols)] = self.__source
+        good = np.flatnonzero(~in_blink)
+        if len(good) > 0:
+            self.__source = out[good[-1], self.cols].copy()
+        self.__blinks = [b for b in self.__blinks if b[1] >= end]
+
+        self.__held_start = end
+        self.__buf_start = max(end - 1, 0)
+        self.__buf = self.__buf[self.__buf_start - start + offset:].copy()
+        return out
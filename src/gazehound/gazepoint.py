@@ -7,14 +7,23 @@
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
 import copy
+import csv
+import itertools
+import warnings
 import numpy as np
 
 
 class Point(object):
     """
     A point with x, y, and time coordinates -- one point in a scan path
+
+    Points (and their subclasses here) keep their attributes in __slots__,
+    not a __dict__, to save memory. A PointFactory asked for attributes a
+    class has no slots for makes points of a subclass with a __dict__.
     """
 
+    __slots__ = ('x', 'y', 'time', 'duration')
+
     interp_attrs = ('x', 'y')
 
     def __init__(self, x=None, y=None, time=None, duration=1.0):
@@ -57,7 +66,71 @@ class Point(object):
             setattr(self, attr, val)
 
     def interpolate_from(self, f):
-        self.merge_dict(f.interp_dict)
+        # Same as self.merge_dict(f.interp_dict), without the dict.
+        for attr in type(f).interp_attrs:
+            setattr(self, attr, getattr(f, attr))
+
+    @classmethod
+    def slot_names(cls):
+        """ Every attribute in the __slots__ of cls and its parents """
+        if cls not in _slot_names:
+            names = []
+            for klass in reversed(cls.__mro__):
+                names.extend(klass.__dict__.get('__slots__', ()))
+            _slot_names[cls] = tuple(names)
+        return _slot_names[cls]
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name))
+            for name in self.slot_names() if hasattr(self, name))
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for name, val in state.items():
+            setattr(self, name, val)
+
+    def __copy__(self):
+        # Much faster than copy's generic way of copying slots.
+        dup = object.__new__(type(self))
+        for name in self.slot_names():
+            try:
+                setattr(dup, name, getattr(self, name))
+            except AttributeError:
+                pass
+        if hasattr(self, '__dict__'):
+            dup.__dict__.update(self.__dict__)
+        return dup
+
+    def __deepcopy__(self, memo):
+        # Points only hold numbers and strings.
+        return self.__copy__()
+
+    @classmethod
+    def from_columns(cls, names, columns):
+        """
+        Return a list of points, one per row of columns -- a sequence with
+        a column (a sequence or array) for each attribute in names. The
+        points are filled a column at a time, straight into their slots;
+        attributes not in names get their __init__ defaults.
+        """
+        columns = [np.asarray(col).tolist() if isinstance(col, np.ndarray)
+            else col for col in columns]
+        n = len(columns[0]) if columns else 0
+        if not all('__slots__' in k.__dict__ for k in cls.__mro__[:-1]):
+            # Instances have a __dict__, and __init__ may fill it.
+            points = [cls() for i in xrange(n)]
+        else:
+            new = object.__new__
+            points = [new(cls) for i in xrange(n)]
+            template = cls()
+            for name in cls.slot_names():
+                if name not in names and hasattr(template, name):
+                    map(_setter(cls, name), points,
+                        itertools.repeat(getattr(template, name), n))
+        for name, col in zip(names, columns):
+            map(_setter(cls, name), points, col)
+        return points
 
     def __repr__(self):
         return (
@@ -68,6 +141,9 @@ class Point(object):
 class IViewPoint(Point):
     """ A point from the iView system. """
 
+    __slots__ = ('set', 'pupil_h', 'pupil_v', 'corneal_reflex_h',
+        'corneal_reflex_v', 'diam_h', 'diam_v')
+
     # All of the continuous measures that can be interpolated
     interp_attrs = (
         'x', 'y', 'pupil_h', 'pupil_v', 'corneal_reflex_h', 'corneal_reflex_v',
@@ -85,6 +161,41 @@ class IViewPoint(Point):
         self.diam_v = diam_v
 
 
+class FixationPoint(Point):
+    """ A fixation, as listed in an iView fixation file. """
+
+    __slots__ = ('start_num', 'end_num', 'end_time', 'object')
+
+
+_slot_names = {}
+_dict_classes = {}
+
+def _with_dict(cls):
+    """
+    Return a subclass of the slotted Point class cls whose instances also
+    have a __dict__, for attributes cls has no slots for.
+    """
+    if cls not in _dict_classes:
+        _dict_classes[cls] = type(cls.__name__, (cls,), {
+            '__module__': cls.__module__,
+            '__reduce__': lambda self: (
+                _new_with_dict, (cls,), self.__getstate__())})
+    return _dict_classes[cls]
+
+def _new_with_dict(cls):
+    return object.__new__(_with_dict(cls))
+
+def _setter(cls, name):
+    """
+    Return a function that sets attribute name of a cls instance: the
+    slot's own __set__ if there is one, setattr() otherwise.
+    """
+    descriptor = getattr(cls, name, None)
+    if hasattr(descriptor, '__set__'):
+        return descriptor.__set__
+    return lambda obj, val: setattr(obj, name, val)
+
+
 class Scanpath(object):
     """ A set of Points arranged sequentially in time """
     uniformely_sampled = False # Subclass to make this true.
@@ -132,8 +243,13 @@ class Scanpath(object):
     def total_duration(self):
         return sum((p.duration for p in self.points))
 
+    def time_midpoints(self):
+        """ Return an array of every point's time_midpoint(). """
+        return np.array([p.time_midpoint() for p in self.points])
+
     def recenter_by(self, x, y):
-        points = copy.deepcopy(self.points)
+        # Points only hold numbers, so shallow copies are as good as deep.
+        points = [copy.copy(point) for point in self.points]
         for point in points:
             point.x += x
             point.y += y
@@ -144,7 +260,8 @@ class Scanpath(object):
         min_y_const = (0,0),
         max_x_const = (1000,1000),
         max_y_const = (1000,1000)):
-        plist = copy.deepcopy(self)
+        plist = copy.copy(self)
+        plist.points = [copy.copy(p) for p in self.points]
         for p in plist:
             if p.x < min_x_const[0]: p.x = min_x_const[1]
             if p.x > max_x_const[0]: p.x = max_x_const[1]
@@ -153,8 +270,12 @@ class Scanpath(object):
         return plist
 
     def points_within(self, shape):
-        plist = copy.deepcopy(self.points)
-        return Scanpath(points=[p for p in plist if (p.x, p.y) in shape])
+        if len(self.points) == 0 or not hasattr(shape, 'contains_many'):
+            return Scanpath(points=[
+                copy.copy(p) for p in self.points if (p.x, p.y) in shape])
+        inside = shape.contains_many(self.as_array(('x', 'y'), dtype=float))
+        return Scanpath(points=[
+            copy.copy(p) for p, p_in in zip(self.points, inside) if p_in])
 
     def as_array(self,
             measures=None,
@@ -179,6 +300,14 @@ class Scanpath(object):
 
 
 class UniformelySampledScanpath(Scanpath):
+    """
+    A scanpath whose points are rows of an ndarray, one column per measure.
+
+    recenter_by() and constrain_to() return a scanpath with its own copy of
+    the points -- one copy of the array, not a deepcopy of the whole
+    scanpath -- so neither ever sees changes made to the other. Slices, on
+    the other hand, are views.
+    """
     uniformely_sampled = True
 
     def __init__(self, samples_per_second, points, measures, headers={}):
@@ -188,7 +317,37 @@ class UniformelySampledScanpath(Scanpath):
         self.measures = measures
         self.headers = headers
         self.time_measures = ('time', 'duration')
-    
+
+    def _copied(self):
+        """ Return a shallow copy of this scanpath with its own points """
+        sc = copy.copy(self)
+        sc.points = np.array(self.points)
+        return sc
+
+    @classmethod
+    def from_memmap(cls, filename, samples_per_second, measures, headers={},
+        mode='r+'):
+        """
+        Build a scanpath whose points are memory-mapped from the .npy file
+        filename, such as one written by to_memmap(). mode is as for
+        np.load's mmap_mode; 'c' allows changes that aren't saved.
+        """
+        points = np.load(filename, mmap_mode=mode)
+        return cls(samples_per_second, points, measures, headers)
+
+    def to_memmap(self, filename):
+        """
+        Return a copy of this scanpath with its points written to the .npy
+        file filename and memory-mapped from there instead of held in RAM.
+        Slices of the copy are views on the same file.
+        """
+        sc = copy.copy(self)
+        sc.points = np.lib.format.open_memmap(filename, mode='w+',
+            dtype=self.points.dtype, shape=self.points.shape)
+        sc.points[:] = self.points
+        sc.points.flush()
+        return sc
+
     def as_array(self, measures=None):
         if measures is None:
             measures = self.measures
@@ -224,9 +383,10 @@ class UniformelySampledScanpath(Scanpath):
             to_pt[i] = from_pt[i]
 
     def recenter_by(self, x, y):
-        out = copy.deepcopy(self)
-        indexes = self.measure_indexes(('x', 'y'))
-        out.points[:,[indexes]] += [x,y]
+        out = self._copied()
+        x_i, y_i = self.measure_indexes(('x', 'y'))
+        out.points[:,x_i] += x
+        out.points[:,y_i] += y
         return out
 
     def constrain_to(self,
@@ -235,7 +395,7 @@ class UniformelySampledScanpath(Scanpath):
         max_x_const = (1000,1000),
         max_y_const = (1000,1000)):
         
-        out = copy.deepcopy(self)
+        out = self._copied()
         x_i = self.measure_index('x')
         y_i = self.measure_index('y')
         ar = out.points
@@ -247,18 +407,27 @@ class UniformelySampledScanpath(Scanpath):
 
 
     def points_matching(self, fx, measures=('x', 'y')):
+        """
+        Return a scanpath of the points for which fx(point) is true, where
+        point holds the values of measures. If fx has a contains_many()
+        method (as Shapes do), that's called once with the whole array
+        instead.
+        """
         sc = copy.copy(self)
         p_arr = self.as_array(measures)
-        matches = self.points[np.apply_along_axis(fx, 1, p_arr)]
-        sc.points = matches
+        if hasattr(fx, 'contains_many'):
+            mask = fx.contains_many(p_arr)
+        else:
+            mask = np.apply_along_axis(fx, 1, p_arr)
+        sc.points = self.points[mask]
         return sc
 
     def points_within(self, shape):
         sc = copy.copy(self)
-        def in_fx(p):
-            return p in shape
-        if shape is not None:
-            sc = self.points_matching(in_fx, ('x', 'y'))
+        if shape is not None and not hasattr(shape, 'contains_many'):
+            sc = self.points_matching(lambda p: p in shape, ('x', 'y'))
+        elif shape is not None:
+            sc = self.points_matching(shape, ('x', 'y'))
         return sc
 
 class IViewScanpath(UniformelySampledScanpath):
@@ -280,12 +449,173 @@ class IView3Scanpath(IViewScanpath):
 
     def correct_times(self):
         # Frustratingly, times are in microseconds since epoch in v3
+        if len(self.points) == 0:
+            return
         timestamp_i = self.measures.index('timestamp')
         time_i = self.measures.index('time')
-        self.points[:][time_i] = (
-            self.points[:][timestamp_i] - self.points[:][timestamp_i][0])/1000
+        self.points[:,time_i] = (
+            self.points[:,timestamp_i] - self.points[0,timestamp_i])/1000
     
 
+class FixationTable(Scanpath):
+    """
+    Fixations stored as a structured array, one record per fixation, with
+    the fields in DTYPE. Object names are interned: the object field holds
+    an index into object_names.
+
+    Iterating or indexing with an int gives Points made on the fly;
+    slicing, time queries, recenter_by(), constrain_to() and
+    points_within() work on the whole array and return FixationTables.
+    """
+
+    DTYPE = np.dtype([
+        ('start_num', np.int32),
+        ('end_num', np.int32),
+        ('time', np.int64),
+        ('end_time', np.int64),
+        ('x', np.float64),
+        ('y', np.float64),
+        ('duration', np.int64),
+        ('object', np.int32)])
+
+    def __init__(self, points=None, headers={}, object_names=None):
+        self.object_names = list(object_names or [])
+        if points is None:
+            points = np.zeros(0, dtype=self.DTYPE)
+        super(FixationTable, self).__init__(points, headers)
+
+    @classmethod
+    def from_points(cls, points, headers={}):
+        """ Make a FixationTable from a list of Point-like objects. """
+        names = []
+        codes = {}
+        table = np.zeros(len(points), dtype=cls.DTYPE)
+        for field in cls.DTYPE.names:
+            if field == 'object':
+                continue
+            table[field] = [getattr(p, field, 0) for p in points]
+        for i, p in enumerate(points):
+            name = getattr(p, 'object', '')
+            if name not in codes:
+                codes[name] = len(names)
+                names.append(name)
+            table['object'][i] = codes[name]
+        return cls(table, headers, names)
+
+    def _get_points(self):
+        return self._points
+
+    def _set_points(self, points):
+        # Things that build lists of points (say, Combiner for fixations
+        # out of time order) still work; we just convert them.
+        if not isinstance(points, np.ndarray):
+            other = FixationTable.from_points(list(points))
+            points = self._recoded(other)
+        self._points = points.view(np.recarray)
+
+    points = property(_get_points, _set_points)
+
+    def _recoded(self, other):
+        """ Return other's records, with object codes from our names. """
+        # Copies share our names list; don't add to theirs.
+        self.object_names = list(self.object_names)
+        table = np.array(other.points)
+        for code, name in enumerate(other.object_names):
+            if name not in self.object_names:
+                self.object_names.append(name)
+            table['object'][other.points.object == code] = (
+                self.object_names.index(name))
+        return table
+
+    def _subset(self, points):
+        sc = copy.copy(self)
+        sc.points = points
+        return sc
+
+    def __len__(self):
+        return len(self._points)
+
+    def __iter__(self):
+        return iter(self.fixation_points())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._subset(self._points[i])
+        return self._subset(self._points[i:i+1 or None]).fixation_points()[0]
+
+    def fixation_points(self):
+        """ Return a list of FixationPoints, one per fixation """
+        names = [n for n in self.DTYPE.names if n <> 'object']
+        objects = [self.object_names[code] for code in self._points.object]
+        return FixationPoint.from_columns(names + ['object'],
+            [self._points[n] for n in names] + [objects])
+
+    def __getslice__(self, i, j):
+        return self[slice(i, j)]
+
+    def extend(self, sp):
+        if not isinstance(sp, FixationTable):
+            sp = FixationTable.from_points(list(sp))
+        self.points = np.concatenate((self._points, self._recoded(sp)))
+
+    def valid_points(self, criterion):
+        return self._subset(self._points[
+            np.array([bool(criterion(p)) for p in self], dtype=bool)])
+
+    @property
+    def total_duration(self):
+        return self._points.duration.sum().item()
+
+    def time_midpoints(self):
+        return self._points.time + (self._points.duration / 2)
+
+    def recenter_by(self, x, y):
+        points = np.array(self._points)
+        points['x'] += x
+        points['y'] += y
+        return self._subset(points)
+
+    def constrain_to(self,
+        min_x_const = (0,0),
+        min_y_const = (0,0),
+        max_x_const = (1000,1000),
+        max_y_const = (1000,1000)):
+        points = np.array(self._points)
+        for field, (lo, lo_val), (hi, hi_val) in (
+                ('x', min_x_const, max_x_const),
+                ('y', min_y_const, max_y_const)):
+            vals = points[field]
+            points[field] = np.where(vals < lo, lo_val,
+                np.where(vals > hi, hi_val, vals))
+        return self._subset(points)
+
+    def points_within(self, shape):
+        if shape is None:
+            return self._subset(self._points)
+        xy = self.as_array(('x', 'y'), dtype=float)
+        if hasattr(shape, 'contains_many') and len(self) > 0:
+            inside = shape.contains_many(xy)
+        else:
+            inside = np.array([tuple(p) in shape for p in xy], dtype=bool)
+        return self._subset(self._points[inside])
+
+    def as_array(self, measures=None, dtype=np.float32):
+        if measures is None: measures = self.measures
+        out = np.empty((len(self), len(measures)), dtype=dtype)
+        for i, m in enumerate(measures):
+            out[:,i] = self._points[m]
+        return out
+
+    def time_index(self, time):
+        times = self._points.time
+        if len(times) == 0 or time < times[0]:
+            return len(times)
+        i = np.searchsorted(times, time, 'right')
+        if i == len(times):
+            return len(times)
+        return int(i) - 1
+
+
 class PointFactory(object):
     """ Maps a list of gaze point data to a list of Points """
 
@@ -308,9 +638,17 @@ class PointFactory(object):
         component_list.
         """
 
+        klass = self._point_class(attribute_list)
+        try:
+            return self._bulk_from_component_list(
+                components, attribute_list, klass)
+        except (ValueError, IndexError, AttributeError):
+            # The point-by-point loop below says which point was the problem.
+            pass
+
         points = []
         for point_data in components:
-            point = self.type_to_produce()
+            point = klass()
 
             try:
                 for i in range(len(attribute_list)):
@@ -330,6 +668,46 @@ class PointFactory(object):
             points.append(point)
         return points
 
+    def _point_class(self, attribute_list):
+        """
+        Return type_to_produce, or a subclass of it with a __dict__ if it's
+        a slotted Point without slots for some of attribute_list.
+        """
+        klass = self.type_to_produce
+        if not hasattr(klass, 'slot_names'):
+            return klass
+        if not all('__slots__' in k.__dict__ for k in klass.__mro__[:-1]):
+            return klass
+        slots = klass.slot_names()
+        if all(name in slots for name, kind in attribute_list
+                if kind is not None):
+            return klass
+        return _with_dict(klass)
+
+    def _bulk_from_component_list(self, components, attribute_list, klass):
+        """
+        from_component_list, converting a column at a time and filling the
+        points with Point.from_columns(). Raises the same kinds of errors,
+        with less helpful messages.
+        """
+        components = list(components)
+        # zip() stops at the shortest row; the loop would have raised.
+        all_columns = zip(*components)
+        if components and len(all_columns) < len(attribute_list):
+            raise IndexError("Not enough components")
+        names = []
+        columns = []
+        for (attr_name, attr_type), col in zip(attribute_list, all_columns):
+            if attr_type is not None:
+                names.append(attr_name)
+                columns.append(map(attr_type, col))
+        if hasattr(klass, 'from_columns'):
+            return klass.from_columns(names, columns)
+        points = [klass() for c in components]
+        for name, col in zip(names, columns):
+            map(lambda p, v: setattr(p, name, v), points, col)
+        return points
+
 
 class IView2PointFactory(PointFactory):
     """
@@ -352,12 +730,23 @@ class IView2PointFactory(PointFactory):
             ('diam_v', int)]
 
     def from_component_list(self, components):
-        indexes_to_extract = [
-            i for i in range(len(self.data_map)) if self.data_map[i][1] == int]
         return np.array([
-                [line[i] for i in indexes_to_extract]
+                [line[i] for i in self.numeric_indexes]
             for line in components], dtype=float
         )
+
+    def from_delimited_lines(self, lines, delimiter="\t"):
+        """
+        Like from_component_list, but takes the unparsed lines themselves
+        and converts whole columns at once.
+        """
+        return from_delimited_lines(
+            lines, self.numeric_indexes, delimiter, self.from_component_list)
+
+    @property
+    def numeric_indexes(self):
+        return [
+            i for i in range(len(self.data_map)) if self.data_map[i][1] == int]
     
     @property
     def numeric_measures(self):
@@ -385,6 +774,15 @@ class IView3PointFactory(PointFactory):
                 [float(line[i]) for i in  indexes]
             for line in components], dtype=float
         )
+
+    def from_delimited_lines(self, lines, delimiter="\t"):
+        """
+        Like from_component_list, but takes the unparsed lines themselves
+        and converts whole columns at once.
+        """
+        indexes = [p[0] for p in self.measure_map.values()]
+        return from_delimited_lines(
+            lines, indexes, delimiter, self.from_component_list)
     
     @property
     def numeric_measures(self):
@@ -397,7 +795,7 @@ class IViewFixationFactory(PointFactory):
     Maps a list of fixations into a list of Points.
     """
 
-    def __init__(self, type_to_produce=Point):
+    def __init__(self, type_to_produce=FixationPoint):
         super(IViewFixationFactory, self).__init__(type_to_produce)
         self.data_map = [
             ('start_num', int),
@@ -412,3 +810,69 @@ class IViewFixationFactory(PointFactory):
     def from_component_list(self, components):
         return super(IViewFixationFactory, self).from_component_list(
             components, self.data_map)
+
+    def table_from_component_list(self, components):
+        """
+        Like from_component_list, but returns a FixationTable, converting
+        each column at once instead of setting attributes one fixation at
+        a time.
+        """
+        rows = [c[:len(self.data_map)] for c in components]
+        table = np.zeros(len(rows), dtype=FixationTable.DTYPE)
+        names = []
+        if len(rows) > 0:
+            try:
+                cols = np.array(rows, dtype=str)
+                if cols.ndim <> 2 or cols.shape[1] <> len(self.data_map):
+                    raise ValueError("Ragged fixation rows")
+                for i, (name, kind) in enumerate(self.data_map):
+                    if name == 'object':
+                        names, codes = np.unique(cols[:,i], return_inverse=True)
+                        table['object'] = codes
+                    elif kind is not None:
+                        table[name] = cols[:,i].astype(kind)
+            except ValueError:
+                # Let the old parser raise its usual, more helpful errors.
+                return FixationTable.from_points(
+                    self.from_component_list(rows))
+        return FixationTable(table, object_names=list(names))
+
+
+def from_delimited_lines(lines, indexes, delimiter, fallback):
+    """
+    Convert the columns numbered in indexes of a list of delimited lines
+    into an (n, len(indexes)) float array. If the lines don't all have the
+    same number of fields, they're split with the csv module and handed to
+    fallback() instead, so errors look like they always have.
+    """
+    if len(lines) == 0:
+        return fallback([])
+    text = "\n".join(lines)
+    field_count = lines[0].count(delimiter) + 1
+    if not _uniform_field_counts(text, len(lines), field_count, delimiter):
+        return fallback(csv.reader(lines, delimiter=delimiter))
+
+    # When every field is a number, numpy can parse the whole block at once.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        values = np.fromstring(text, dtype=float, sep=delimiter)
+    if len(values) == len(lines) * field_count:
+        return values.reshape(len(lines), field_count)[:, indexes]
+
+    # Otherwise, convert only the columns we want.
+    fields = text.replace("\n", delimiter).split(delimiter)
+    out = np.empty((len(lines), len(indexes)), dtype=float)
+    for out_i, field_i in enumerate(indexes):
+        out[:, out_i] = np.array(fields[field_i::field_count], dtype=float)
+    return out
+
+
+def _uniform_field_counts(text, line_count, field_count, delimiter):
+    """ True if every line in text has field_count fields. """
+    chars = np.frombuffer(text, dtype='S1')
+    delims = np.flatnonzero(chars == delimiter)
+    if len(delims) != line_count * (field_count - 1):
+        return False
+    line_ends = np.append(np.flatnonzero(chars == "\n"), len(chars))
+    per_line = np.diff(np.hstack((0, np.searchsorted(delims, line_ends))))
+    return np.all(per_line == field_count - 1)
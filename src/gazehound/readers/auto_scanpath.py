@@ -12,26 +12,133 @@
 from __future__ import with_statement
 from gazehound.readers.iview import IView2ScanpathReader, IView3ScanpathReader
 
+# How much of the start of a file sniffers get to look at
+SNIFF_BYTES = 4096
+
+# The readers AutoScanpathReader knows about, in the order they're tried.
+# Each is a (reader_class, sniffer) pair; sniffer takes the first lines of a
+# file and returns True if reader_class can read it. A sniffer of None
+# means the reader gets a full trial parse.
+FORMATS = []
+
+
+def register_format(reader_class, sniffer=None):
+    """
+    Teach AutoScanpathReader about a new file format. reader_class must
+    take filename and file_data keyword arguments and have a scanpath()
+    method.
+    """
+    FORMATS.append((reader_class, sniffer))
+
+
+def sniffer_for(reader_class):
+    for klass, sniffer in FORMATS:
+        if klass is reader_class:
+            return sniffer
+    return None
+
+
+register_format(IView2ScanpathReader, IView2ScanpathReader.sniff)
+register_format(IView3ScanpathReader, IView3ScanpathReader.sniff)
+
+
+def read_header(filename):
+    """
+    Return the header dict of a scanpath file of any registered format --
+    sample rate, subject, calibration area, number of samples and so on --
+    without parsing its data.
+    """
+    return AutoScanpathReader().read_header(filename)
+
+
 class AutoScanpathReader(object):
     
-    def __init__(self, try_order=[
-        IView2ScanpathReader,
-        IView3ScanpathReader
-    ]):
+    def __init__(self, try_order=None, cache=None):
+        """
+        try_order defaults to every registered format. cache, if given, is
+        a ScanpathCache; files read by name are then loaded from (and saved
+        to) its sidecars.
+        """
+        if try_order is None:
+            try_order = [klass for klass, sniffer in FORMATS]
         self.try_order = try_order
+        self.cache = cache
         self.failures = []
         self.success_class = None
     
     def read_scanpath(self, filename=None, file_data=None):
-        for klass in self.try_order:
+        use_cache = (self.cache is not None and file_data is None and
+            filename is not None)
+        if use_cache:
+            pp, meta = self.cache.load_entry(filename)
+            if pp is not None:
+                self.success_class = meta['reader_class']
+                return pp
+
+        for klass in self.candidate_classes(filename, file_data):
             reader = klass(filename=filename, file_data=file_data)
             try:
                 pp = reader.scanpath()
                 if pp is not None:
                     self.success_class = klass
+                    if use_cache:
+                        self.cache.store(filename, pp, klass)
                     return pp
             except Exception, exc:
                 self.failures.append((klass, exc))
-        
-    
-    
\ No newline at end of file
+
+    def read_header(self, filename):
+        """
+        Return the header of filename, as read by the first class that
+        sniffs it out, without reading the data body. None if no class can.
+        """
+        # Header parsing is too forgiving to be a trial of the format, so
+        # only sniffed-out classes are tried.
+        for klass in self.candidate_classes(filename, fallback=False):
+            try:
+                header = klass.read_header(filename)
+                self.success_class = klass
+                return header
+            except Exception, exc:
+                self.failures.append((klass, exc))
+
+    def candidate_classes(self, filename=None, file_data=None, fallback=True):
+        """
+        Return the classes in try_order whose sniffers accept the start of
+        the file, recording the ones that don't in self.failures. If no
+        sniffer accepts it and fallback is True, return all of try_order,
+        so each gets a full trial parse as before there were sniffers.
+        """
+        head = self.head_lines(filename, file_data)
+        candidates = []
+        rejected = []
+        sniffed = False
+        for klass in self.try_order:
+            sniffer = sniffer_for(klass)
+            if sniffer is None:
+                candidates.append(klass)
+            elif sniffer(head):
+                candidates.append(klass)
+                sniffed = True
+            else:
+                rejected.append(klass)
+        if fallback and not sniffed:
+            return list(self.try_order)
+        for klass in rejected:
+            self.failures.append((klass, ValueError(
+                "Doesn't look like a file for %s" % klass.__name__)))
+        return candidates
+
+    def head_lines(self, filename=None, file_data=None):
+        """ Return roughly the first SNIFF_BYTES of the file, as lines. """
+        if file_data is None:
+            with open(filename, 'rU') as f:
+                return f.read(SNIFF_BYTES).splitlines()
+        head = []
+        total = 0
+        for line in file_data:
+            if total >= SNIFF_BYTES:
+                break
+            head.append(line.rstrip("\r\n"))
+            total += len(line)
+        return head
@@ -0,0 +1,99 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+#
+# This module reads many scanpath or timeline files at once, using a pool
+# of worker processes.
+
+import os.path
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from gazehound.readers.auto_scanpath import AutoScanpathReader
+from gazehound.readers.timeline import TimelineReader
+
+
+def load_many(paths, jobs=None, try_order=None, cache=None):
+    """
+    Read every file in paths with an AutoScanpathReader, jobs files at a
+    time (by default, one per CPU). Returns a list of scanpaths in the same
+    order as paths, with None for files that couldn't be read.
+
+    Workers don't send points back through a pipe: they save them to .npy
+    files (or to cache's sidecars, if a ScanpathCache is given) which are
+    then memory-mapped here.
+    """
+    paths = list(paths)
+    if jobs == 1 or len(paths) < 2:
+        reader = AutoScanpathReader(try_order=try_order, cache=cache)
+        return [reader.read_scanpath(p) for p in paths]
+
+    tmp_dir = tempfile.mkdtemp(prefix='gazehound-')
+    try:
+        tasks = [
+            (p, os.path.join(tmp_dir, "%d.npy" % i), try_order, cache)
+            for i, p in enumerate(paths)]
+        results = _pool_map(_read_scanpath_to_file, tasks, jobs)
+        return [_scanpath_from_result(r, cache) for r in results]
+    finally:
+        # Once mapped, the points outlive their files on POSIX systems.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_timelines(paths, jobs=None):
+    """
+    Read every file in paths with a TimelineReader, jobs files at a time.
+    Returns a list of Timelines in the same order as paths.
+    """
+    paths = list(paths)
+    if jobs == 1 or len(paths) < 2:
+        return [_read_timeline(p) for p in paths]
+    return _pool_map(_read_timeline, paths, jobs)
+
+
+def _pool_map(fx, items, jobs):
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(fx, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _read_timeline(path):
+    return TimelineReader(filename=path).timeline
+
+
+def _read_scanpath_to_file(task):
+    path, points_path, try_order, cache = task
+    sp = AutoScanpathReader(try_order=try_order, cache=cache).read_scanpath(
+        path)
+    if sp is None:
+        return None
+    if cache is not None and cache.load_meta(path) is not None:
+        return ('cache', path)
+    if not sp.uniformely_sampled:
+        return ('pickled', sp)
+    np.save(points_path, np.ascontiguousarray(sp.points))
+    return ('file', type(sp), sp.samples_per_second, sp.measures,
+        sp.headers, points_path)
+
+
+def _scanpath_from_result(result, cache):
+    if result is None:
+        return None
+    kind = result[0]
+    if kind == 'cache':
+        return cache.load(result[1])
+    if kind == 'pickled':
+        return result[1]
+    klass, samples_per_second, measures, headers, points_path = result[1:]
+    points = np.load(points_path, mmap_mode='c')
+    return klass(samples_per_second, points, measures, headers)
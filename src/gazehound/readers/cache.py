@@ -0,0 +1,187 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+#
+# This module keeps parsed scanpaths in binary sidecar files, so reading
+# the same raw file again is a memory-map instead of a parse.
+
+from __future__ import with_statement
+import os
+import os.path
+import hashlib
+import tempfile
+import time
+import cPickle as pickle
+
+import numpy as np
+
+
+class ScanpathCache(object):
+    """
+    Stores uniformely-sampled scanpaths as a pair of sidecar files: a .npy
+    file with the points array, and a pickled .meta file with everything
+    else. Sidecars live next to the raw file unless cache_dir is given.
+
+    A sidecar is used only if the raw file's size matches and either its
+    mtime and inode or its content hash do, so edited files are re-parsed.
+    Files modified within RACY_SECONDS of the sidecar being written are
+    always hashed: a same-size rewrite in the same mtime tick would
+    otherwise look fresh.
+    """
+
+    SUFFIX = '.gazehound'
+    FORMAT_VERSION = 2
+    RACY_SECONDS = 2
+    HASH_BLOCK_SIZE = 1024*1024
+
+    def __init__(self, cache_dir=None):
+        super(ScanpathCache, self).__init__()
+        self.cache_dir = cache_dir
+
+    def read(self, filename, reader_class):
+        """
+        Return the scanpath for filename, from the cache if it's fresh and
+        from reader_class(filename=filename).scanpath() otherwise.
+        """
+        sp = self.load(filename)
+        if sp is None:
+            sp = reader_class(filename=filename).scanpath()
+            self.store(filename, sp, reader_class)
+        return sp
+
+    def load(self, filename):
+        """
+        Return the cached scanpath for filename, or None if there isn't a
+        fresh one. The points array is memory-mapped copy-on-write, so
+        changing it doesn't change the sidecar.
+        """
+        return self.load_entry(filename)[0]
+
+    def load_entry(self, filename):
+        """
+        Return (scanpath, metadata) cached for filename, or (None, None) if
+        there isn't a fresh one.
+        """
+        meta = self.load_meta(filename)
+        if meta is None:
+            return (None, None)
+        points_path, meta_path = self.sidecar_paths(filename)
+        try:
+            points = np.load(points_path, mmap_mode='c')
+        except (IOError, OSError, ValueError):
+            return (None, None)
+        if points.shape != meta['points_shape']:
+            return (None, None)
+        sp = meta['scanpath_class'](
+            meta['samples_per_second'], points, meta['measures'],
+            meta['headers'])
+        return (sp, meta)
+
+    def load_meta(self, filename):
+        """
+        Return the metadata dict cached for filename, or None if there
+        isn't a fresh one.
+        """
+        points_path, meta_path = self.sidecar_paths(filename)
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = pickle.load(f)
+            st = os.stat(filename)
+        except Exception:
+            return None
+        if meta.get('format_version') != self.FORMAT_VERSION:
+            return None
+        if st.st_size != meta['size']:
+            return None
+        racy = meta['written'] - st.st_mtime < self.RACY_SECONDS
+        if (racy or st.st_mtime != meta['mtime'] or
+                st.st_ino != meta['inode']):
+            if self.content_hash(filename) != meta['hash']:
+                return None
+            now = time.time()
+            if now - st.st_mtime < self.RACY_SECONDS:
+                # Still inside the racy window; keep hashing until it ends.
+                return meta
+            # Same contents, settled mtime -- remember that so we don't
+            # rehash.
+            meta['mtime'] = st.st_mtime
+            meta['inode'] = st.st_ino
+            meta['written'] = now
+            try:
+                self._write_atomically(meta_path, lambda f: pickle.dump(
+                    meta, f, pickle.HIGHEST_PROTOCOL))
+            except (IOError, OSError):
+                pass
+        return meta
+
+    def store(self, filename, scanpath, reader_class=None):
+        """
+        Write sidecars for scanpath, parsed from filename. Returns True if
+        the cache was written. Scanpaths that aren't uniformely sampled and
+        unwritable cache locations are skipped quietly.
+        """
+        if scanpath is None or not scanpath.uniformely_sampled:
+            return False
+        points_path, meta_path = self.sidecar_paths(filename)
+        try:
+            written = time.time()
+            st = os.stat(filename)
+            meta = {
+                'format_version': self.FORMAT_VERSION,
+                'size': st.st_size,
+                'mtime': st.st_mtime,
+                'inode': st.st_ino,
+                'written': written,
+                'hash': self.content_hash(filename),
+                'reader_class': reader_class,
+                'scanpath_class': type(scanpath),
+                'samples_per_second': scanpath.samples_per_second,
+                'measures': scanpath.measures,
+                'headers': scanpath.headers,
+                'points_shape': scanpath.points.shape}
+            points = np.ascontiguousarray(scanpath.points)
+            self._write_atomically(points_path, lambda f: np.save(f, points))
+            self._write_atomically(meta_path, lambda f: pickle.dump(
+                meta, f, pickle.HIGHEST_PROTOCOL))
+        except (IOError, OSError, pickle.PicklingError):
+            return False
+        return True
+
+    def sidecar_paths(self, filename):
+        """ Return (points_path, meta_path) for filename's sidecars """
+        if self.cache_dir is None:
+            base = filename + self.SUFFIX
+        else:
+            full = os.path.abspath(filename)
+            base = os.path.join(self.cache_dir, "%s-%s%s" % (
+                os.path.basename(full),
+                hashlib.sha1(full).hexdigest()[:12],
+                self.SUFFIX))
+        return (base + '.npy', base + '.meta')
+
+    def content_hash(self, filename):
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            block = f.read(self.HASH_BLOCK_SIZE)
+            while block:
+                digest.update(block)
+                block = f.read(self.HASH_BLOCK_SIZE)
+        return digest.hexdigest()
+
+    def _write_atomically(self, path, write_fx):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_fx(f)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
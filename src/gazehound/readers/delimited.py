@@ -16,13 +16,20 @@ class DelimitedReader(object):
     Converts files (or other enumerations of strings) into lists of lists.
     Optionally skips leading lines starting with some comment character
     (by defult the #)
+
+    With streaming=True, a filename isn't read up front: the comment block
+    is read when it's first needed, and content is pulled from the open
+    file as it's iterated, either row by row or with blocks(). The file is
+    closed when its content runs out, when a generator over it is closed or
+    dropped part way through, or by close().
     """
 
     STANDARD_DIALECT = {'delimiter': "\t"}
+    DEFAULT_BLOCK_SIZE = 10000
 
     def __init__(self,
         file_data=None, skip_comments=True, comment_char="#",
-        opts_for_parser={}, filename=None, skip_lines=0):
+        opts_for_parser={}, filename=None, skip_lines=0, streaming=False):
         self._comment_lines = []
         self._content_lines = []
         self.parser = None
@@ -33,7 +40,11 @@ class DelimitedReader(object):
         self.opts_for_parser.update(opts_for_parser)
         self.skip_lines = skip_lines
         self.filename = filename
-        if file_data is None and filename is not None:
+        self.streaming = streaming
+        self._line_source = None
+        self._stream_file = None
+        self._pending_line = None
+        if file_data is None and filename is not None and not streaming:
             self.read_file(filename)
 
     def read_file(self, filename, mode = 'rU'):
@@ -45,6 +56,8 @@ class DelimitedReader(object):
             self.file_data = f.readlines()
 
     def __len__(self):
+        if self.streaming:
+            raise TypeError("A streaming reader doesn't know its length")
         self._setup_parser()
         return len(self._content_lines)
 
@@ -55,6 +68,8 @@ class DelimitedReader(object):
 
     @property
     def content_lines(self):
+        if self.streaming:
+            return list(self.lines())
         self._setup_parser()
         return self._content_lines
 
@@ -66,12 +81,102 @@ class DelimitedReader(object):
         self._setup_parser()
         return self.parser.next()
 
+    def lines(self):
+        """
+        Return an iterator over the stripped content lines. In streaming
+        mode, lines are pulled from the open file as they're requested.
+        """
+        if self.streaming:
+            self._read_comment_block()
+            return self._stream_content_lines()
+        self._partition_lines()
+        return iter(self._content_lines)
+
+    def blocks(self, block_size=None):
+        """
+        Yield lists of at most block_size parsed rows. In streaming mode,
+        no more than one block of the file's content is in memory at once.
+        """
+        if block_size is None:
+            block_size = self.DEFAULT_BLOCK_SIZE
+        for line_block in self.line_blocks(block_size):
+            yield list(csv.reader(line_block, **self.opts_for_parser))
+
+    def line_blocks(self, block_size=None):
+        """ Yield lists of at most block_size stripped content lines. """
+        if block_size is None:
+            block_size = self.DEFAULT_BLOCK_SIZE
+        block = []
+        try:
+            for line in self.lines():
+                block.append(line)
+                if len(block) >= block_size:
+                    yield block
+                    block = []
+            if len(block) > 0:
+                yield block
+        finally:
+            self.close()
+
+    def close(self):
+        """ Close the file a streaming reader is reading from, if any. """
+        if self._stream_file is not None:
+            self._stream_file.close()
+            self._stream_file = None
+
     def _setup_parser(self):
+        if self.streaming:
+            self._read_comment_block()
+            if self.parser is None:
+                self.parser = csv.reader(
+                    self._stream_content_lines(), **self.opts_for_parser)
+            return
         self._partition_lines()
         if self.parser is None:
             self.parser = csv.reader(
                 self._content_lines, **self.opts_for_parser)
 
+    def _open_line_source(self):
+        if self.file_data is not None:
+            return iter(self.file_data)
+        self._stream_file = open(self.filename, 'rU')
+        return iter(self._stream_file)
+
+    def _read_comment_block(self):
+        """
+        Read up to (and including) the first content line, collecting the
+        comments on the way. The first content line is held in
+        self._pending_line.
+        """
+        if self._line_source is not None:
+            return
+        self._line_source = self._open_line_source()
+        for i in xrange(self.skip_lines):
+            next(self._line_source, None)
+        for line in self._line_source:
+            stripped = line.strip()
+            if self.skip_comments and stripped.startswith(self.comment_char):
+                self._comment_lines.append(stripped)
+            elif len(stripped) > 0:
+                self._pending_line = stripped
+                break
+
+    def _stream_content_lines(self):
+        try:
+            if self._pending_line is not None:
+                first = self._pending_line
+                self._pending_line = None
+                yield first
+            for line in self._line_source:
+                stripped = line.strip()
+                if (self.skip_comments and
+                        stripped.startswith(self.comment_char)):
+                    continue
+                elif len(stripped) > 0:
+                    yield stripped
+        finally:
+            self.close()
+
     def _partition_lines(self):
         if len(self._content_lines) > 0:
             return
@@ -7,6 +7,7 @@
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
 import re
+import numpy as np
 from gazehound.readers.delimited import DelimitedReader
 from gazehound import gazepoint
 
@@ -15,18 +16,41 @@ class IViewReader(DelimitedReader):
 
     def __init__(self, header_map,
         file_data = None, skip_comments = True, comment_char = "#",
-        opts_for_parser = {}, filename = None):
+        opts_for_parser = {}, filename = None, streaming = False):
 
         super(IViewReader, self).__init__(
-            file_data, skip_comments, comment_char, opts_for_parser, filename)
+            file_data, skip_comments, comment_char, opts_for_parser, filename,
+            streaming=streaming)
         self.header_map = header_map
+        self._header = None
+
+    @classmethod
+    def read_header(cls, filename):
+        """
+        Return the header() of filename, reading only its leading comments.
+        """
+        reader = cls(filename=filename, streaming=True)
+        try:
+            return reader.header()
+        finally:
+            reader.close()
 
     def header_pairs(self):
-        coms = [re.sub(("^%s" % self.comment_char), '', l).strip()
+        prefix_len = len(self.comment_char)
+        coms = [(l[prefix_len:] if l.startswith(self.comment_char) else l)
                 for l in self.comment_lines]
-        return [l.split(":\t", 1) for l in coms]
+        return [l.strip().split(":\t", 1) for l in coms]
 
     def header(self):
+        """
+        Return a dict of the header values named in header_map. It's
+        computed on the first call and copied after that.
+        """
+        if self._header is None:
+            self._header = self._parse_header()
+        return self._header.copy()
+
+    def _parse_header(self):
         header_pairs = self.header_pairs()
 
         header_pairs = [p for p in header_pairs if len(p) == 2]
@@ -55,22 +79,60 @@ class IViewReader(DelimitedReader):
         cleaned_val = converter(raw_val)
         return (cleaned_key, cleaned_val)
 
+    def point_blocks(self, block_size=None):
+        """
+        Yield the points of this file as float arrays of at most block_size
+        rows. With streaming=True, this is the only way to read points
+        without holding them all in memory: scanpath() still builds the
+        whole array, it just skips the copy of the file's lines.
+        """
+        fact = self._point_factory()
+        for block in self.line_blocks(block_size):
+            yield fact.from_delimited_lines(block, self._delimiter)
+
+    def _point_factory(self):
+        raise NotImplementedError(
+            "_point_factory must be overridden by subclass")
+
+    def _read_points(self, fact):
+        # Streaming saves holding the file's lines, not the points array.
+        if not self.streaming:
+            return fact.from_delimited_lines(
+                self.content_lines, self._delimiter)
+        blocks = [fact.from_delimited_lines(b, self._delimiter)
+                    for b in self.line_blocks()]
+        if len(blocks) == 0:
+            return fact.from_component_list([])
+        return np.vstack(blocks)
+
+    @property
+    def _delimiter(self):
+        return self.opts_for_parser['delimiter']
+
 
 class IView2ScanpathReader(IViewReader):
     """A reader for files produced by SMI's iView software"""
 
     def __init__(self,
         file_data=None, skip_comments=True, comment_char="#",
-        opts_for_parser={}, filename=None):
+        opts_for_parser={}, filename=None, streaming=False):
 
         super(IView2ScanpathReader, self).__init__(
             self.__header_map(), file_data, skip_comments,
-            comment_char, opts_for_parser, filename)
+            comment_char, opts_for_parser, filename, streaming)
+
+    @classmethod
+    def sniff(cls, head_lines):
+        """
+        True if head_lines, the first few lines of a file, look like they
+        came from an iView 2 scanpath file.
+        """
+        return any(l.startswith("#FileVersion:") for l in head_lines)
 
     def scanpath(self):
         """Return a list of Points representing the scan path."""
-        fact = gazepoint.IView2PointFactory()
-        points = fact.from_component_list(self)
+        fact = self._point_factory()
+        points = self._read_points(fact)
         return gazepoint.IViewScanpath(
             points=points, measures=fact.numeric_measures,
             samples_per_second=self.header()['sample_rate'],
@@ -94,6 +156,9 @@ class IView2ScanpathReader(IViewReader):
                 lambda x: [int(e) for e in x.split("\t")]),
             'Sample Rate': ('sample_rate', int)}
 
+    def _point_factory(self):
+        return gazepoint.IView2PointFactory()
+
 
 class IView3ScanpathReader(IViewReader):
     # A list of 4-tuples:
@@ -117,16 +182,25 @@ class IView3ScanpathReader(IViewReader):
     
     def __init__(self, file_data=None, skip_comments=True, comment_char="##",
         opts_for_parser={}, filename=None, 
-        column_mapping=standard_column_mapping):
+        column_mapping=standard_column_mapping, streaming=False):
         
         super(IView3ScanpathReader, self).__init__(
             self.__header_map, file_data, skip_comments, comment_char, 
-            opts_for_parser, filename)
+            opts_for_parser, filename, streaming)
         self.column_mapping = column_mapping
+        self._column_headers = None
         
+    @classmethod
+    def sniff(cls, head_lines):
+        """
+        True if head_lines, the first few lines of a file, look like they
+        came from an iView 3 (IDF Converter) scanpath file.
+        """
+        return any(re.match(r"##\s*Version:", l) for l in head_lines)
+
     def scanpath(self):
-        fact = gazepoint.IView3PointFactory(self.measure_mapping)
-        points = fact.from_component_list(self)
+        fact = self._point_factory()
+        points = self._read_points(fact)
         sp = gazepoint.IView3Scanpath(
             points=points, samples_per_second=self.header()['sample_rate'],
             measures=fact.numeric_measures, headers=self.header())
@@ -144,19 +218,44 @@ class IView3ScanpathReader(IViewReader):
         return self._column_headers
     
     def _partition_lines(self):
-        if len(self._content_lines) > 0:
+        if self._column_headers is not None:
             return
         super(IView3ScanpathReader, self)._partition_lines()
-        self._column_header_line = self._content_lines[0]
-        self._column_headers = self._column_header_line.split("\t")
+        header_line = None
+        if len(self._content_lines) > 0:
+            header_line = self._content_lines[0]
+        self._set_column_header_line(header_line)
         self._content_lines = self._content_lines[1:]
+
+    def _read_comment_block(self):
+        if self._line_source is not None:
+            return
+        super(IView3ScanpathReader, self)._read_comment_block()
+        # In streaming mode, the column headers are the first content line
+        self._set_column_header_line(self._pending_line)
+        self._pending_line = None
+
+    def _set_column_header_line(self, line):
+        # A file with only a header has no column header line either
+        self._column_header_line = line
+        self._column_headers = []
+        if line is not None:
+            self._column_headers = line.split("\t")
         self._build_measure_map()
+
+    def _point_factory(self):
+        return gazepoint.IView3PointFactory(self.measure_mapping)
         
         
     def _build_measure_map(self):
+        # Without column headers there are no points to index, but the
+        # scanpath still gets the usual measures.
         self._meas_map = {}
         for measure_name, cols, fx in self.column_mapping:
-            self._meas_map[measure_name] = (self._col_index(cols), fx)
+            index = None
+            if len(self._column_headers) > 0:
+                index = self._col_index(cols)
+            self._meas_map[measure_name] = (index, fx)
     
     def _col_index(self, cols):
         if type(cols) == str:
@@ -193,11 +292,11 @@ class IViewFixationReader(IViewReader):
 
     def __init__(self,
         file_data=None, skip_comments=True, comment_char="#",
-        opts_for_parser={}, filename=None):
+        opts_for_parser={}, filename=None, streaming=False):
 
         super(IViewFixationReader, self).__init__(
             self.__header_map(), file_data, skip_comments,
-            comment_char, opts_for_parser, filename)
+            comment_char, opts_for_parser, filename, streaming)
 
     def __header_map(self):
         # The second parameter is a function, taking one string argument,
@@ -218,7 +317,22 @@ class IViewFixationReader(IViewReader):
             'Maximal Pixel': ('maximal_pixel', int)}
 
     def scanpath(self):
-        """Return a list of Points representing the scan path."""
-        fact = gazepoint.IViewFixationFactory()
-        points = fact.from_component_list(self)
-        return gazepoint.Scanpath(points = points)
\ No newline at end of file
+        """Return a FixationTable of the fixations."""
+        fact = self._point_factory()
+        table = fact.table_from_component_list(self)
+        table.headers = self.header()
+        return table
+
+    def point_blocks(self, block_size=None):
+        """
+        Yield the fixations of this file as FixationTables of at most
+        block_size fixations. Fixations have a string column, so they
+        don't fit in float arrays. As with the other readers, only this
+        bounds memory; scanpath() reads every fixation.
+        """
+        fact = self._point_factory()
+        for rows in self.blocks(block_size):
+            yield fact.table_from_component_list(rows)
+
+    def _point_factory(self):
+        return gazepoint.IViewFixationFactory()
\ No newline at end of file
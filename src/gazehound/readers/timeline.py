@@ -15,11 +15,13 @@ class TimelineReader(DelimitedReader):
     timelines from them.
     """
 
-    def __init__(self, file_data = None, filename = None, skip_lines = 1):
+    def __init__(self, file_data = None, filename = None, skip_lines = 1,
+        streaming = False):
         super(TimelineReader, self).__init__(
             file_data = file_data,
             filename = filename,
-            skip_lines = skip_lines)
+            skip_lines = skip_lines,
+            streaming = streaming)
         self.components = self.__default_components()
         self.__events = []
         self.__timeline = []
@@ -8,9 +8,9 @@
 
 import sys
 import os.path
-import math
 from optparse import OptionParser
-from gazehound import readers, timeline, viewing, shapes
+import numpy as np
+from gazehound import readers, timeline, viewing, shapes, gazepoint
 from gazehound.writers import delimited
 from gazehound.readers import iview
 
@@ -167,13 +167,7 @@ class FixationStatisticsAnalyzer(object):
         data = FixationStats(
             presented='screen',
             area='all',
-            start_ms=self.scanpath[0].time,
-            end_ms=self.scanpath[-1].time+self.scanpath[-1].duration,
-            total_fixations=len(self.scanpath),
-            time_fixating=self.__time_fixating(self.scanpath),
-            fixations_per_second=self.__fixations_per_second(self.scanpath),
-            distance_between_fixations=self.__distance_between_fixations(
-                self.scanpath))
+            **self.__fixation_measures(self.__fixations(self.scanpath)))
 
         data.time_in = data.time_fixating
         data.time_out = (data.end_ms - data.start_ms) - data.time_fixating
@@ -188,103 +182,104 @@ class FixationStatisticsAnalyzer(object):
 
         data = []
         doshapes = hasattr(self.timeline, 'has_shapes')
-        for pres in self.timeline:
-            if len(pres.scanpath) == 0:
-                stats = FixationStats(
-                    presented=pres.name,
-                    area='all')
-            else:
-                stats = FixationStats(
-                    presented=pres.name,
-                    area='all',
-                    start_ms=pres.scanpath[0].time,
-                    end_ms=pres.scanpath[-1].time+pres.scanpath[-1].duration,
-                    total_fixations=len(pres.scanpath),
-                    time_fixating=self.__time_fixating(pres.scanpath),
-                    fixations_per_second=self.__fixations_per_second(
-                        pres.scanpath),
-                    distance_between_fixations=self.__distance_between_fixations(
-                        pres.scanpath))
-
+        for i, pres in enumerate(self.timeline):
+            fix = self.__event_fixations(i, pres)
+            measures = self.__fixation_measures(fix)
+            stats = FixationStats(presented=pres.name, area='all', **measures)
+            if len(fix) > 0:
                 stats.time_in = stats.time_fixating
                 stats.time_out = ((stats.end_ms - stats.start_ms) -
                                     stats.time_fixating)
             data.append(stats)
             if doshapes:
-                for ss in self.shape_stats(pres):
-                    data.append(ss)
-                    pass
+                data.extend(self.__shape_rows(pres, fix, measures))
         return data
 
     def shape_stats(self, pres):
-        stats_list = []
+        fix = fixation_records(pres.scanpath)
+        return self.__shape_rows(pres, fix, self.__fixation_measures(fix))
+
+    def __shape_rows(self, pres, fix, measures):
         if pres.shapes is None:
             return[FixationStats(
                 presented=pres.name,
                 area="Can't read shape file")]
-        for s in pres.shapes:
-            if len(pres.scanpath) == 0:
-                stats = FixationStats(
-                    presented=pres.name,
-                    area=s.name)
-            else:
-                stats = FixationStats(
-                    presented=pres.name,
-                    area=s.name,
-                    start_ms=pres.scanpath[0].time,
-                    end_ms=pres.scanpath[-1].time+pres.scanpath[-1].duration,
-                    total_fixations=len(pres.scanpath),
-                    time_fixating=self.__time_fixating(pres.scanpath),
-                    fixations_per_second=self.__fixations_per_second(
-                        pres.scanpath),
-                    distance_between_fixations=self.__distance_between_fixations(
-                        pres.scanpath))
-
-                def f(point):
-                    return self.in_fun(s, point)
-
-                stats.time_in = sum(p.duration
-                                    for p in pres.scanpath.valid_points(f))
-                stats.time_out =(stats.end_ms - stats.start_ms) - stats.time_in
+        if len(fix) == 0:
+            return [FixationStats(presented=pres.name, area=s.name)
+                for s in pres.shapes]
+
+        masks = shapes.shape_lookup(pres).masks(
+            np.column_stack((fix.x, fix.y)))
+        times_in = masks.dot(fix.duration).tolist()
+
+        stats_list = []
+        for s, time_in in zip(pres.shapes, times_in):
+            stats = FixationStats(presented=pres.name, area=s.name, **measures)
+            stats.time_in = time_in
+            stats.time_out =(stats.end_ms - stats.start_ms) - stats.time_in
             stats_list.append(stats)
 
         return stats_list
 
-    def __total_fixations(self, scanpath):
-        """The total number of fixations in a point path"""
-        return len(scanpath)
-
-    def __time_fixating(self, scanpath):
-        """Time spent fixating during a point path"""
-        return sum(p.duration for p in scanpath)
-
-    def __pp_duration(self, scanpath):
-        if len(scanpath) == 0:
-            return 0
-        start = scanpath[0].time
-        end = scanpath[-1].time+scanpath[-1].duration
-        return end-start
-
-    def __fixations_per_second(self, scanpath):
-        """ Number of fixations divided by seconds fixating """
-        tf = self.__time_fixating(scanpath)*1000.0
-        if tf == 0:
-            return 0
-        return (
-            float(self.__total_fixations(scanpath)) /
-            (self.__pp_duration(scanpath)/1000.0))
-
-    def __distance_between_fixations(self, scanpath):
-        if len(scanpath) < 2:
-            return 0
-
-        def dist(p1, p2):
-            return math.sqrt((p1.x-p2.x)**2 + (p1.y-p2.y)**2)
-
-        dsum = 0
-        for i in range(1, len(scanpath)):
-            dsum += dist(scanpath[i-1], scanpath[i])
-        return float(dsum) / (len(scanpath)-1)
+    def __fixations(self, scanpath):
+        """ fixation_records() of scanpath, built once per scanpath """
+        cached = getattr(self, '_fixations', None)
+        if cached is None or cached[0] is not scanpath:
+            cached = (scanpath, fixation_records(scanpath))
+            self._fixations = cached
+        return cached[1]
+
+    def __event_fixations(self, i, pres):
+        """
+        The records of pres's fixations: a slice of the whole scanpath's
+        if the timeline came from viewing.Combiner, or pres.scanpath's.
+        """
+        table = None
+        if hasattr(self.timeline, 'current_index_table'):
+            table = self.timeline.current_index_table()
+        if table is None:
+            return fixation_records(pres.scanpath)
+        start, end = table[i]
+        return self.__fixations(self.timeline.indexed_scanpath)[start:end]
+
+    def __fixation_measures(self, fix):
+        """
+        The stats that don't depend on shapes, as FixationStats keyword
+        arguments. There are none for empty scanpaths.
+        """
+        if len(fix) == 0:
+            return {}
+        start_ms = fix.time[0].item()
+        end_ms = (fix.time[-1] + fix.duration[-1]).item()
+        time_fixating = fix.duration.sum().item()
+        fixations_per_second = 0
+        if time_fixating*1000.0 <> 0:
+            fixations_per_second = float(len(fix)) / (
+                (end_ms - start_ms)/1000.0)
+        distance_between_fixations = 0
+        if len(fix) > 1:
+            # Not np.hypot() and sum(): a running sum of sqrt(dx**2 + dy**2)
+            # rounds just like the Point-by-Point loop this replaced did.
+            dx, dy = np.diff(fix.x), np.diff(fix.y)
+            distance_between_fixations = float(
+                np.cumsum(np.sqrt(dx*dx + dy*dy))[-1]) / (len(fix)-1)
+        return dict(
+            start_ms=start_ms,
+            end_ms=end_ms,
+            total_fixations=len(fix),
+            time_fixating=time_fixating,
+            fixations_per_second=fixations_per_second,
+            distance_between_fixations=distance_between_fixations)
+
+
+def fixation_records(scanpath):
+    """
+    Return the records of scanpath's fixations: the points of a
+    gazepoint.FixationTable, converting scanpath into one if it isn't.
+    """
+    if not isinstance(scanpath, gazepoint.FixationTable):
+        scanpath = gazepoint.FixationTable.from_points(list(scanpath.points))
+    return scanpath.points
 
 
 class FixationStats(object):
@@ -9,9 +9,11 @@
 import sys
 import os.path
 from optparse import OptionParser
+import numpy as np
 from gazehound import timeline, viewing, shapes
 from gazehound.writers import delimited
 from gazehound.readers.auto_scanpath import AutoScanpathReader
+from gazehound.readers.cache import ScanpathCache
 from gazehound.readers.timeline import TimelineReader
 
 def main(argv = None):
@@ -51,6 +53,11 @@ class GazeStatisticsOptionParser(object):
             metavar = "NAME"
         )
         
+        parser.add_option(
+            "--cache", dest = "cache", action = "store_true", default = False,
+            help = "Save parsed scanpaths next to the data, and reuse them"
+        )
+        
         self.options, self.args = parser.parse_args(argv[1:])
             
         if len(self.args) == 0:
@@ -78,7 +85,10 @@ class GazeStatsRunner(object):
         op = GazeStatisticsOptionParser(argv)
         # Read and parse the gazestream
 
-        ar = AutoScanpathReader()
+        cache = None
+        if op.options.cache:
+            cache = ScanpathCache()
+        ar = AutoScanpathReader(cache = cache)
         self.scanpath = ar.read_scanpath(filename=op.gaze_file)
 
         self.timeline = None
@@ -87,7 +97,9 @@ class GazeStatsRunner(object):
             self.timeline = self.__build_timeline(op.options.stim_file)
             if op.options.object_dir is not None:
                 r = shapes.ShapeReader(path = op.options.object_dir)
-                dec = shapes.TimelineDecorator(r)
+                dec = shapes.TimelineDecorator(r, 
+                    screen_size = self.scanpath.headers.get('calibration_size')
+                )
                 self.timeline = dec.find_shape_files_and_add_to_timeline(
                     self.timeline
                 )
@@ -143,18 +155,9 @@ class GazeStatisticsAnalyzer(object):
         strict_rect = shapes.Rectangle(0, 0, MAX_X, MAX_Y)
         lax_rect = shapes.Rectangle(
             -X_SLOP, -Y_SLOP, MAX_X+X_SLOP, MAX_Y+Y_SLOP)
-        
-        def default_valid(shape, point):
-            return (point in shape) and (tuple(point) <> (0,0))
 
-        def svf(point):
-            return default_valid(strict_rect, point)
-
-        def lvf(point):
-            return default_valid(lax_rect, point)
-            
-        self.strict_valid_fun = svf
-        self.lax_valid_fun = lvf
+        self.strict_valid_fun = ValidPointTest(strict_rect)
+        self.lax_valid_fun = ValidPointTest(lax_rect)
                         
     def general_stats(self):
         """Return a GazeStats containing basic data about the scanpath"""
@@ -182,61 +185,146 @@ class GazeStatisticsAnalyzer(object):
         """ 
         Return a list of GazeStats containing data about all the events
         in the timeline.
+
+        If the timeline came from viewing.Combiner (and its events still
+        have the scanpaths it gave them), validity and AOI tests run once
+        over the whole scanpath and are summed up per event from its
+        index_table; otherwise, each event's scanpath is tested.
         """
-        
+        table = None
+        if hasattr(self.timeline, 'current_index_table'):
+            table = self.timeline.current_index_table()
+        if table is None:
+            return self.__timeline_stats_by_event()
+
+        xy = self.timeline.indexed_scanpath.as_array(('x', 'y'))
+        totals = table[:,1] - table[:,0]
+        valid_stricts = timeline.segment_reduce(np.add,
+            self.strict_valid_fun.contains_many(xy).astype(int), table)
+        valid_laxes = timeline.segment_reduce(np.add,
+            self.lax_valid_fun.contains_many(xy).astype(int), table)
+        in_counts = {}
+        doshapes = hasattr(self.timeline, 'has_shapes')
+        if doshapes:
+            in_counts = self.__shape_counts(xy, table)
+
+        data = []
+        for i, pres in enumerate(self.timeline):
+            total_points = int(totals[i])
+            valid_strict = int(valid_stricts[i])
+            valid_lax = int(valid_laxes[i])
+            data.append(self.__event_stats(
+                pres, total_points, valid_strict, valid_lax))
+            if doshapes:
+                data.extend(self.__shape_rows(pres, total_points,
+                    valid_strict, valid_lax, in_counts.get(i)))
+        return data
+
+    def __timeline_stats_by_event(self):
         data = []
         doshapes = hasattr(self.timeline, 'has_shapes')
         for pres in self.timeline:
-            stats = GazeStats(
-                presented = pres.name,
-                area = 'all',
-                total_points = len(pres.scanpath),
-                start_ms = pres.start,
-                end_ms = pres.end,
-                valid_strict = len(pres.scanpath.points_matching(
-                    self.strict_valid_fun
-                )),
-                valid_lax = len(pres.scanpath.points_matching(
-                    self.lax_valid_fun
-                ))
-            )
-            stats.points_in = stats.valid_strict
-            stats.points_out = stats.total_points - stats.valid_strict
-            data.append(stats)
+            valid_strict, valid_lax = self.__valid_counts(pres.scanpath)
+            data.append(self.__event_stats(
+                pres, len(pres.scanpath), valid_strict, valid_lax))
             if doshapes:
                 for ss in self.shape_stats(pres):
                     data.append(ss)
-                    pass
         return data
-    
+
+    def __shape_counts(self, xy, table):
+        """
+        Return a dict mapping event indexes to the number of their points
+        in each of their shapes. Events sharing a shape lookup (say, every
+        showing of one stimulus) are tested all at once.
+        """
+        groups = {}
+        for i, pres in enumerate(self.timeline):
+            if getattr(pres, 'shapes', None) is not None:
+                lookup = shapes.shape_lookup(pres)
+                groups.setdefault(id(lookup), (lookup, []))[1].append(i)
+        in_counts = {}
+        for lookup, events in groups.values():
+            event_table = table[events]
+            masks = lookup.masks(xy[timeline.segment_indexes(event_table)])
+            ends = np.cumsum(event_table[:,1] - event_table[:,0])
+            counts = timeline.segment_reduce(np.add, masks.T.astype(int),
+                np.column_stack((np.concatenate(([0], ends[:-1])), ends)))
+            in_counts.update(zip(events, counts))
+        return in_counts
+
+    def __valid_counts(self, scanpath):
+        return (
+            len(scanpath.points_matching(self.strict_valid_fun)),
+            len(scanpath.points_matching(self.lax_valid_fun)))
+
+    def __event_stats(self, pres, total_points, valid_strict, valid_lax):
+        stats = GazeStats(
+            presented = pres.name,
+            area = 'all',
+            total_points = total_points,
+            start_ms = pres.start,
+            end_ms = pres.end,
+            valid_strict = valid_strict,
+            valid_lax = valid_lax
+        )
+        stats.points_in = stats.valid_strict
+        stats.points_out = stats.total_points - stats.valid_strict
+        return stats
+
     def shape_stats(self, pres):
-        stats_list = []
+        if pres.shapes is None:
+            return self.__shape_rows(pres, 0, 0, 0, None)
+        # These are the same for every shape, so only count them once.
+        valid_strict, valid_lax = self.__valid_counts(pres.scanpath)
+        in_counts = shapes.shape_lookup(pres).counts(
+            pres.scanpath.as_array(('x', 'y')))
+        return self.__shape_rows(pres, len(pres.scanpath),
+            valid_strict, valid_lax, in_counts)
+
+    def __shape_rows(self, pres, total_points, valid_strict, valid_lax,
+                     in_counts):
         if pres.shapes is None:
             return[GazeStats(
                 presented = pres.name, 
                 area = "Can't read shape file")
             ]
-        for s in pres.shapes:
+        stats_list = []
+        for s, points_in in zip(pres.shapes, in_counts):
             stats = GazeStats(
                 presented = pres.name,
                 area = s.name,
-                total_points = len(pres.scanpath),
+                total_points = total_points,
                 start_ms = pres.start,
                 end_ms = pres.end,
-                valid_strict = len(pres.scanpath.points_matching(
-                    self.strict_valid_fun
-                )),
-                valid_lax = len(pres.scanpath.points_matching(
-                    self.lax_valid_fun
-                ))
+                valid_strict = valid_strict,
+                valid_lax = valid_lax
             )
                             
-            stats.points_in = len(pres.scanpath.points_within(s))
+            stats.points_in = int(points_in)
             stats.points_out = stats.total_points - stats.points_in
             stats_list.append(stats)
             
         return stats_list
 
+class ValidPointTest(object):
+    """
+    Tells whether a point lies in shape and isn't (0, 0), which is where
+    lost samples end up. Call it with one (x, y) point, or hand an (n, 2)
+    array to contains_many() -- points_matching() will do the latter.
+    """
+    def __init__(self, shape):
+        super(ValidPointTest, self).__init__()
+        self.shape = shape
+
+    def __call__(self, point):
+        return (point in self.shape) and (tuple(point) <> (0,0))
+
+    def contains_many(self, points):
+        points = np.asarray(points)
+        return self.shape.contains_many(points) & np.any(points <> 0, axis=1)
+
+
 class GazeStats(object):
     """A data structure containing stats about a scanpath"""
     def __init__(self, 
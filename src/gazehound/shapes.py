@@ -8,9 +8,13 @@
 
 import os.path
 import copy
+import time
 import array
+from collections import OrderedDict
 from ConfigParser import SafeConfigParser
 
+import numpy as np
+
 
 class Shape(object):
     """docstring for Shape"""
@@ -24,6 +28,71 @@ class Shape(object):
         raise NotImplementedError(
             "__contains__ must be overridden by subclass")
 
+    def contains_many(self, points):
+        """
+        Return a boolean array, true where the row of the (n, 2) array of
+        x, y coordinates in points lies in this shape. Subclasses should
+        override this with something faster than asking one point at a time.
+        """
+        return np.fromiter(
+            (tuple(p) in self for p in points), dtype=bool, count=len(points))
+
+    def bounds(self):
+        """
+        Return (x1, y1, x2, y2), a box that holds every point in this shape,
+        or None if we don't know one.
+        """
+        return None
+
+    def cache_key(self):
+        """
+        Return a hashable value that's equal for any two shapes of this
+        class covering the same points, or None if we don't know one.
+        Shapes without one are never cached by compile_aoi_map().
+        """
+        return None
+
+    @classmethod
+    def pack(cls, shapes):
+        """
+        Return whatever packed_contains() needs to test points against
+        many shapes of this class at once.
+        """
+        return list(shapes)
+
+    @classmethod
+    def packed_contains(cls, packed, which, points):
+        """
+        Return a boolean array, true where points[i] lies in shape number
+        which[i] of the shapes that were pack()ed into packed. Subclasses
+        should override this and pack() to test all the pairs at once.
+        """
+        which = np.asarray(which)
+        points = np.asarray(points)
+        out = np.zeros(len(which), dtype=bool)
+        order = np.argsort(which, kind='mergesort')
+        ids, starts = np.unique(which[order], return_index=True)
+        for shape_i, sel in zip(ids, np.split(order, starts[1:])):
+            out[sel] = packed[shape_i].contains_many(points[sel])
+        return out
+
+    def mask(self, width, height):
+        """
+        Return a (height, width) boolean array, true at [y, x] for every
+        whole-pixel (x, y) on the screen that lies in this shape.
+        """
+        out = np.zeros((height, width), dtype=bool)
+        x1, y1, x2, y2 = self.bounds() or (0, 0, width-1, height-1)
+        x1, y1 = max(int(np.ceil(x1)), 0), max(int(np.ceil(y1)), 0)
+        x2 = min(int(np.floor(x2)), width-1)
+        y2 = min(int(np.floor(y2)), height-1)
+        if x1 > x2 or y1 > y2:
+            return out
+        ys, xs = np.mgrid[y1:y2+1, x1:x2+1]
+        inside = self.contains_many(np.column_stack((xs.ravel(), ys.ravel())))
+        out[y1:y2+1, x1:x2+1] = inside.reshape(xs.shape)
+        return out
+
 
 class Rectangle(Shape):
 
@@ -46,6 +115,24 @@ class Rectangle(Shape):
             (x >= self.x1 and x <= self.x2) and
             (y >= self.y1 and y <= self.y2))
 
+    def contains_many(self, points):
+        x, y = _xy_columns(points)
+        return (x >= self.x1) & (x <= self.x2) & (y >= self.y1) & (y <= self.y2)
+
+    def bounds(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @classmethod
+    def pack(cls, shapes):
+        return np.array(
+            [(s.x1, s.y1, s.x2, s.y2) for s in shapes], dtype=float)
+
+    @classmethod
+    def packed_contains(cls, packed, which, points):
+        x, y = _xy_columns(points)
+        p = packed[which]
+        return (x >= p[:,0]) & (x <= p[:,2]) & (y >= p[:,1]) & (y <= p[:,3])
+
     def to_matrix(self, type_str='f', fill_value=1.0, bkg_value=0.0):
         """
         Return a list of array.array objects, sized with this rectangle's
@@ -57,10 +144,11 @@ class Rectangle(Shape):
         """
         w = abs(self.x2 - self.x1)
         h = abs(self.y2 - self.y1)
-        matrix = [
-            array.array(type_str, [fill_value]*h)
-            for c in range(0, w)]
-        return matrix
+        column = array.array(type_str, [fill_value])*h
+        return [array.array(type_str, column) for c in range(0, w)]
+
+    def cache_key(self):
+        return (self.x1, self.y1, self.x2, self.y2)
 
     def __repr__(self):
         return "Rectangle"+str((self.x1, self.y1, self.x2, self.y2))
@@ -92,6 +180,29 @@ class Ellipse(Shape):
         (y - self.cy)**2/float(self.semiy**2))
         <= 1)
 
+    def contains_many(self, points):
+        x, y = _xy_columns(points)
+        return (
+        ((x - self.cx)**2/float(self.semix**2) +
+        (y - self.cy)**2/float(self.semiy**2))
+        <= 1)
+
+    def bounds(self):
+        sx, sy = abs(self.semix), abs(self.semiy)
+        return (self.cx - sx, self.cy - sy, self.cx + sx, self.cy + sy)
+
+    @classmethod
+    def pack(cls, shapes):
+        return np.array([
+            (s.cx, s.cy, float(s.semix**2), float(s.semiy**2))
+            for s in shapes], dtype=float)
+
+    @classmethod
+    def packed_contains(cls, packed, which, points):
+        x, y = _xy_columns(points)
+        p = packed[which]
+        return ((x - p[:,0])**2/p[:,2] + (y - p[:,1])**2/p[:,3]) <= 1
+
     def height(self):
         return self.semiy*2
 
@@ -101,23 +212,464 @@ class Ellipse(Shape):
     def to_matrix(self, type_str='f', fill_value=1.0, bkg_value=0.0):
         h = self.height()
         w = self.width()
-        matrix = [
-            array.array(type_str, [bkg_value]*h)
-            for c in range(0, w)]
-
-        for i in range(0, w):
-            for j in range(0, h):
-                x = i+self.cx-self.semix
-                y = j+self.cy-self.semiy
-                point = (x, y)
-                if point in self:
-                    matrix[i][j] = fill_value
-        return matrix
+        # matrix[i][j] is the point (i+cx-semix, j+cy-semiy)
+        i, j = np.mgrid[0:w, 0:h]
+        inside = self.contains_many(np.column_stack((
+            (i+self.cx-self.semix).ravel(), (j+self.cy-self.semiy).ravel())))
+        # Object arrays keep fill_value and bkg_value's own types.
+        values = np.array([bkg_value, fill_value], dtype=object)
+        return [
+            array.array(type_str, col)
+            for col in values[inside.reshape(w, h).astype(int)].tolist()]
+
+    def cache_key(self):
+        return (self.cx, self.cy, self.semix, self.semiy)
 
     def __repr__(self):
         return "Ellipse"+str((self.cx, self.cy, self.semix, self.semiy))
 
 
+class Polygon(Shape):
+    """
+    A polygon-shaped area of interest, given as a list of (x, y) vertices.
+    The last vertex joins back up to the first; edges may cross each other,
+    in which case the even-odd rule decides what's inside.
+    """
+
+    def __init__(self, vertices=(), name='', description=''):
+        super(Polygon, self).__init__(
+            name=name, description=description)
+        self.vertices = [tuple(v) for v in vertices]
+        self._build_edge_table()
+
+    def _build_edge_table(self):
+        v = np.array(self.vertices, dtype=float).reshape(-1, 2)
+        w = np.roll(v, -1, axis=0)
+        self._xa, self._ya = v[:,0], v[:,1]
+        self._xb, self._yb = w[:,0], w[:,1]
+        dy = self._yb - self._ya
+        # dx/dy, for finding where an edge crosses a horizontal line.
+        self._inv_slope = np.where(
+            dy == 0, 0.0, (self._xb - self._xa) / np.where(dy == 0, 1, dy))
+        self._edge_table = zip(*[a.tolist() for a in (
+            self._xa, self._ya, self._xb, self._yb, self._inv_slope)])
+
+    def __contains__(self, point):
+        """
+        Return true if and only if the (x,y) tuple in point lies inside
+        this polygon or on its border.
+        """
+        x, y = [float(e) for e in point]
+        inside = False
+        for xa, ya, xb, yb, inv_slope in self._edges():
+            if ((ya > y) <> (yb > y)) and (x < xa + (y - ya)*inv_slope):
+                inside = not inside
+            if ((x - xa)*(yb - ya) == (y - ya)*(xb - xa) and
+                    min(xa, xb) <= x <= max(xa, xb) and
+                    min(ya, yb) <= y <= max(ya, yb)):
+                return True
+        return inside
+
+    def contains_many(self, points):
+        x, y = _xy_columns(np.asarray(points, dtype=float).reshape(-1, 2))
+        out = np.zeros(len(x), dtype=bool)
+        if len(self.vertices) == 0:
+            return out
+        # Only points in the bounding box need the edges.
+        x1, y1, x2, y2 = self.bounds()
+        near = np.flatnonzero((x >= x1) & (x <= x2) & (y >= y1) & (y <= y2))
+        x, y = x[near], y[near]
+        inside = np.zeros(len(x), dtype=bool)
+        on_edge = np.zeros(len(x), dtype=bool)
+        for edge in self._edges():
+            self._test_edge(edge, x, y, inside, on_edge)
+        out[near] = inside | on_edge
+        return out
+
+    def _edges(self):
+        return self._edge_table
+
+    def _test_edge(self, edge, x, y, inside, on_edge):
+        """
+        Flip inside where a ray from (x, y) towards +x crosses edge, and
+        set on_edge where (x, y) lies on it.
+        """
+        xa, ya, xb, yb, inv_slope = edge
+        crosses = (ya > y) <> (yb > y)
+        inside ^= crosses & (x < xa + (y - ya)*inv_slope)
+        on_edge |= (
+            ((x - xa)*(yb - ya) == (y - ya)*(xb - xa)) &
+            (x >= min(xa, xb)) & (x <= max(xa, xb)) &
+            (y >= min(ya, yb)) & (y <= max(ya, yb)))
+
+    def bounds(self):
+        if len(self.vertices) == 0:
+            return None
+        v = np.array(self.vertices)
+        x1, y1 = v.min(axis=0)
+        x2, y2 = v.max(axis=0)
+        return (x1, y1, x2, y2)
+
+    def mask(self, width, height):
+        """
+        Like Shape.mask, but each edge is only tested against the rows of
+        pixels it spans -- the rest can't cross it or lie on it.
+        """
+        out = np.zeros((height, width), dtype=bool)
+        if len(self.vertices) == 0:
+            return out
+        x1, y1, x2, y2 = self.bounds()
+        y_lo, y_hi = max(int(np.ceil(y1)), 0), min(int(np.floor(y2)), height-1)
+        x_lo, x_hi = max(int(np.ceil(x1)), 0), min(int(np.floor(x2)), width-1)
+        if x_lo > x_hi or y_lo > y_hi:
+            return out
+        y, x = np.mgrid[y_lo:y_hi+1, x_lo:x_hi+1].astype(float)
+        inside = np.zeros(x.shape, dtype=bool)
+        on_edge = np.zeros(x.shape, dtype=bool)
+        for edge in self._edges():
+            ya, yb = edge[1], edge[3]
+            r0 = max(int(np.ceil(min(ya, yb))) - y_lo, 0)
+            r1 = min(int(np.floor(max(ya, yb))) - y_lo + 1, len(x))
+            if r0 < r1:
+                self._test_edge(edge, x[r0:r1], y[r0:r1],
+                    inside[r0:r1], on_edge[r0:r1])
+        out[y_lo:y_hi+1, x_lo:x_hi+1] = inside | on_edge
+        return out
+
+    def to_matrix(self, type_str='f', fill_value=1.0, bkg_value=0.0):
+        """
+        Like Ellipse.to_matrix: matrix[i][j] is the point (x1+i, y1+j) of
+        this polygon's bounding box. An empty polygon has an empty matrix.
+        """
+        if len(self.vertices) == 0:
+            return []
+        x1, y1, x2, y2 = [int(e) for e in self.bounds()]
+        i, j = np.mgrid[0:x2-x1, 0:y2-y1]
+        inside = self.contains_many(np.column_stack((
+            (i+x1).ravel(), (j+y1).ravel())))
+        values = np.array([bkg_value, fill_value], dtype=object)
+        return [
+            array.array(type_str, col)
+            for col in values[inside.reshape(i.shape).astype(int)].tolist()]
+
+    def cache_key(self):
+        return tuple(self.vertices)
+
+    def __repr__(self):
+        return "Polygon"+str(tuple(self.vertices))
+
+
+def _xy_columns(points):
+    points = np.asarray(points)
+    return points[:,0], points[:,1]
+
+
+class AOIMap(object):
+    """
+    A list of shapes compiled into rasters of the screen, so classifying a
+    point with whole-number coordinates on the screen is an array lookup
+    no matter how many shapes there are. Other points are tested against
+    the shapes themselves, so the answers are always exact.
+
+    bits is a bitmask raster for overlapping shapes: plane i/8 at [y, x]
+    has bit i%8 (counting from the high bit, as np.unpackbits does) set if
+    pixel (x, y) is in shapes[i]. label_raster holds the index of the
+    first shape each pixel is in, or -1.
+
+    Use compile_aoi_map() to share rasters between stimuli whose shapes
+    are the same.
+    """
+
+    # BIT_TABLE[b] is the bits of the byte b, high bit first.
+    BIT_TABLE = np.unpackbits(
+        np.arange(256, dtype=np.uint8)[:,np.newaxis], axis=1).astype(int)
+
+    def __init__(self, shapes, width, height, rasters=None):
+        super(AOIMap, self).__init__()
+        self.shapes = list(shapes)
+        self.width = width
+        self.height = height
+        if rasters is None:
+            rasters = self.rasterize(self.shapes, width, height)
+        self.bits, self.label_raster = rasters
+
+    @classmethod
+    def rasterize(cls, shapes, width, height):
+        """ Return (bits, label_raster) for shapes. """
+        bits = np.zeros(((len(shapes)+7) // 8, height, width), dtype=np.uint8)
+        labels = np.zeros((height, width), dtype=np.int32) - 1
+        for i in reversed(range(len(shapes))):
+            mask = shapes[i].mask(width, height)
+            bits[i // 8][mask] |= np.uint8(0x80 >> (i % 8))
+            labels[mask] = i
+        return (bits, labels)
+
+    def masks(self, points):
+        """
+        Return a (len(shapes), n) boolean array; row i is
+        shapes[i].contains_many(points).
+        """
+        points = np.asarray(points, dtype=float)
+        out = np.zeros((len(self.shapes), len(points)), dtype=bool)
+        idx, pixels, rest = self._split(points)
+        if len(idx) > 0:
+            words = self.bits.reshape(len(self.bits), -1).take(pixels, axis=1)
+            out[:, idx] = np.unpackbits(words, axis=0)[:len(self.shapes)]
+        for i, shape in enumerate(self.shapes):
+            if len(rest) > 0:
+                out[i, rest] = shape.contains_many(points[rest])
+        return out
+
+    def hits(self, points):
+        """
+        Return (point_ids, shape_ids): arrays listing every pair where
+        points[point_ids[i]] lies in shapes[shape_ids[i]].
+        """
+        shape_ids, point_ids = np.nonzero(self.masks(points))
+        return (point_ids, shape_ids)
+
+    def counts(self, points):
+        """
+        Return an array with the number of points in each shape -- the
+        same as masks(points).sum(axis=1), without building the masks.
+        """
+        points = np.asarray(points, dtype=float)
+        out = np.zeros(len(self.shapes), dtype=int)
+        idx, pixels, rest = self._split(points)
+        if len(idx) > 0:
+            for plane_i, plane in enumerate(
+                    self.bits.reshape(len(self.bits), -1)):
+                hist = np.bincount(plane.take(pixels), minlength=256)
+                n = len(out[plane_i*8:(plane_i+1)*8])
+                out[plane_i*8:(plane_i+1)*8] += hist.dot(self.BIT_TABLE)[:n]
+        for i, shape in enumerate(self.shapes):
+            if len(rest) > 0:
+                out[i] += np.sum(shape.contains_many(points[rest]))
+        return out
+
+    def labels(self, points):
+        """
+        Return, for each point, the index of the first shape it lies in,
+        or -1 if it's in none of them.
+        """
+        points = np.asarray(points, dtype=float)
+        out = np.zeros(len(points), dtype=int) - 1
+        idx, pixels, rest = self._split(points)
+        if len(idx) > 0:
+            out[idx] = self.label_raster.take(pixels)
+        for i in reversed(range(len(self.shapes))):
+            if len(rest) > 0:
+                out[rest[self.shapes[i].contains_many(points[rest])]] = i
+        return out
+
+    def _split(self, points):
+        """
+        Return (idx, pixels, rest): the indexes of points we can look up in
+        the rasters, their flat pixel numbers, and the indexes of the rest.
+        """
+        if len(points) == 0:
+            empty = np.zeros(0, dtype=int)
+            return (empty, empty, empty)
+        x, y = _xy_columns(points)
+        on_raster = (
+            (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height))
+        xi = np.where(on_raster, x, 0).astype(int)
+        yi = np.where(on_raster, y, 0).astype(int)
+        on_raster &= (xi == x) & (yi == y)
+        idx = np.flatnonzero(on_raster)
+        pixels = yi[idx]*self.width + xi[idx]
+        return (idx, pixels, np.flatnonzero(~on_raster))
+
+
+class ShapeIndex(object):
+    """
+    A uniform grid over the bounding boxes of a list of shapes, for
+    stimuli with too many shapes to test every point against every shape.
+    Each point is only tested against the shapes whose boxes share its
+    grid cell, and those tests are done all at once for each class of
+    shape (see Shape.pack), so the cost depends on how crowded the cells
+    are rather than how many shapes there are.
+
+    Answers the same questions as AOIMap, and the answers are exact.
+    """
+
+    def __init__(self, shapes, cell_size=None):
+        """
+        cell_size is the width of a grid cell; by default, the median size
+        of the shapes' bounding boxes.
+        """
+        super(ShapeIndex, self).__init__()
+        self.shapes = list(shapes)
+        self._pack_shapes()
+        boxes = [s.bounds() for s in self.shapes]
+        # Shapes without a bounding box get tested against every point.
+        self._unbounded = np.array(
+            [i for i, b in enumerate(boxes) if b is None], dtype=int)
+        bounded = [i for i, b in enumerate(boxes) if b is not None]
+        self._build_grid(bounded, [boxes[i] for i in bounded], cell_size)
+
+    def _pack_shapes(self):
+        classes = []
+        for shape in self.shapes:
+            if type(shape) not in classes:
+                classes.append(type(shape))
+        self._class_codes = np.zeros(len(self.shapes), dtype=int)
+        self._local_ids = np.zeros(len(self.shapes), dtype=int)
+        self._packs = []
+        for code, klass in enumerate(classes):
+            members = [i for i, s in enumerate(self.shapes)
+                if type(s) is klass]
+            self._class_codes[members] = code
+            self._local_ids[members] = np.arange(len(members))
+            self._packs.append(
+                (klass, klass.pack([self.shapes[i] for i in members])))
+
+    def _build_grid(self, shape_ids, boxes, cell_size):
+        self._cells = np.zeros(0, dtype=int)
+        self._cell_shapes = np.zeros(0, dtype=int)
+        self.x0 = self.y0 = 0.0
+        self.nx = self.ny = 0
+        self.cell_size = cell_size or 1.0
+        if len(boxes) == 0:
+            return
+        b = np.array(boxes, dtype=float)
+        x1 = np.minimum(b[:,0], b[:,2])
+        x2 = np.maximum(b[:,0], b[:,2])
+        y1 = np.minimum(b[:,1], b[:,3])
+        y2 = np.maximum(b[:,1], b[:,3])
+        if cell_size is None:
+            self.cell_size = max(float(np.median(
+                np.maximum(x2 - x1, y2 - y1))), 1.0)
+        self.x0, self.y0 = x1.min(), y1.min()
+        ix1, iy1 = self._cell_coords(x1, y1)
+        ix2, iy2 = self._cell_coords(x2, y2)
+        self.nx, self.ny = int(ix2.max()) + 1, int(iy2.max()) + 1
+        cells = []
+        cell_shapes = []
+        for i, shape_i in enumerate(shape_ids):
+            iy, ix = np.mgrid[iy1[i]:iy2[i]+1, ix1[i]:ix2[i]+1]
+            cells.append((iy*self.nx + ix).ravel())
+            cell_shapes.append(np.zeros(ix.size, dtype=int) + shape_i)
+        cells = np.concatenate(cells)
+        order = np.argsort(cells, kind='mergesort')
+        self._cells = cells[order]
+        self._cell_shapes = np.concatenate(cell_shapes)[order]
+
+    def _cell_coords(self, x, y):
+        return (np.floor((x - self.x0) / self.cell_size).astype(int),
+            np.floor((y - self.y0) / self.cell_size).astype(int))
+
+    def hits(self, points):
+        """
+        Return (point_ids, shape_ids): arrays listing every pair where
+        points[point_ids[i]] lies in shapes[shape_ids[i]].
+        """
+        points = np.asarray(points, dtype=float)
+        point_ids, shape_ids = self._candidates(points)
+        inside = np.zeros(len(point_ids), dtype=bool)
+        codes = self._class_codes[shape_ids]
+        for code, (klass, packed) in enumerate(self._packs):
+            sel = np.flatnonzero(codes == code)
+            if len(sel) > 0:
+                inside[sel] = klass.packed_contains(packed,
+                    self._local_ids[shape_ids[sel]], points[point_ids[sel]])
+        return (point_ids[inside], shape_ids[inside])
+
+    def _candidates(self, points):
+        """ Every (point, shape) pair sharing a grid cell. """
+        if len(points) == 0 or len(self.shapes) == 0:
+            empty = np.zeros(0, dtype=int)
+            return (empty, empty)
+        x, y = _xy_columns(points)
+        on_grid = np.isfinite(x) & np.isfinite(y)
+        fx = np.where(on_grid, (x - self.x0) / self.cell_size, -1)
+        fy = np.where(on_grid, (y - self.y0) / self.cell_size, -1)
+        on_grid &= (fx >= 0) & (fx < self.nx) & (fy >= 0) & (fy < self.ny)
+        point_ids = np.flatnonzero(on_grid)
+        cells = (np.floor(fy[point_ids]).astype(int)*self.nx +
+            np.floor(fx[point_ids]).astype(int))
+        lo = np.searchsorted(self._cells, cells, 'left')
+        counts = np.searchsorted(self._cells, cells, 'right') - lo
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        pairs = starts + np.arange(len(starts))
+        point_ids = np.repeat(point_ids, counts)
+        shape_ids = self._cell_shapes[pairs]
+        if len(self._unbounded) > 0:
+            n = len(points)
+            point_ids = np.concatenate(
+                (point_ids, np.tile(np.arange(n), len(self._unbounded))))
+            shape_ids = np.concatenate(
+                (shape_ids, np.repeat(self._unbounded, n)))
+        return (point_ids, shape_ids)
+
+    def masks(self, points):
+        """
+        Return a (len(shapes), n) boolean array; row i is
+        shapes[i].contains_many(points).
+        """
+        out = np.zeros((len(self.shapes), len(points)), dtype=bool)
+        point_ids, shape_ids = self.hits(points)
+        out[shape_ids, point_ids] = True
+        return out
+
+    def counts(self, points):
+        """ Return an array with the number of points in each shape. """
+        point_ids, shape_ids = self.hits(points)
+        return np.bincount(shape_ids, minlength=len(self.shapes))
+
+    def labels(self, points):
+        """
+        Return, for each point, the index of the first shape it lies in,
+        or -1 if it's in none of them.
+        """
+        point_ids, shape_ids = self.hits(points)
+        out = np.zeros(len(points), dtype=int) + len(self.shapes)
+        np.minimum.at(out, point_ids, shape_ids)
+        out[out == len(self.shapes)] = -1
+        return out
+
+
+def shape_lookup(presentation):
+    """
+    Return the best thing we have for testing points against the shapes
+    of presentation: its aoi_map, its shape_index, or a new ShapeIndex.
+    """
+    lookup = getattr(presentation, 'aoi_map', None)
+    if lookup is None:
+        lookup = getattr(presentation, 'shape_index', None)
+    if lookup is None:
+        lookup = ShapeIndex(presentation.shapes)
+    return lookup
+
+
+AOI_MAP_CACHE_BYTES = 256 * 1024 * 1024
+_aoi_raster_cache = OrderedDict()
+
+def compile_aoi_map(shapes, width, height):
+    """
+    Return an AOIMap of shapes on a width by height screen. Rasters are
+    kept (the most recently used ones, up to AOI_MAP_CACHE_BYTES of them)
+    and reused whenever the same shapes come up again, say for the next
+    subject -- unless a shape has no cache_key().
+    """
+    shape_keys = tuple((type(s), s.cache_key()) for s in shapes)
+    if any(k is None for cls, k in shape_keys):
+        return AOIMap(shapes, width, height)
+    key = (shape_keys, width, height)
+    rasters = _aoi_raster_cache.pop(key, None)
+    if rasters is None:
+        rasters = AOIMap.rasterize(shapes, width, height)
+    _aoi_raster_cache[key] = rasters
+    total = sum(_raster_bytes(r) for r in _aoi_raster_cache.itervalues())
+    while total > AOI_MAP_CACHE_BYTES:
+        total -= _raster_bytes(_aoi_raster_cache.popitem(last=False)[1])
+    return AOIMap(shapes, width, height, rasters)
+
+
+def _raster_bytes(rasters):
+    return sum(r.nbytes for r in rasters)
+
+
 class ShapeParser(object):
     """Creates shapes out strings"""
 
@@ -125,24 +677,29 @@ class ShapeParser(object):
         super(ShapeParser, self).__init__()
         self.OBT_MAP = {
             '1': self.__parse_rectangle,
-            '2': self.__parse_ellipse}
+            '2': self.__parse_ellipse,
+            '3': self.__parse_polygon}
 
     def parse_obt_str(self, str, name=None):
         """
-        Parse an object string into an Ellipse or a Rectangle, or None if
-        neither option is reasonaoble.
+        Parse an object string into an Ellipse, a Rectangle or a Polygon,
+        or None if none of them is reasonaoble.
 
         Object strings are of the format created by SMI's iView analysis
         package, and look like:
         type, p1, p2, p3, p4 description
 
-        Type is 1 or 2; 1 indicates rectangle, 2 indicates ellipse.
+        Type is 1, 2 or 3; 1 indicates rectangle, 2 indicates ellipse, and
+        3 indicates polygon.
 
         For rectangles, the four parameters are the four lines defining the
         perimeter of the rectangle, in the order x1, y1, x2, y2.
 
         For ellipses, the four parameters are the center point and semimajor
         x and y axes of the ellipse, in the order x, y, semi_x, semi_y.
+
+        Polygons aren't part of SMI's format; they take any number of
+        vertices (at least three), as x1, y1, x2, y2, ..., xn, yn.
         """
 
         try:
@@ -168,11 +725,98 @@ class ShapeParser(object):
         return Ellipse(x, y, semi_x, semi_y,
                             description = description, name = name)
 
+    def __parse_polygon(self, str, name):
+        """ str should not contain the leading 3"""
+        # The description can have commas too; it starts after the first
+        # coordinate with a space in it.
+        parts = str.split(", ")
+        ends = [i for i, part in enumerate(parts) if " " in part][0]
+        last, description = parts[ends].split(" ", 1)
+        description = ", ".join([description] + parts[ends+1:])
+        coords = [int(e) for e in parts[:ends] + [last]]
+        if len(coords) < 6 or len(coords) % 2 != 0:
+            raise ValueError("Polygons need three or more x, y pairs")
+        return Polygon(zip(coords[0::2], coords[1::2]),
+                            description = description, name = name)
+
+
+SHAPE_FILE_CACHE_SIZE = 256
+DIRECTORY_CACHE_SIZE = 64
+# A directory changed this recently may change again within the same
+# mtime tick, so its listing isn't cached.
+RACY_SECONDS = 2
+_shape_file_cache = OrderedDict()
+_directory_cache = OrderedDict()
+
+def _cache_get(cache, key, stamp):
+    """ Return the value cached under key, if it was stored with stamp """
+    entry = cache.pop(key, None)
+    if entry is None or entry[0] != stamp:
+        return None
+    cache[key] = entry
+    return entry[1]
+
+def _cache_put(cache, key, stamp, value, size):
+    cache.pop(key, None)
+    cache[key] = (stamp, value)
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+def clear_shape_caches():
+    """ Forget all the shape files and directory listings we've read. """
+    _shape_file_cache.clear()
+    _directory_cache.clear()
+    _aoi_raster_cache.clear()
+
+def directory_listing(path):
+    """
+    Return (files, folded) for the directory path, or None if it can't be
+    listed. files is a set of the names of the regular files in it; folded
+    maps their lowercased names to them if the filesystem ignores case,
+    and is None otherwise.
+
+    Listings are cached (for the last DIRECTORY_CACHE_SIZE directories)
+    until the directory's mtime or link count changes -- except for
+    directories changed in the last RACY_SECONDS.
+    """
+    full = os.path.abspath(path)
+    try:
+        st = os.stat(full)
+    except OSError:
+        return None
+    stamp = (st.st_mtime, st.st_nlink)
+    listing = _cache_get(_directory_cache, full, stamp)
+    if listing is None:
+        try:
+            names = os.listdir(full)
+        except OSError:
+            return None
+        files = set(
+            n for n in names if os.path.isfile(os.path.join(full, n)))
+        folded = None
+        for n in files:
+            if n.swapcase() != n:
+                if (n.swapcase() not in files and 
+                        os.path.exists(os.path.join(full, n.swapcase()))):
+                    folded = dict((f.lower(), f) for f in files)
+                break
+        listing = (files, folded)
+        if time.time() - st.st_mtime >= RACY_SECONDS:
+            _cache_put(_directory_cache, full, stamp, listing,
+                DIRECTORY_CACHE_SIZE)
+    return listing
+
 
 class ShapeReader(object):
     """
     Reads shape (.OBT) files and turns them into a collection of
     Shape objects.
+
+    Parsed files are cached for the whole process (for the last
+    SHAPE_FILE_CACHE_SIZE files), until their mtime or size changes, so
+    the same stimulus turning up again -- later in the session, or for the
+    next subject -- costs one stat() call. The Shape objects themselves
+    are shared between the lists we return, so don't change them.
     """
 
     def __init__(self, path='.'):
@@ -185,6 +829,22 @@ class ShapeReader(object):
             parser.parse_obt_str(st[1], name = st[0]) for st in shape_tuples]
 
     def shapes_from_obt_file(self, filename):
+        full = os.path.abspath(filename)
+        try:
+            st = os.stat(full)
+        except OSError:
+            return self.parse_obt_file(filename)
+        key = (type(self), full)
+        stamp = (st.st_mtime, st.st_size)
+        shapes = _cache_get(_shape_file_cache, key, stamp)
+        if shapes is None:
+            shapes = self.parse_obt_file(filename)
+            _cache_put(_shape_file_cache, key, stamp, shapes,
+                SHAPE_FILE_CACHE_SIZE)
+        return list(shapes)
+
+    def parse_obt_file(self, filename):
+        """ Read filename's shapes, skipping the cache. """
         cp = SafeConfigParser()
         cp.read(filename)
         tuples = [tup for tup in cp.items('Objects') if tup[1] != '0']
@@ -223,7 +883,23 @@ class ShapeFilename(object):
         """
         Return the first thing from self.path/[self.permutations()] that's
         a readable file, or None if there isn't one.
+
+        Looks in the cached listing of self.path (see directory_listing)
+        first, so it doesn't usually need to stat every possibility. Names
+        with a directory in them, and names the listing doesn't have, are
+        looked for on disk.
         """
+        listing = None
+        if not _has_directory(self.name):
+            listing = directory_listing(self.path)
+        if listing is not None:
+            files, folded = listing
+            for filename in self.permutations():
+                if filename in files:
+                    return filename
+                if folded is not None and filename.lower() in folded:
+                    return filename
+
         for filename in self.permutations():
             tryfile = os.path.join(self.path, filename)
             if os.path.isfile(tryfile):
@@ -232,23 +908,42 @@ class ShapeFilename(object):
         return None
 
 
+def _has_directory(name):
+    return os.sep in name or (os.altsep is not None and os.altsep in name)
+
+
 class TimelineDecorator(object):
     """
     Adds shape data to a timeline.
     """
 
-    def __init__(self, reader = ShapeReader()):
+    def __init__(self, reader = ShapeReader(), screen_size = None):
+        """
+        If screen_size is a (width, height) tuple, events with shapes also
+        get an aoi_map -- an AOIMap of their shapes on that screen.
+        """
         super(TimelineDecorator, self).__init__()
         self.shape_reader = reader
+        self.screen_size = screen_size
+        # Shape lists from the reader share their Shapes, so events showing
+        # the same stimulus can share an index too.
+        self._indexes = {}
+
+    def _copy_timeline(self, timeline):
+        # We only add attributes to the events, so they're all we copy.
+        my_tl = copy.copy(timeline)
+        my_tl.events = [copy.copy(pres) for pres in timeline]
+        return my_tl
 
     def add_shapes_to_timeline(self, timeline, shape_hash):
-        my_tl = copy.deepcopy(timeline)
+        my_tl = self._copy_timeline(timeline)
         for pres in my_tl:
             pres.shapes = shape_hash.get(pres.name)
+            self.add_aoi_map_to_presentation(pres)
         return my_tl
 
     def find_shape_files_and_add_to_timeline(self, timeline):
-        my_tl = copy.deepcopy(timeline)
+        my_tl = self._copy_timeline(timeline)
         for pres in my_tl:
             self.find_file_and_add_shapes_to_presentation(pres)
         my_tl.has_shapes = True
@@ -257,4 +952,23 @@ class TimelineDecorator(object):
     def find_file_and_add_shapes_to_presentation(self, presentation):
         presentation.shapes = self.shape_reader.find_file_and_create_shapes(
             presentation.name)
+        self.add_aoi_map_to_presentation(presentation)
+        return presentation
+
+    def add_aoi_map_to_presentation(self, presentation):
+        """
+        Give presentation a shape_index of its shapes, and an aoi_map too
+        if we know the screen size.
+        """
+        shapes = presentation.shapes
+        if shapes is None or not all(isinstance(s, Shape) for s in shapes):
+            return presentation
+        key = tuple(id(s) for s in shapes)
+        if key not in self._indexes:
+            # Keep the shapes too, so their ids can't be reused.
+            self._indexes[key] = (shapes, ShapeIndex(shapes))
+        presentation.shape_index = self._indexes[key][1]
+        if self.screen_size is not None:
+            width, height = self.screen_size
+            presentation.aoi_map = compile_aoi_map(shapes, width, height)
         return presentation
@@ -7,6 +7,7 @@
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
 import copy
+import numpy as np
 
 from gazehound.event import *
 
@@ -14,9 +15,17 @@ from gazehound.event import *
 class Timeline(object):
     """A reevent of a series of events."""
 
-    def __init__(self, events = None, min_length = 0):
+    def __init__(self, events = None, min_length = 0, index_table = None,
+                 indexed_scanpath = None, indexed_event_scanpaths = None):
         self.events = events
         self.min_length = min_length
+        # When set (see viewing.Combiner), row i of index_table holds the
+        # [start, end) indexes of event i's points in indexed_scanpath,
+        # and indexed_event_scanpaths[i] is the scanpath event i was given.
+        self.index_table = index_table
+        self.indexed_scanpath = indexed_scanpath
+        self.indexed_event_scanpaths = indexed_event_scanpaths
+        self._sample_event_ids = None
 
     def __len__(self):
         return len(self.events)
@@ -27,6 +36,43 @@ class Timeline(object):
     def __getitem__(self, i):
         return self.events[i]
 
+    def current_index_table(self):
+        """
+        Return index_table, or None if it no longer describes the events'
+        scanpaths -- if any event's scanpath has been replaced (say, by
+        filtering) since the table was made.
+        """
+        if self.index_table is None:
+            return None
+        originals = self.indexed_event_scanpaths
+        if originals is None:
+            return self.index_table
+        if len(originals) != len(self.events):
+            return None
+        for pres, sp in zip(self.events, originals):
+            if getattr(pres, 'scanpath', None) is not sp:
+                return None
+        return self.index_table
+
+    def sample_event_ids(self):
+        """
+        Return an array with the index of the event each point in
+        indexed_scanpath belongs to, or -1 for points outside every event.
+        Where events overlap, the later event wins. Returns None if there's
+        no index_table.
+        """
+        if self.index_table is None:
+            return None
+        if self._sample_event_ids is None:
+            table = self.index_table
+            ids = np.repeat(-1, len(self.indexed_scanpath))
+            lengths = np.maximum(table[:,1] - table[:,0], 0)
+            # Fancy assignment keeps the last write, so later events win.
+            ids[segment_indexes(table)] = np.repeat(
+                np.arange(len(table)), lengths)
+            self._sample_event_ids = ids
+        return self._sample_event_ids
+
     def filled_list(self):
         """Return a list of events with a event in every
         millisecond. Gaps in self.events are filled with Blanks.
@@ -61,8 +107,15 @@ class Timeline(object):
 
     def recenter_on(self, name, x_center, y_center, bounds=None, 
                     method='median'):
-        
-        newtl = copy.deepcopy(self)
+        # Only the scanpaths change, and recenter_by() already returns new
+        # ones -- so the events just need shallow copies.
+        newtl = copy.copy(self)
+        newtl.events = [copy.copy(pres) for pres in self.events]
+        # The recentered scanpaths no longer match indexed_scanpath.
+        newtl.index_table = None
+        newtl.indexed_scanpath = None
+        newtl.indexed_event_scanpaths = None
+        newtl._sample_event_ids = None
         x_offset, y_offset = 0, 0
         for pres in newtl.events:
             if hasattr(pres, 'scanpath'):
@@ -106,3 +159,33 @@ class Timeline(object):
 
         # Passed all tests. We're valid!
         return True
+
+
+def segment_indexes(table):
+    """
+    Return the sample indexes in every [start, end) row of an index table,
+    one row after another.
+    """
+    table = np.asarray(table, dtype=np.int64).reshape(-1, 2)
+    lengths = np.maximum(table[:,1] - table[:,0], 0)
+    offsets = table[:,0] - np.cumsum(lengths) + lengths
+    return np.arange(lengths.sum()) + np.repeat(offsets, lengths)
+
+
+def segment_reduce(ufunc, values, table, empty=0):
+    """
+    Reduce values (along its first axis) over each [start, end) row of an
+    index table with ufunc, as in segment_reduce(np.add, x, tl.index_table).
+    Empty segments get empty. Returns an array with one row per segment.
+    """
+    values = np.asarray(values)
+    table = np.asarray(table, dtype=np.int64).reshape(-1, 2)
+    if len(table) == 0:
+        return np.zeros((0,) + values.shape[1:], dtype=values.dtype)
+    # reduceat needs indexes < len(values) and reduces [i, j) only when
+    # i < j, so pad values by a row and take every other result.
+    padded = np.concatenate(
+        (values, np.zeros((1,) + values.shape[1:], dtype=values.dtype)))
+    result = ufunc.reduceat(padded, table.ravel())[::2]
+    result[table[:,1] <= table[:,0]] = empty
+    return result
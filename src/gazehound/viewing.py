@@ -6,6 +6,7 @@
 # Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 import copy
+import numpy as np
 from gazehound import timeline, gazepoint
 
 
@@ -15,28 +16,112 @@ class Combiner(object):
     def __init__(self, timeline=None, scanpath=None):
         self.timeline = timeline
         self.scanpath = scanpath
+        self._indexed = (None, None, None)
 
     def viewings(self):
-        if self.scanpath.uniformely_sampled:
-            return self.__viewings_uniform()
-        else:
-            return self.__viewings_nonuniform()
-    
-    def __viewings_uniform(self):
-        """ Extract viewings (fast) for uniformly-sampled scanpaths """
+        """
+        Return a copy of timeline whose events each have a scanpath of the
+        points shown during them. The copy's index_table says where those
+        points are in scanpath (see index_table()).
+        """
+        table = self.index_table()
+        if table is None:
+            return self.__viewings_unsorted()
         t2 = copy.copy(self.timeline)
-        for pres in t2:
+        points = self.scanpath.points
+        for pres, (start_idx, end_idx) in zip(t2, table.tolist()):
             sp = copy.copy(self.scanpath)
-            # Event times are in msec, scanpaths know samples_per_second
-            start_idx = int(sp.samples_per_second*pres.start/1000.0)
-            end_idx = int(sp.samples_per_second*pres.end/1000.0)
-            sp.points = sp.points[start_idx:end_idx]
+            sp.points = points[start_idx:end_idx]
             pres.scanpath = sp
-            
-        return timeline.Timeline(t2)
+        return timeline.Timeline(
+            t2, index_table=table, indexed_scanpath=self.scanpath,
+            indexed_event_scanpaths=[pres.scanpath for pres in t2])
+
+    def index_table(self):
+        """
+        Return an (n_events, 2) int64 array holding the [start, end) indexes
+        of each event's points in scanpath, or None if scanpath's points
+        aren't in time order. It's only computed once for each timeline
+        and scanpath.
+        """
+        timeline, scanpath, table = self._indexed
+        if timeline is not self.timeline or scanpath is not self.scanpath:
+            if self.scanpath.uniformely_sampled:
+                table = self.__uniform_index_table()
+            else:
+                table = self.__nonuniform_index_table()
+            self._indexed = (self.timeline, self.scanpath, table)
+        return table
+
+    def __uniform_index_table(self):
+        """ Uniformly-sampled scanpaths: index by time (fast) """
+        starts = self.__sample_indexes([pres.start for pres in self.timeline])
+        ends = self.__sample_indexes([pres.end for pres in self.timeline])
+        return self.__slice_table(starts, ends)
+
+    def __nonuniform_index_table(self):
+        """
+        General case: a point belongs to an event if its time midpoint is
+        in [start, end).
+        """
+        midpoints = self.scanpath.time_midpoints()
+        if np.any(midpoints[1:] < midpoints[:-1]):
+            return None
+        starts = np.searchsorted(
+            midpoints, [pres.start for pres in self.timeline], 'left')
+        ends = np.searchsorted(
+            midpoints, [pres.end for pres in self.timeline], 'left')
+        return self.__slice_table(starts, ends)
+
+    def __slice_table(self, starts, ends):
+        """
+        Turn starts and ends into the [start, end) ranges that slicing
+        scanpath with them would really give.
+        """
+        n = len(self.scanpath)
+        table = np.zeros((len(starts), 2), dtype=np.int64)
+        for i, (s, e) in enumerate(zip(starts, ends)):
+            s, e, step = slice(int(s), int(e)).indices(n)
+            table[i] = (s, max(s, e))
+        return table
+
+    def __sample_indexes(self, times):
+        """
+        Return the index of the sample that was being shown at each of
+        times (in msec) -- the first sample that ends after it.
+
+        If the scanpath's time column shows no dropped samples, that's
+        just samples_per_second * time; otherwise, we look the times up
+        in the time column.
+        """
+        sps = self.scanpath.samples_per_second
+        times = np.asarray(times, dtype=float)
+        sample_times = self.__gappy_sample_times()
+        if sample_times is None:
+            return (sps*times/1000.0).astype(int)
+        return np.searchsorted(sample_times, times - 1000.0/sps, 'right')
+
+    def __gappy_sample_times(self):
+        """
+        Return the scanpath's time column if it's sorted but shows dropped
+        samples -- it doesn't start within a sample period of 0, or
+        skips more than half a period somewhere. Otherwise, return None.
+        The tracker's clock drifting against samples_per_second isn't a
+        gap.
+        """
+        if 'time' not in self.scanpath.measures:
+            return None
+        period = 1000.0/self.scanpath.samples_per_second
+        t = self.scanpath.as_array(('time',))[:,0]
+        if len(t) == 0 or (abs(t[0]) < period and
+                np.all(np.diff(t) < 1.5*period)):
+            return None
+        if np.any(t[1:] < t[:-1]):
+            return None
+        return t
     
-    def __viewings_nonuniform(self):
-        """ General case: extract viewings for nonuniform paths """
+    def __viewings_unsorted(self):
+        """ For scanpaths whose points are out of time order """
         t2 = copy.copy(self.timeline)
         for pres in t2:
             sp = copy.copy(self.scanpath)
@@ -6,6 +6,10 @@
 # Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
+import os.path
+import shutil
+import tempfile
+import numpy as np
 from gazehound.filters import iview
 
 from .. import mock_objects
@@ -86,6 +90,27 @@ class TestDeblink(object):
         eq_(6600, blinks[0].end)
 
 
+    def test_blink_indexes_match_blinks(self):
+        for sp in (self.points, mock_objects.iview_problem_blink()):
+            starts, ends = self.deblink.blink_indexes(sp)
+            blinks = self.deblink.blinks(sp)
+            eq_([b.start_index for b in blinks], list(starts))
+            eq_([b.end_index for b in blinks], list(ends))
+
+    def test_deblink_copies_blink_by_blink(self):
+        # Overlapping blinks: the later one copies what the earlier one did
+        self.deblink.min_duration = 0
+        sp = self.points
+        deblinked = self.deblink.deblink(sp)
+        expected = sp.points.copy()
+        cols = sp.measure_indexes(sp.interpolable_measures)
+        for b in self.deblink.blinks(sp):
+            if b.start_index > 0:
+                for i in range(b.start_index, b.end_index+1):
+                    expected[i, cols] = expected[b.start_index-1, cols]
+        assert np.array_equal(expected, deblinked.points)
+
+
 class TestOutofboundsDenoiser(object):
     def setup(self):
         self.sp = mock_objects.iview_scanpath_oob()
@@ -133,3 +158,39 @@ class TestDenoiseFilter(object):
         t_idx = self.points.measure_index('time')
         eq_(self.points[0][t_idx], self.filtered[0][t_idx])
         eq_(self.points[2][t_idx], self.filtered[2][t_idx])
+
+    def test_denoise_to_out_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(tmp_dir, "denoised.npy")
+            mapped = self.flt.process(self.points, out_file=out_file)
+            assert isinstance(mapped.points, np.memmap)
+            assert np.array_equal(self.filtered.points, mapped.points)
+            assert np.array_equal(self.filtered.points, np.load(out_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_denoise_in_place(self):
+        sp = iview.working_copy(self.points)
+        assert sp.points is not self.points.points
+        assert self.flt.process_in_place(sp) is sp
+        assert np.array_equal(self.filtered.points, sp.points)
+
+    def test_interp_columns_matches_np_interp(self):
+        points = np.array([
+            [1., 5., 9.],
+            [0., 6., 0.],
+            [0., 0., 7.],
+            [4., 8., 0.],
+            [5., 0., 0.]])
+        self.flt._interp_columns(points, [0, 1, 2], points == 0)
+        eq_([1., 2., 3., 4., 5.], list(points[:,0]))
+        eq_([5., 6., 7., 8., 0.], list(points[:,1]))
+        eq_(list(np.interp([1], [0, 2], [9, 7])), [points[1,2]])
+        # Runs at the end are left alone
+        eq_([0., 0.], list(points[3:,2]))
+
+    def test_leading_runs_interpolate_from_last_point(self):
+        arr = np.array([0., 0., 6., 3.])
+        self.flt._interp_masked(arr, arr == 0)
+        eq_(list(np.interp([0, 1], [-1, 2], [3., 6.])), list(arr[:2]))
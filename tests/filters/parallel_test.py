@@ -0,0 +1,111 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+
+import os.path
+import shutil
+import tempfile
+import cPickle as pickle
+import numpy as np
+from gazehound import gazepoint
+from gazehound.filters import iview, parallel, pipeline, saccade
+
+from .. import mock_objects
+from nose.tools import eq_
+
+
+def long_blinky(copies=6):
+    """ The blinky scanpath, over and over, with time going on """
+    sp = mock_objects.iview_scanpath_blinky()
+    t_idx = sp.measure_index('time')
+    span = sp.points[-1, t_idx] + 17
+    blocks = []
+    for i in range(copies):
+        block = np.array(sp.points)
+        block[:,t_idx] += i*span
+        blocks.append(block)
+    return gazepoint.IViewScanpath(60, np.vstack(blocks), sp.measures)
+
+
+class TestParallelPipeline(object):
+    def setup(self):
+        self.sp = long_blinky()
+        self.stages = [
+            iview.OutofboundsDenoiser(
+                measure_bounds = (('x', (0, 800)), ('y', (0, 600)))),
+            iview.Denoise(),
+            iview.Deblink(start_dy_threshold=20, end_dy_threshold=20)]
+
+    def test_matches_serial_filters(self):
+        for stages in ([s] for s in self.stages):
+            expected = pipeline.FilterPipeline(stages).process(self.sp).points
+            for chunk_samples in (2, 7, 25):
+                got = parallel.ParallelPipeline(stages, jobs=2,
+                    chunk_samples=chunk_samples).process(self.sp).points
+                eq_(expected.tostring(), got.tostring())
+
+    def test_matches_serial_pipeline(self):
+        expected = pipeline.FilterPipeline(self.stages).process(self.sp)
+        got = parallel.ParallelPipeline(self.stages, jobs=2,
+            chunk_samples=10).process(self.sp)
+        eq_(expected.points.tostring(), got.points.tostring())
+        eq_(long_blinky().points.tostring(), self.sp.points.tostring())
+
+    def test_to_out_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(tmp_dir, "cleaned.npy")
+            mapped = parallel.ParallelPipeline(self.stages, jobs=2,
+                chunk_samples=10).process(self.sp, out_file=out_file)
+            assert isinstance(mapped.points, np.memmap)
+            expected = pipeline.FilterPipeline(self.stages).process(self.sp)
+            assert np.array_equal(expected.points, np.load(out_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_serial_stages_start_no_pool(self):
+        parallel.close_pools()
+        stage = pipeline.Recenter(mock_objects.simple_timeline_for_blinky(),
+            'stim1', 400, 300)
+        expected = pipeline.FilterPipeline([stage]).process(self.sp)
+        got = parallel.ParallelPipeline([stage], jobs=2,
+            chunk_samples=10).process(self.sp)
+        eq_(expected.points.tostring(), got.points.tostring())
+        eq_({}, parallel._pools)
+
+    def test_pool_is_shared(self):
+        parallel.close_pools()
+        pl = parallel.ParallelPipeline(self.stages, jobs=2, chunk_samples=10)
+        pl.process(self.sp)
+        pool = parallel.shared_pool(2)
+        pl.process(self.sp)
+        saccade.sgolay_columns(self.sp.as_array(('x', 'y')), 7, 2, 1,
+            jobs=2, chunk_samples=10)
+        assert parallel.shared_pool(2) is pool
+        eq_(1, len(parallel._pools))
+
+    def test_chunk_bounds(self):
+        eq_([(0, 3), (3, 6), (6, 10)], parallel.chunk_bounds(10, 3))
+        eq_([(0, 5)], parallel.chunk_bounds(5, 10))
+        eq_([(0, 2), (2, 5)], parallel.chunk_bounds(5, 1))
+
+    def test_deblink_pickles_without_leftovers(self):
+        deblink = iview.Deblink()
+        deblink.blinks(self.sp)
+        restored = pickle.loads(pickle.dumps(deblink))
+        eq_(deblink.max_duration, restored.max_duration)
+        eq_([], [name for name in restored.__dict__ if 'arr' in name])
+
+
+class TestSgolayColumns(object):
+    def test_matches_serial_sgolay(self):
+        arr = long_blinky().as_array(('x', 'y'))
+        expected = np.apply_along_axis(saccade.sgolay, 0, arr, 7, 2, 1)
+        for chunk_samples in (2, 9, 40):
+            got = saccade.sgolay_columns(arr, 7, 2, 1, jobs=2,
+                chunk_samples=chunk_samples)
+            eq_(expected.tostring(), got.tostring())
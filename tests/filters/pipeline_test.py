@@ -0,0 +1,100 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+
+import os.path
+import shutil
+import tempfile
+import numpy as np
+from gazehound import viewing
+from gazehound.filters import iview, pipeline
+
+from .. import mock_objects
+from nose.tools import eq_
+from ..testutils import gt_
+
+class TestFilterPipeline(object):
+    def setup(self):
+        self.points = mock_objects.iview_scanpath_blinky()
+        self.raw = self.points.points.copy()
+        self.oob = iview.OutofboundsDenoiser(
+            measure_bounds = (('x', (0, 800)), ('y', (0, 600))))
+        self.denoise = iview.Denoise()
+        self.deblink = iview.Deblink(
+            start_dy_threshold=20, end_dy_threshold=20)
+        self.timeline = mock_objects.simple_timeline_for_blinky()
+
+    def chained(self):
+        return self.deblink.deblink(
+            self.denoise.process(self.oob.process(self.points)))
+
+    def test_pipeline_matches_chained_filters(self):
+        pl = pipeline.FilterPipeline([self.oob, self.denoise, self.deblink])
+        assert np.array_equal(self.chained().points,
+            pl.process(self.points).points)
+        assert np.array_equal(self.raw, self.points.points)
+        eq_(None, pl.provenance)
+
+    def test_pipeline_to_out_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(tmp_dir, "cleaned.npy")
+            pl = pipeline.FilterPipeline([self.denoise, self.deblink])
+            mapped = pl.process(self.points, out_file=out_file)
+            assert isinstance(mapped.points, np.memmap)
+            assert np.array_equal(
+                self.deblink.deblink(self.denoise.process(self.points)).points,
+                np.load(out_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_provenance_lists_changed_samples(self):
+        pl = pipeline.FilterPipeline(
+            [self.oob, self.denoise, self.deblink], track_changes=True)
+        cleaned = pl.process(self.points)
+        eq_([self.oob, self.denoise, self.deblink],
+            [stage for stage, changed in pl.provenance])
+        before = self.oob.process(self.points).points
+        after = self.denoise.process(self.oob.process(self.points)).points
+        eq_(list(np.flatnonzero(np.any(before <> after, axis=1))),
+            list(pl.provenance[1][1]))
+        eq_(list(np.flatnonzero(np.any(after <> cleaned.points, axis=1))),
+            list(pl.provenance[2][1]))
+        gt_(len(pl.provenance[2][1]), 0)
+
+    def test_changed_samples_ignores_nans(self):
+        before = np.array([[1., np.nan], [2., 3.], [np.nan, 4.]])
+        after = np.array([[1., np.nan], [2., 5.], [6., 4.]])
+        eq_([1, 2], list(pipeline.changed_samples(before, after)))
+
+
+class TestRecenter(object):
+    def setup(self):
+        self.points = mock_objects.iview_scanpath_blinky()
+        self.timeline = mock_objects.simple_timeline_for_blinky()
+
+    def test_recenter_matches_timeline_recenter_on(self):
+        expected = viewing.Combiner(
+            timeline=self.timeline, scanpath=self.points
+        ).viewings().recenter_on('stim1', 400, 300)
+        pl = pipeline.FilterPipeline(
+            [pipeline.Recenter(self.timeline, 'stim1', 400, 300)])
+        recentered = viewing.Combiner(
+            timeline=self.timeline, scanpath=pl.process(self.points)
+        ).viewings()
+        for exp, pres in zip(expected, recentered):
+            assert np.array_equal(exp.scanpath.points, pres.scanpath.points)
+
+    def test_recenter_leaves_samples_outside_events_alone(self):
+        recentered = pipeline.Recenter(self.timeline, 'stim1', 400, 300
+            ).process_in_place(iview.working_copy(self.points))
+        ids = viewing.Combiner(timeline=self.timeline, scanpath=self.points
+            ).viewings().sample_event_ids()
+        outside = ids < 0
+        gt_(np.sum(outside), 0)
+        assert np.array_equal(self.points.points[outside],
+            recentered.points[outside])
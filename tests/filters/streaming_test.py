@@ -0,0 +1,125 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+
+import numpy as np
+from gazehound.filters import iview, pipeline, streaming
+
+from .. import mock_objects
+from nose.tools import eq_
+from ..testutils import lte_
+
+
+def blocks_of(points, sizes):
+    """ Split points into blocks, cycling through sizes """
+    blocks = []
+    i = 0
+    while i < len(points):
+        size = sizes[len(blocks) % len(sizes)]
+        blocks.append(points[i:i+size])
+        i += size
+    return blocks
+
+
+def streamed(stages, sp, sizes):
+    pl = streaming.StreamPipeline(stages, sp.measures)
+    return np.vstack(list(pl.filter_blocks(blocks_of(sp.points, sizes))))
+
+
+BLOCK_SIZES = [[1], [2], [3, 1], [5, 0, 2], [7], [1000]]
+
+
+class TestDeblinkStream(object):
+    def setup(self):
+        self.deblink = iview.Deblink(
+            start_dy_threshold=20, end_dy_threshold=20)
+
+    def test_matches_deblink_for_any_blocks(self):
+        for sp in (mock_objects.iview_scanpath_blinky(),
+                   mock_objects.iview_problem_blink()):
+            expected = self.deblink.deblink(sp).points
+            for sizes in BLOCK_SIZES:
+                assert np.array_equal(expected,
+                    streamed([self.deblink], sp, sizes)), sizes
+
+    def test_holds_back_no_more_than_max_duration(self):
+        sp = mock_objects.iview_scanpath_blinky()
+        stream = streaming.DeblinkStream(self.deblink, sp.measures)
+        t_idx = sp.measure_index('time')
+        returned = 0
+        for i in range(len(sp)):
+            returned += len(stream.push(sp.points[i:i+1]))
+            if returned < i + 1:
+                # Allow for the couple of points after a blink's end
+                lte_(sp[i][t_idx] - sp[returned][t_idx],
+                    self.deblink.max_duration + 2*17)
+        eq_(len(sp), returned + len(stream.finish()))
+
+
+class TestDenoiseStream(object):
+    def setup(self):
+        self.noisy = mock_objects.iview_points_noisy()
+        self.oob = mock_objects.iview_scanpath_oob()
+        self.denoise = iview.Denoise(max_noise_samples=2)
+        self.oob_filter = iview.OutofboundsDenoiser(
+            measure_bounds = (('x', (0, 800)), ('y', (0, 600))),
+            max_noise_samples=4)
+
+    def test_denoise_matches_for_any_blocks(self):
+        expected = self.denoise.process(self.noisy).points
+        for sizes in BLOCK_SIZES:
+            assert np.array_equal(expected,
+                streamed([self.denoise], self.noisy, sizes)), sizes
+
+    def test_oob_matches_for_any_blocks(self):
+        expected = self.oob_filter.process(self.oob).points
+        for sizes in BLOCK_SIZES:
+            assert np.array_equal(expected,
+                streamed([self.oob_filter], self.oob, sizes)), sizes
+
+    def test_oob_filtering_a_measure_twice(self):
+        flt = iview.OutofboundsDenoiser(
+            measure_bounds = (('x', (0, 800)), ('x', (0, 540))),
+            max_noise_samples=4)
+        eq_(2, len(streaming.streams_for(flt, self.oob.measures)))
+        expected = flt.process(self.oob).points
+        for sizes in BLOCK_SIZES:
+            assert np.array_equal(expected,
+                streamed([flt], self.oob, sizes)), sizes
+
+    def test_holds_back_no_more_than_max_noise_samples(self):
+        stream = streaming.DenoiseStream(self.denoise, self.noisy.measures)
+        returned = 0
+        for i in range(len(self.noisy)):
+            returned += len(stream.push(self.noisy.points[i:i+1]))
+            lte_(i + 1 - returned, self.denoise.max_noise_samples)
+        eq_(len(self.noisy), returned + len(stream.finish()))
+
+    def test_leading_runs_are_left_alone(self):
+        measures = ('time', 'x')
+        points = np.array([[0., 0.], [1., 0.], [2., 6.], [3., 3.]])
+        stream = streaming.DenoiseStream(self.denoise, measures)
+        out = np.vstack((stream.push(points), stream.finish()))
+        eq_([0., 0., 6., 3.], list(out[:,1]))
+
+
+class TestStreamPipeline(object):
+    def test_matches_filter_pipeline(self):
+        sp = mock_objects.iview_scanpath_blinky()
+        stages = [
+            iview.OutofboundsDenoiser(
+                measure_bounds = (('x', (0, 800)), ('y', (0, 600)))),
+            iview.Denoise(),
+            iview.Deblink(start_dy_threshold=20, end_dy_threshold=20)]
+        expected = pipeline.FilterPipeline(stages).process(sp).points
+        for sizes in BLOCK_SIZES:
+            assert np.array_equal(expected, streamed(stages, sp, sizes))
+
+    def test_empty_stream(self):
+        pl = streaming.StreamPipeline([iview.Denoise(), iview.Deblink()],
+            mock_objects.iview_scanpath_blinky().measures)
+        eq_([], list(pl.filter_blocks([])))
@@ -6,6 +6,9 @@
 # Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
+import os.path
+import shutil
+import tempfile
 from gazehound import gazepoint, shapes
 import numpy as np
 
@@ -98,6 +101,36 @@ class TestPointFactory(object):
             for mapping in nones:
                 assert not hasattr(point, mapping[0])
                 
+    def test_factory_reports_unparseable_points(self):
+        bad = self.dense_gaze_ary + [['66', 'x', '400']]
+        try:
+            self.generic_factory.from_component_list(bad, self.dense_mapping)
+            assert False, "Should have raised ValueError"
+        except ValueError, e:
+            assert "'x'" in str(e)
+
+    def test_factory_raises_index_error_for_short_points(self):
+        assert_raises(IndexError, self.generic_factory.from_component_list,
+            self.dense_gaze_ary + [['66', '400']], self.dense_mapping)
+
+    def test_factory_sets_unknown_attributes(self):
+        import cPickle as pickle
+        mapping = self.dense_mapping[:2] + [('bogus', int)]
+        points = self.generic_factory.from_component_list(
+            self.dense_gaze_ary, mapping)
+        eq_(len(self.dense_gaze_ary), len(points))
+        for point, row in zip(points, self.dense_gaze_ary):
+            assert isinstance(point, gazepoint.Point)
+            eq_(int(row[2]), point.bogus)
+        restored = pickle.loads(pickle.dumps(points[0], 2))
+        eq_(points[0].bogus, restored.bogus)
+        eq_(points[0].x, restored.x)
+
+    def test_factory_keeps_slots_for_known_attributes(self):
+        points = self.generic_factory.from_component_list(
+            self.dense_gaze_ary, self.dense_mapping)
+        assert type(points[0]) is gazepoint.Point
+
 class TestIView2PointFactory(object):
     def setup(self):
         self.point_ary = mock_objects.iview_points_blinky()
@@ -111,6 +144,25 @@ class TestIView2PointFactory(object):
         points = self.iview_fact.from_component_list(self.point_ary)
         assert isinstance(points, np.ndarray)
 
+    def test_delimited_lines_match_component_list(self):
+        lines = ["\t".join(row) for row in self.point_ary]
+        expected = self.iview_fact.from_component_list(self.point_ary)
+        points = self.iview_fact.from_delimited_lines(lines)
+        eq_(expected.tolist(), points.tolist())
+
+    def test_delimited_lines_with_text_columns(self):
+        lines = ["\t".join(row) for row in self.point_ary]
+        lines = [l.replace("\t0\t", "\tSMP\t", 1) for l in lines]
+        expected = self.iview_fact.from_component_list(self.point_ary)
+        points = self.iview_fact.from_delimited_lines(lines)
+        eq_(expected.tolist(), points.tolist())
+
+    @raises(IndexError)
+    def test_delimited_lines_with_short_row_fails_like_csv(self):
+        lines = ["\t".join(row) for row in self.point_ary]
+        lines[3] = "\t".join(self.point_ary[3][:5])
+        self.iview_fact.from_delimited_lines(lines)
+
 
 class TestFixationFactory(object):
     def setup(self):
@@ -139,6 +191,74 @@ class TestFixationFactory(object):
         eq_(fixations[0].time, 18750)
         eq_(fixations[0].time_midpoint(), 18883)
 
+class TestFixationTable(object):
+    def setup(self):
+        self.fix_ary = mock_objects.smi_fixation_ary()
+        fact = gazepoint.IViewFixationFactory()
+        self.points = gazepoint.Scanpath(fact.from_component_list(self.fix_ary))
+        self.table = fact.table_from_component_list(self.fix_ary)
+
+    def test_table_has_every_fixation(self):
+        eq_(len(self.points), len(self.table))
+        eq_([p.time for p in self.points], self.table.points.time.tolist())
+        eq_(['1']*len(self.table), [p.object for p in self.table])
+
+    def test_records_are_small(self):
+        lt_(gazepoint.FixationTable.DTYPE.itemsize, 64)
+
+    def test_indexing_gives_points(self):
+        fix = self.table[0]
+        eq_(365, fix.x)
+        eq_(18750, fix.time)
+        eq_(18883, fix.time_midpoint())
+        eq_(1141, fix.end_num)
+
+    def test_slices_are_tables(self):
+        part = self.table[2:5]
+        assert isinstance(part, gazepoint.FixationTable)
+        eq_(self.table.points.time[2:5].tolist(), part.points.time.tolist())
+
+    def test_time_queries_match_point_scanpath(self):
+        assert np.array_equal(
+            self.points.time_midpoints(), self.table.time_midpoints())
+        for t in [0, 18750, 19000, 21000, 32117, 40000]:
+            eq_(self.points.time_index(t), self.table.time_index(t))
+        eq_(self.points.total_duration, self.table.total_duration)
+
+    def test_mean_and_median_match_point_scanpath(self):
+        assert np.array_equal(self.points.mean(), self.table.mean())
+        assert np.array_equal(self.points.median(), self.table.median())
+
+    def test_points_within(self):
+        r = shapes.Rectangle(300, 200, 500, 400)
+        eq_(len(self.points.points_within(r)),
+            len(self.table.points_within(r)))
+        eq_(len(self.table), len(self.table.points_within(None)))
+
+    def test_recenter_by_leaves_parent_alone(self):
+        moved = self.table.recenter_by(10, -5)
+        eq_(375, moved[0].x)
+        eq_(231, moved[0].y)
+        eq_(365, self.table[0].x)
+
+    def test_constrain_to(self):
+        clipped = self.table.constrain_to(max_x_const=(400, 400))
+        eq_([min(p.x, 400) for p in self.points], 
+            clipped.points.x.tolist())
+
+    def test_lists_of_points_are_converted(self):
+        sp = self.table[0:0]
+        sp.points = list(self.table)[3:5]
+        eq_(2, len(sp))
+        eq_(self.table[3].x, sp[0].x)
+        eq_('1', sp[1].object)
+
+    def test_bad_data_raises_value_error(self):
+        fact = gazepoint.IViewFixationFactory()
+        assert_raises(ValueError, fact.table_from_component_list,
+            [['1', '2', 'three', '4', '5', '6', '1', '7']])
+
+
 class TestScanpath(object):
     def setup(self):
         # Fields are:
@@ -320,7 +440,109 @@ class TestIViewScanpath(object):
             (400, 400), (300,300), (800, 800), (600,600))
         ar = constrained.as_array(('x'))
         eq_(0, np.sum(ar < 400))
-    
+
+    def test_recenter_moves_only_x_and_y(self):
+        moved = self.path.recenter_by(10, -20)
+        x_i, y_i = self.path.measure_indexes(('x', 'y'))
+        assert np.array_equal(self.path.points[:,x_i] + 10,
+            moved.points[:,x_i])
+        assert np.array_equal(self.path.points[:,y_i] - 20,
+            moved.points[:,y_i])
+        others = [i for i in range(len(self.path.measures))
+            if i not in (x_i, y_i)]
+        assert np.array_equal(self.path.points[:,others],
+            moved.points[:,others])
+
+    def test_changing_derived_points_leaves_parent_alone(self):
+        orig = self.path.points.copy()
+        moved = self.path.recenter_by(10, 10)
+        moved.points[:] = 0
+        assert np.array_equal(orig, self.path.points)
+
+    def test_changing_parent_points_leaves_derived_alone(self):
+        moved = self.path.recenter_by(10, 10)
+        clipped = moved.constrain_to(max_x_const=(400, 400))
+        unfiltered = moved.points_within(None)
+        derived = (moved, clipped, unfiltered)
+        expected = [sp.as_array() for sp in derived]
+        self.path.points[:] = 0
+        self.path[3][0] = -1
+        for sp, arr in zip(derived, expected):
+            assert np.array_equal(arr, sp.as_array())
+            assert np.array_equal(arr, sp.points)
+
+    def test_changing_parent_through_old_reference(self):
+        before = self.path.points
+        moved = self.path.recenter_by(10, 10)
+        expected = moved.as_array()
+        before[0,:] = 999
+        assert self.path.points is before
+        assert np.array_equal(expected, moved.points)
+
+    def test_changing_slice_leaves_derived_alone(self):
+        sliced = self.path[0:2]
+        moved = sliced.recenter_by(10, 10)
+        expected = moved.as_array()
+        sliced.points[0,:] = 999
+        eq_(999, self.path.points[0,0])
+        assert np.array_equal(expected, moved.points)
+
+    def test_chained_transforms_apply_in_order(self):
+        x_i = self.path.measure_index('x')
+        derived = self.path.recenter_by(100, 0).constrain_to(
+            (400, 400), (300,300), (800, 800), (600,600))
+        expected = self.path.points[:,x_i] + 100
+        expected[expected < 400] = 400
+        expected[expected > 800] = 800
+        assert np.array_equal(expected, derived.points[:,x_i])
+        assert np.array_equal(expected, derived.as_array(('x', 'x'))[:,1])
+
+    def test_points_within_keeps_offsets(self):
+        rect = shapes.Rectangle(300,500,360,600)
+        moved = self.path.recenter_by(5, 5)
+        eager = gazepoint.IViewScanpath(60, moved.points.copy(),
+            self.path.measures)
+        assert np.array_equal(eager.points_within(rect).points,
+            moved.points_within(rect).points)
+
+    def test_deepcopy_keeps_offsets(self):
+        import copy
+        moved = self.path.recenter_by(10, 10)
+        copied = copy.deepcopy(moved)
+        assert np.array_equal(moved.points, copied.points)
+        assert copied.points is not moved.points
+
+
+class TestMemmapScanpath(object):
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "points.npy")
+        self.path = gazepoint.IViewScanpath(
+            samples_per_second=60, points=mock_objects.iview_noisy_point_list(),
+            measures=gazepoint.IView2PointFactory().numeric_measures)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_to_memmap_copies_points(self):
+        mapped = self.path.to_memmap(self.filename)
+        assert isinstance(mapped.points, np.memmap)
+        assert np.array_equal(self.path.points, mapped.points)
+        mapped.points[0,0] = -1
+        neq_(-1, self.path.points[0,0])
+
+    def test_from_memmap_round_trips(self):
+        self.path.to_memmap(self.filename)
+        loaded = gazepoint.IViewScanpath.from_memmap(self.filename,
+            self.path.samples_per_second, self.path.measures)
+        assert np.array_equal(self.path.points, loaded.points)
+        eq_(self.path.measures, loaded.measures)
+
+    def test_memmap_slices_share_file(self):
+        mapped = self.path.to_memmap(self.filename)
+        sliced = mapped[1:3]
+        assert np.may_share_memory(mapped.points, sliced.points)
+
 class TestPoint(object):
     def __init__(self):
         super(TestPoint, self).__init__()
@@ -355,6 +577,29 @@ class TestPoint(object):
         eq_(100, p.y)
         eq_(50, p.time)
 
+    def test_points_have_no_dict(self):
+        assert not hasattr(self.hundreds, '__dict__')
+        assert_raises(AttributeError, setattr, self.hundreds, 'bogus', 1)
+
+    def test_copies_and_pickles(self):
+        import copy, pickle
+        self.hundreds.time = 10
+        for dup in [copy.copy(self.hundreds), copy.deepcopy(self.hundreds),
+                pickle.loads(pickle.dumps(self.hundreds)),
+                pickle.loads(pickle.dumps(self.hundreds, 2))]:
+            eq_((100, 100, 10, 1.0), (dup.x, dup.y, dup.time, dup.duration))
+            assert dup is not self.hundreds
+
+    def test_from_columns(self):
+        points = gazepoint.IViewPoint.from_columns(('time', 'x'),
+            [np.array([0, 17]), [300, 310]])
+        eq_([0, 17], [p.time for p in points])
+        eq_([300, 310], [p.x for p in points])
+        eq_(int, type(points[0].time))
+        eq_([None, None], [p.y for p in points])
+        eq_(1/60.0, points[1].duration)
+
+
 class TestIViewPoint(object):
     def __init__(self):
         super(TestIViewPoint, self).__init__()
@@ -9,6 +9,7 @@
 # Hooray for with / as blocks! I miss ruby though :(
 from __future__ import with_statement
 from os import path
+from gazehound.readers import auto_scanpath
 from gazehound.readers.auto_scanpath import AutoScanpathReader
 from gazehound.readers.iview import IView2ScanpathReader, IView3ScanpathReader
 
@@ -73,3 +74,60 @@ class TestAutoScanpath(object):
     def test_multi_reader_has_no_success_class_on_fail(self):
         app = self.ar_multi.read_scanpath(self.event_file)
         assert self.ar_multi.success_class is None
+
+    def test_sniffing_picks_one_class(self):
+        ar = AutoScanpathReader()
+        eq_([IView3ScanpathReader], ar.candidate_classes(self.iview_3_file))
+        eq_([IView2ScanpathReader], ar.candidate_classes(self.iview_2_file))
+
+    def test_sniffing_works_on_file_data(self):
+        with open(self.iview_3_file, 'rU') as f:
+            lines = f.readlines()
+        ar = AutoScanpathReader()
+        eq_([IView3ScanpathReader], ar.candidate_classes(file_data=lines))
+        eq_(15, len(ar.read_scanpath(file_data=lines)))
+
+    def test_trial_parses_when_no_sniffer_matches(self):
+        # A long comment pushes the version line out of the sniffed bytes
+        with open(self.iview_2_file, 'rU') as f:
+            lines = f.readlines()
+        padding = ["# padding\n"] * (auto_scanpath.SNIFF_BYTES // 10 + 1)
+        lines = padding + lines
+        ar = AutoScanpathReader()
+        sniff = auto_scanpath.sniffer_for(IView2ScanpathReader)
+        assert not sniff(ar.head_lines(file_data=lines))
+        app = ar.read_scanpath(file_data=lines)
+        mpp = IView2ScanpathReader(filename=self.iview_2_file).scanpath()
+        eq_(len(mpp), len(app))
+        eq_(IView2ScanpathReader, ar.success_class)
+
+    def test_registered_formats_are_tried(self):
+        class EventReader(object):
+            def __init__(self, filename=None, file_data=None):
+                self.filename = filename
+
+            def scanpath(self):
+                return []
+
+        def sniff(head):
+            return head[0].startswith("presented")
+
+        auto_scanpath.register_format(EventReader, sniff)
+        try:
+            ar = AutoScanpathReader()
+            eq_([], ar.read_scanpath(self.event_file))
+            eq_(EventReader, ar.success_class)
+        finally:
+            auto_scanpath.FORMATS.pop()
+
+    def test_read_header_sniffs_format(self):
+        h = auto_scanpath.read_header(self.iview_3_file)
+        eq_('IDF Converter 3.0.9', h['file_version'])
+        eq_(15, h['recorded_points'])
+        eq_(60, h['sample_rate'])
+
+    def test_read_header_returns_none_on_failure(self):
+        ar = AutoScanpathReader()
+        assert ar.read_header(self.event_file) is None
+        eq_(2, len(ar.failures))
+
@@ -0,0 +1,53 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+
+from os import path
+import numpy as np
+from gazehound import gazepoint
+from gazehound.readers import batch
+from gazehound.readers.iview import IView2ScanpathReader, IView3ScanpathReader
+from gazehound.readers.timeline import TimelineReader
+
+from ..testutils import *
+from nose.tools import *
+
+class TestBatchLoading(object):
+
+    def setup(self):
+        p = path.abspath(path.dirname(__file__))
+        self.iview_2_file = path.join(p, "../examples/iview_normal.txt")
+        self.iview_3_file = path.join(p, "../examples/iview_3_small.txt")
+        self.event_file = path.join(p, "../examples/pres_tiny.txt")
+        self.paths = [self.iview_3_file, self.event_file, self.iview_2_file]
+
+    def test_load_many_keeps_order(self):
+        loaded = batch.load_many(self.paths, jobs=2)
+        eq_(3, len(loaded))
+        assert isinstance(loaded[0], gazepoint.IView3Scanpath)
+        assert loaded[1] is None
+        assert isinstance(loaded[2], gazepoint.IViewScanpath)
+
+    def test_load_many_matches_serial_reads(self):
+        loaded = batch.load_many(self.paths, jobs=2)
+        expected = IView2ScanpathReader(filename=self.iview_2_file).scanpath()
+        eq_(expected.points.tolist(), loaded[2].points.tolist())
+        eq_(expected.headers, loaded[2].headers)
+        eq_(expected.measures, loaded[2].measures)
+        eq_(expected.samples_per_second, loaded[2].samples_per_second)
+
+    def test_load_many_in_process(self):
+        loaded = batch.load_many(self.paths, jobs=1)
+        eq_([15, None, 13], [sp and len(sp) for sp in loaded])
+
+    def test_load_timelines(self):
+        loaded = batch.load_timelines([self.event_file]*3, jobs=2)
+        expected = TimelineReader(filename=self.event_file).timeline
+        eq_(3, len(loaded))
+        for tl in loaded:
+            eq_([e.name for e in expected], [e.name for e in tl])
+            eq_([e.start for e in expected], [e.start for e in tl])
@@ -0,0 +1,116 @@
+# coding: utf8
+# Part of the gazehound package for analzying eyetracking data
+#
+# Copyright (c) 2010 Board of Regents of the University of Wisconsin System
+#
+# Written by Nathan Vack <njvack@wisc.edu> at the Waisman Laborotory
+# for Brain Imaging and Behavior, University of Wisconsin - Madison.
+
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+from os import path
+import numpy as np
+from gazehound import gazepoint
+from gazehound.readers.auto_scanpath import AutoScanpathReader
+from gazehound.readers.cache import ScanpathCache
+from gazehound.readers.iview import IView2ScanpathReader, IView3ScanpathReader
+
+from ..testutils import *
+from nose.tools import *
+
+class TestScanpathCache(object):
+
+    def setup(self):
+        p = path.abspath(path.dirname(__file__))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.iview_2_file = path.join(self.tmp_dir, "iview_normal.txt")
+        self.iview_3_file = path.join(self.tmp_dir, "iview_3_small.txt")
+        shutil.copy(path.join(p, "../examples/iview_normal.txt"),
+            self.iview_2_file)
+        shutil.copy(path.join(p, "../examples/iview_3_small.txt"),
+            self.iview_3_file)
+        self.cache = ScanpathCache()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_returns_none_when_empty(self):
+        assert self.cache.load(self.iview_2_file) is None
+
+    def test_read_writes_sidecars(self):
+        self.cache.read(self.iview_2_file, IView2ScanpathReader)
+        for sidecar in self.cache.sidecar_paths(self.iview_2_file):
+            assert path.isfile(sidecar)
+
+    def test_cached_scanpath_matches(self):
+        expected = self.cache.read(self.iview_3_file, IView3ScanpathReader)
+        cached = self.cache.load(self.iview_3_file)
+        assert isinstance(cached, gazepoint.IView3Scanpath)
+        assert isinstance(cached.points, np.memmap)
+        eq_(expected.points.tolist(), cached.points.tolist())
+        eq_(expected.measures, cached.measures)
+        eq_(expected.headers, cached.headers)
+        eq_(expected.samples_per_second, cached.samples_per_second)
+
+    def test_changed_file_is_stale(self):
+        self.cache.read(self.iview_2_file, IView2ScanpathReader)
+        with open(self.iview_2_file, 'a') as f:
+            f.write("\n200\t0\t1\t2\t3\t4\t5\t6\t7\t8\n")
+        assert self.cache.load(self.iview_2_file) is None
+        eq_(14, len(self.cache.read(self.iview_2_file, IView2ScanpathReader)))
+
+    def _update_meta(self, filename, **values):
+        meta_path = self.cache.sidecar_paths(filename)[1]
+        meta = pickle.load(open(meta_path, 'rb'))
+        meta.update(values)
+        with open(meta_path, 'wb') as f:
+            pickle.dump(meta, f)
+
+    def test_rewrite_in_the_same_tick_is_stale(self):
+        self.cache.read(self.iview_2_file, IView2ScanpathReader)
+        contents = open(self.iview_2_file, 'rb').read()
+        with open(self.iview_2_file, 'wb') as f:
+            f.write(contents.replace("\t5059\t", "\t5060\t"))
+        # Pretend the rewrite landed in the same mtime tick as the sidecar.
+        self._update_meta(self.iview_2_file,
+            mtime=os.stat(self.iview_2_file).st_mtime)
+        assert self.cache.load(self.iview_2_file) is None
+
+    def test_replaced_file_is_hashed(self):
+        self.cache.read(self.iview_2_file, IView2ScanpathReader)
+        replacement = self.iview_2_file + ".new"
+        shutil.copy(self.iview_2_file, replacement)
+        os.rename(replacement, self.iview_2_file)
+        # Same mtime, long since written; only the inode differs.
+        mtime = os.stat(self.iview_2_file).st_mtime
+        self._update_meta(self.iview_2_file, mtime=mtime, written=mtime + 60)
+        hashed = []
+        self.cache.content_hash = lambda fn: hashed.append(fn) or \
+            ScanpathCache.content_hash(self.cache, fn)
+        assert self.cache.load(self.iview_2_file) is not None
+        eq_([self.iview_2_file], hashed)
+
+    def test_touched_file_is_fresh(self):
+        self.cache.read(self.iview_2_file, IView2ScanpathReader)
+        st = os.stat(self.iview_2_file)
+        os.utime(self.iview_2_file, (st.st_atime, st.st_mtime + 10))
+        assert self.cache.load(self.iview_2_file) is not None
+
+    def test_cache_dir(self):
+        cache_dir = path.join(self.tmp_dir, "cache")
+        os.mkdir(cache_dir)
+        cache = ScanpathCache(cache_dir)
+        cache.read(self.iview_2_file, IView2ScanpathReader)
+        eq_(2, len(os.listdir(cache_dir)))
+        assert cache.load(self.iview_2_file) is not None
+
+    def test_auto_reader_uses_cache(self):
+        AutoScanpathReader(cache=self.cache).read_scanpath(self.iview_3_file)
+        ar = AutoScanpathReader(cache=self.cache)
+        sp = ar.read_scanpath(self.iview_3_file)
+        eq_(IView3ScanpathReader, ar.success_class)
+        eq_(0, len(ar.failures))
+        assert isinstance(sp.points, np.memmap)
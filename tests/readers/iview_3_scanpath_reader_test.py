@@ -70,7 +70,35 @@ class TestIView3ScanpathReader(object):
         ts_idx = pp.measures.index('timestamp')
         eq_(1776229331031, pp[0][ts_idx])
     
+    def test_scanpath_times_are_msec_from_start(self):
+        ir = IView3ScanpathReader(self.point_lines)
+        pp = ir.scanpath()
+        times = pp.as_array(('time',))[:,0]
+        eq_(0, times[0])
+        eq_((1776229347727 - 1776229331031)/1000.0, times[1])
+        ts_idx = pp.measures.index('timestamp')
+        eq_(1776229347727, pp[1][ts_idx])
+
     def test_scanpath_gets_headers(self):
         ir = IView3ScanpathReader(self.point_lines)
         pp = ir.scanpath()
-        eq_(pp.headers['file_version'], 'IDF Converter 3.0.9')
\ No newline at end of file
+        eq_(pp.headers['file_version'], 'IDF Converter 3.0.9')
+
+    def test_streaming_scanpath_matches(self):
+        ir = IView3ScanpathReader(filename=self.point_file, streaming=True)
+        eq_(self.EXPECTED_COMMENTS, len(ir.comment_lines))
+        includes_(ir.column_headers, 'Time')
+        pp = ir.scanpath()
+        expected = IView3ScanpathReader(self.point_lines).scanpath()
+        eq_(expected.points.tolist(), pp.points.tolist())
+
+    def test_streaming_header_only_file(self):
+        header_lines = [l for l in self.point_lines if l.startswith("##")]
+        ir = IView3ScanpathReader(header_lines, streaming=True)
+        eq_(self.EXPECTED_COMMENTS, len(ir.comment_lines))
+        eq_([], ir.column_headers)
+        pp = ir.scanpath()
+        eq_(0, len(pp))
+        eq_(60, pp.samples_per_second)
+        expected = IView3ScanpathReader(header_lines).scanpath()
+        eq_(sorted(expected.measures), sorted(pp.measures))
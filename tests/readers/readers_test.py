@@ -9,6 +9,7 @@
 # Hooray for with / as blocks! I miss ruby though :(
 from __future__ import with_statement
 from os import path
+from gazehound import gazepoint
 from gazehound.readers.delimited import DelimitedReader
 from gazehound.readers.iview import IView2ScanpathReader, IViewFixationReader
 from gazehound.readers.timeline import TimelineReader
@@ -25,7 +26,7 @@ class TestDelimitedReader(object):
             p, "../examples/iview_normal.txt")
         self.blank_comment_file = path.join(
             p, "../examples/iview_blank_comment.txt")
-        self.comment_inbody = path.join(
+        self.comment_inbody_file = self.comment_inbody = path.join(
             p, "../examples/iview_comment_inbody.txt")
         
         with open(self.norm_file) as f:
@@ -85,6 +86,46 @@ class TestDelimitedReader(object):
         dr = DelimitedReader(self.norm_lines,
             skip_comments = True, comment_char = "#", skip_lines=1)
         eq_(len(dr.comment_lines), (self.COMMENT_LINES-1))
+
+    def test_streaming_reader_reads_comments_without_content(self):
+        dr = DelimitedReader(filename = self.norm_file, streaming = True)
+        eq_(len(dr.comment_lines), self.COMMENT_LINES)
+        assert dr._stream_file is not None
+        dr.close()
+
+    def test_streaming_reader_yields_same_rows(self):
+        dr = DelimitedReader(filename = self.norm_file, streaming = True)
+        eq_(list(DelimitedReader(self.norm_lines)), list(dr))
+
+    def test_streaming_reader_skips_comments_in_body(self):
+        dr = DelimitedReader(filename = self.comment_inbody_file,
+            streaming = True)
+        eq_(len(list(dr)), len(DelimitedReader(self.comment_inbody)))
+
+    def test_streaming_reader_blocks(self):
+        dr = DelimitedReader(filename = self.norm_file, streaming = True)
+        blocks = list(dr.blocks(5))
+        eq_([5, 5, 3], [len(b) for b in blocks])
+
+    def test_abandoned_streaming_blocks_close_the_file(self):
+        dr = DelimitedReader(filename = self.norm_file, streaming = True)
+        blocks = dr.blocks(5)
+        blocks.next()
+        assert dr._stream_file is not None
+        blocks.close()
+        assert dr._stream_file is None
+
+    def test_dropped_streaming_lines_close_the_file(self):
+        dr = DelimitedReader(filename = self.norm_file, streaming = True)
+        lines = dr.lines()
+        lines.next()
+        assert dr._stream_file is not None
+        del lines
+        assert dr._stream_file is None
+
+    @raises(TypeError)
+    def test_streaming_reader_has_no_len(self):
+        len(DelimitedReader(filename = self.norm_file, streaming = True))
         
         
 class TestIView2ScanpathReader(object):
@@ -131,6 +172,18 @@ class TestIView2ScanpathReader(object):
         h = ir.header()
         
         eq_(h.get('calibration_size'), [800,600])
+
+    def test_header_is_computed_once(self):
+        ir = IView2ScanpathReader(self.norm_lines)
+        h = ir.header()
+        h['sample_rate'] = 0
+        ir.comment_lines[:] = []
+        eq_(60, ir.header()['sample_rate'])
+
+    def test_read_header_matches_header(self):
+        h = IView2ScanpathReader.read_header(self.norm_file)
+        eq_(IView2ScanpathReader(self.norm_lines).header(), h)
+        eq_(13, h['recorded_points'])
     
     def test_scanpath_returns_expected_points(self):
         ir = IView2ScanpathReader(self.norm_lines)
@@ -143,6 +196,17 @@ class TestIView2ScanpathReader(object):
         scanpath = ir.scanpath()
         eq_(scanpath.headers['file_version'], '2')
 
+    def test_streaming_scanpath_matches(self):
+        ir = IView2ScanpathReader(filename = self.norm_file, streaming = True)
+        scanpath = ir.scanpath()
+        expected = IView2ScanpathReader(self.norm_lines).scanpath()
+        eq_(expected.points.tolist(), scanpath.points.tolist())
+        eq_(expected.headers, scanpath.headers)
+
+    def test_point_blocks(self):
+        ir = IView2ScanpathReader(filename = self.norm_file, streaming = True)
+        eq_([(10, 9), (3, 9)], [b.shape for b in ir.point_blocks(10)])
+
 
 class TestIViewFixationReader(object):
     """Exercise the IViewFixationReader"""
@@ -165,6 +229,13 @@ class TestIViewFixationReader(object):
         eq_(len(fr), self.EXPECTED_FIXATIONS)
         
         
+    def test_scanpath_is_fixation_table(self):
+        sp = IViewFixationReader(self.fixation_lines).scanpath()
+        assert isinstance(sp, gazepoint.FixationTable)
+        eq_(self.EXPECTED_FIXATIONS, len(sp))
+        eq_(238, sp[3].x)
+        eq_(2600, sp[-1].duration)
+
     def test_basic_header_parsing(self):
         fr = IViewFixationReader(self.fixation_lines)
         
@@ -177,6 +248,19 @@ class TestIViewFixationReader(object):
 
         eq_(h.get('calibration_size'), [800,600])
 
+    def test_read_header(self):
+        h = IViewFixationReader.read_header(self.fix_file)
+        eq_(self.EXPECTED_FIXATIONS, h['recorded_fixations'])
+
+    def test_point_blocks(self):
+        fr = IViewFixationReader(filename=self.fix_file, streaming=True)
+        blocks = list(fr.point_blocks(3))
+        eq_([3, 3, 2], [len(b) for b in blocks])
+        assert all(isinstance(b, gazepoint.FixationTable) for b in blocks)
+        sp = IViewFixationReader(self.fixation_lines).scanpath()
+        eq_([p.x for p in sp], [p.x for b in blocks for p in b])
+        eq_([p.object for p in sp], [p.object for b in blocks for p in b])
+
 class TestTimelineReader(object):
     """ Exercise the TimelineReader """
     
@@ -196,4 +280,8 @@ class TestTimelineReader(object):
     def test_reader_read_convenience(self):
         tr = TimelineReader(filename = self.pres_file)
         eq_(len(tr), self.CONTENT_LINES)
+
+    def test_streaming_reader_makes_events(self):
+        tr = TimelineReader(filename = self.pres_file, streaming = True)
+        eq_(self.CONTENT_LINES, len(tr.events))
         
\ No newline at end of file
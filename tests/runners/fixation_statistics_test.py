@@ -8,11 +8,13 @@
 
 from __future__ import with_statement
 from gazehound.runners import fixation_statistics
-from gazehound import viewing
+from gazehound import viewing, shapes, gazepoint
 from ..testutils import includes_
 from nose.tools import *
 from .. import mock_objects
 import os
+import copy
+import math
 import StringIO
 
 class TestFixationStatsOptionParser(object):
@@ -138,3 +140,53 @@ class TestFixationStatisticsAnalyzer(object):
         eq_(stats.start_ms, 18750)
         eq_(stats.end_ms, 34717)
         
+
+    def test_shape_stats_sum_time_in_each_shape(self):
+        pres = self.timeline[1]
+        pres.shapes = [shapes.Rectangle(0, 0, 400, 300, name='tl'),
+            shapes.Ellipse(400, 300, 200, 150, name='mid'),
+            shapes.Rectangle(0, 0, 0, 0, name='none')]
+        stats = self.gsa.shape_stats(pres)
+        eq_(['tl', 'mid', 'none'], [st.area for st in stats])
+        for s, st in zip(pres.shapes, stats):
+            eq_(sum(p.duration for p in pres.scanpath if (p.x, p.y) in s),
+                st.time_in)
+
+
+    def test_timeline_stats_match_per_event_stats(self):
+        self.timeline.has_shapes = True
+        for pres in self.timeline:
+            pres.shapes = [shapes.Rectangle(0, 0, 400, 300, name='tl'),
+                shapes.Ellipse(400, 300, 200, 150, name='mid')]
+        fast = self.gsa.timeline_stats()
+        self.gsa.timeline = copy.copy(self.timeline)
+        self.gsa.timeline.index_table = None
+        slow = self.gsa.timeline_stats()
+        eq_(3*len(self.timeline), len(fast))
+        eq_([vars(st) for st in slow], [vars(st) for st in fast])
+        eq_([type(st.time_in) for st in slow],
+            [type(st.time_in) for st in fast])
+
+    def test_distance_between_fixations(self):
+        stats = self.gsa.general_stats()
+        points = self.scanpath.points
+        dists = [math.sqrt((p1.x-p2.x)**2 + (p1.y-p2.y)**2)
+            for p1, p2 in zip(points[:-1], points[1:])]
+        eq_(sum(dists)/(len(points)-1), stats.distance_between_fixations)
+
+
+class TestFixationRecords(object):
+
+    def setup(self):
+        self.scanpath = mock_objects.smi_fixation_points()
+
+    def test_records_hold_fixations(self):
+        fix = fixation_statistics.fixation_records(self.scanpath)
+        eq_(len(self.scanpath), len(fix))
+        eq_([p.time for p in self.scanpath], fix.time.tolist())
+        eq_([p.duration for p in self.scanpath], fix.duration.tolist())
+        eq_([p.x for p in self.scanpath], fix.x.tolist())
+
+    def test_tables_are_used_as_they_are(self):
+        table = gazepoint.FixationTable.from_points(self.scanpath.points)
+        assert fixation_statistics.fixation_records(table) is table.points
@@ -7,11 +7,14 @@
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
 from __future__ import with_statement
+import numpy as np
+from gazehound import shapes
 from gazehound.runners import gaze_statistics
-from ..testutils import includes_
+from ..testutils import includes_, gt_
 from nose.tools import *
 from .. import mock_objects
 import os
+import copy
 import StringIO
 
 class TestGazeStatsOptionParser(object):
@@ -69,6 +72,11 @@ class TestGazeStatsOptionParser(object):
         analyzer = gaze_statistics.GazeStatisticsOptionParser(args)
         eq_(analyzer.options.recenter_on, 'foo')        
     
+    def test_analyzer_parses_cache(self):
+        args = [__file__, '--cache', 'bar']
+        analyzer = gaze_statistics.GazeStatisticsOptionParser(args)
+        ok_(analyzer.options.cache)
+
     def test_analyzer_parses_obt_dir(self):
         args = [__file__, '--stimuli=foo', '--obt-dir=.', 'bar']
         analyzer = gaze_statistics.GazeStatisticsOptionParser(args)
@@ -117,6 +125,40 @@ class TestGazeStatisticsRunner(object):
         gsr = gaze_statistics.GazeStatsRunner(args)
         assert gsr.scanpath is not None
     
+    def test_runner_counts_points_in_shapes_with_aoi_maps(self):
+        args = [__file__, "--stimuli="+self.stim_file, 
+            "--obt-dir="+self.example_path, self.scan_file]
+        gsr = gaze_statistics.GazeStatsRunner(args)
+        pres = gsr.timeline[1]
+        assert pres.aoi_map is not None
+        stats = gsr.analyzer.shape_stats(pres)
+        eq_([len(pres.scanpath.points_within(s)) for s in pres.shapes],
+            [st.points_in for st in stats])
+    
+    def test_timeline_stats_match_per_event_stats(self):
+        args = [__file__, "--stimuli="+self.stim_file, 
+            "--obt-dir="+self.example_path, self.scan_file]
+        gsr = gaze_statistics.GazeStatsRunner(args)
+        assert gsr.timeline.index_table is not None
+        fast = gsr.analyzer.timeline_stats()
+        gsr.analyzer.timeline = copy.copy(gsr.timeline)
+        gsr.analyzer.timeline.index_table = None
+        slow = gsr.analyzer.timeline_stats()
+        gt_(len(fast), len(gsr.timeline))
+        eq_([vars(st) for st in slow], [vars(st) for st in fast])
+        eq_([type(st.points_in) for st in slow],
+            [type(st.points_in) for st in fast])
+
+    def test_timeline_stats_use_replaced_scanpaths(self):
+        args = [__file__, "--stimuli="+self.stim_file, self.scan_file]
+        gsr = gaze_statistics.GazeStatsRunner(args)
+        pres = gsr.timeline[1]
+        pres.scanpath = pres.scanpath[0:3]
+        assert gsr.timeline.index_table is not None
+        eq_(None, gsr.timeline.current_index_table())
+        stats = gsr.analyzer.timeline_stats()
+        eq_(3, stats[1].total_points)
+
     def test_runner_combines_iview_3_files(self):
         args = [__file__, "--stimuli="+self.stim_file, self.iv3_file]
         gsr = gaze_statistics.GazeStatsRunner(args)
@@ -161,4 +203,10 @@ class TestGazeStatisticsAnalyzer(object):
         # I know this from looking at the file.
         invalid_count = 7
         eq_(stats.valid_lax, stats.total_points - invalid_count)
-        
\ No newline at end of file
+        
+
+    def test_valid_point_test_agrees_with_itself(self):
+        vt = gaze_statistics.ValidPointTest(shapes.Rectangle(0, 0, 10, 10))
+        points = np.array([[0, 0], [0, 5], [5, 5], [11, 5], [-1, -1]])
+        eq_([vt(p) for p in points], list(vt.contains_many(points)))
+
@@ -7,12 +7,29 @@
 # for Brain Imaging and Behavior, University of Wisconsin - Madison.
 
 from __future__ import with_statement
+import os
+import copy
+import shutil
+import tempfile
 from os import path
 from nose.tools import *
 from testutils import includes_, not_includes_, print_matrix
 from gazehound import shapes
+import numpy as np
 import mock_objects
 
+def mask_agrees(shape, width, height):
+    mask = shape.mask(width, height)
+    eq_((height, width), mask.shape)
+    for y in range(height):
+        for x in range(width):
+            eq_((x, y) in shape, mask[y, x])
+
+def contains_many_agrees(shape, points):
+    points = np.asarray(points)
+    expected = [tuple(p) in shape for p in points]
+    eq_(expected, list(shape.contains_many(points)))
+
 class TestShapes(object):
     def __init__(self):
         super(TestShapes, self).__init__()
@@ -26,6 +43,12 @@ class TestShapes(object):
         p = (0,0)
         assert p not in s # Should raise NotImplentedError
 
+    def test_contains_many_falls_back_to_contains(self):
+        class Origin(shapes.Shape):
+            def __contains__(self, point):
+                return point == (0, 0)
+        contains_many_agrees(Origin(), [(0, 0), (1, 0)])
+
 class TestRectangle(object):
     def __init__(self):
         super(TestRectangle, self).__init__()
@@ -44,6 +67,14 @@ class TestRectangle(object):
     
     def test_rectangle_knows_points_in(self):
         includes_(self.origin_rect, (50,50))
+
+    def test_contains_many_matches_contains(self):
+        contains_many_agrees(self.origin_rect, [
+            (0,0), (0,98), (99,98), (50,50), (100,100), (-1,50), (50,98.5)])
+
+    def test_mask_matches_contains(self):
+        mask_agrees(shapes.Rectangle(3, 2, 9, 12), 12, 10)
+        mask_agrees(shapes.Rectangle(9, 2, 3, 12), 12, 10)
         
     def test_to_matrix_creates_arrays_of_correct_size(self):
         mat = self.origin_rect.to_matrix()
@@ -71,7 +102,23 @@ class TestEllipse(object):
         includes_(self.ellipse, (30,50))
         includes_(self.ellipse, (50,90))
         includes_(self.ellipse, (50,10))
-    
+
+    def test_contains_many_matches_contains(self):
+        contains_many_agrees(self.ellipse, [
+            (0,0), (50,50), (70,50), (30,50), (50,90), (50,10), (69,60),
+            (70.5,50)])
+
+    def test_mask_matches_contains(self):
+        mask_agrees(shapes.Ellipse(10, 6, 5, 3), 14, 12)
+
+    def test_to_matrix_matches_contains(self):
+        mat = self.ellipse.to_matrix('i', 1, 0)
+        for i in range(self.ellipse.width()):
+            for j in range(self.ellipse.height()):
+                point = (i+self.ellipse.cx-self.ellipse.semix,
+                    j+self.ellipse.cy-self.ellipse.semiy)
+                eq_(int(point in self.ellipse), mat[i][j])
+
     def test_height_and_width_work(self):
         h = self.ellipse.height()
         w = self.ellipse.width()
@@ -94,6 +141,172 @@ class TestEllipse(object):
         w = self.ellipse.width()
         eq_(mat[w/2][h/2], 1)
         
+class TestPolygon(object):
+    def setup(self):
+        # An L: a 10x10 square with its top-right 5x5 corner missing
+        self.ell = shapes.Polygon(
+            [(0,0), (5,0), (5,5), (10,5), (10,10), (0,10)])
+        self.triangle = shapes.Polygon([(2,1), (13,4), (4,11)])
+
+    def test_polygon_knows_points_in_and_out(self):
+        includes_(self.ell, (2,2))
+        includes_(self.ell, (8,8))
+        not_includes_(self.ell, (8,2))
+        not_includes_(self.ell, (11,8))
+
+    def test_polygon_includes_border(self):
+        includes_(self.ell, (0,0))
+        includes_(self.ell, (5,2))
+        includes_(self.ell, (7,5))
+        includes_(self.ell, (10,10))
+        includes_(self.triangle, (13,4))
+
+    def test_square_polygon_matches_rectangle(self):
+        poly = shapes.Polygon([(3,2), (9,2), (9,12), (3,12)])
+        rect = shapes.Rectangle(3, 2, 9, 12)
+        points = np.array([(x, y) for x in np.arange(0, 14, 0.5)
+            for y in np.arange(0, 14, 0.5)])
+        eq_(list(rect.contains_many(points)), list(poly.contains_many(points)))
+
+    def test_contains_many_matches_contains(self):
+        contains_many_agrees(self.triangle, [
+            (2,1), (4,4), (12,4), (12,5), (4,11), (5,10.9), (0,0), (7.5,6)])
+
+    def test_mask_matches_contains(self):
+        mask_agrees(self.ell, 12, 11)
+        mask_agrees(self.triangle, 12, 14)
+
+    def test_bounds(self):
+        eq_((2, 1, 13, 11), self.triangle.bounds())
+
+    def test_empty_polygon_to_matrix(self):
+        eq_([], shapes.Polygon([]).to_matrix())
+
+    def test_to_matrix_matches_contains(self):
+        mat = self.triangle.to_matrix('i', 1, 0)
+        eq_(11, len(mat))
+        eq_(10, len(mat[0]))
+        eq_(1, mat[0][0])
+        eq_(0, mat[10][0])
+
+class TestAOIMap(object):
+    def setup(self):
+        self.shapes = [shapes.Rectangle(0, 0, 20, 10),
+            shapes.Ellipse(15, 8, 6, 4),
+            shapes.Polygon([(10, 20), (30, 2), (31, 23)])] + [
+            shapes.Rectangle(i, i, i+3, i+3) for i in range(8)]
+        self.map = shapes.AOIMap(self.shapes, 32, 24)
+        self.points = np.array([(x, y) for x in range(-2, 34, 3)
+            for y in range(-2, 26, 2)] + [(15.5, 8.25), (20.5, 3)])
+
+    def test_masks_match_contains_many(self):
+        masks = self.map.masks(self.points)
+        for i, s in enumerate(self.shapes):
+            eq_(list(s.contains_many(self.points)), list(masks[i]))
+
+    def test_counts_match_masks(self):
+        eq_(list(self.map.masks(self.points).sum(axis=1)),
+            list(self.map.counts(self.points)))
+
+    def test_labels_are_first_containing_shape(self):
+        labels = self.map.labels([(1, 1), (15, 12), (2, 22), (15.5, 11)])
+        eq_([0, 1, -1, 1], list(labels))
+        eq_([2], list(self.map.labels([(28, 18)])))
+
+    def test_compile_reuses_rasters(self):
+        m1 = shapes.compile_aoi_map(self.shapes, 32, 24)
+        m2 = shapes.compile_aoi_map(list(self.shapes), 32, 24)
+        assert m1.bits is m2.bits
+        assert m1.label_raster is m2.label_raster
+        assert m1.bits is not shapes.compile_aoi_map(self.shapes, 32, 25).bits
+
+    def test_compile_cache_is_bounded_by_bytes(self):
+        shapes.clear_shape_caches()
+        old_limit = shapes.AOI_MAP_CACHE_BYTES
+        shapes.AOI_MAP_CACHE_BYTES = sum(r.nbytes for height in (25, 26)
+            for r in shapes.AOIMap.rasterize(self.shapes, 32, height))
+        try:
+            maps = [shapes.compile_aoi_map(self.shapes, 32, 24 + i)
+                for i in range(3)]
+            eq_(2, len(shapes._aoi_raster_cache))
+            assert maps[2].bits is shapes.compile_aoi_map(
+                self.shapes, 32, 26).bits
+            assert maps[0].bits is not shapes.compile_aoi_map(
+                self.shapes, 32, 24).bits
+            shapes.AOI_MAP_CACHE_BYTES = 1
+            shapes.compile_aoi_map(self.shapes, 32, 24)
+            eq_(0, len(shapes._aoi_raster_cache))
+        finally:
+            shapes.AOI_MAP_CACHE_BYTES = old_limit
+            shapes.clear_shape_caches()
+
+    def test_compile_keys_on_geometry(self):
+        moved = self.shapes[:2] + [
+            shapes.Polygon([(10, 20), (30, 2), (31, 24)])] + self.shapes[3:]
+        m1 = shapes.compile_aoi_map(self.shapes, 32, 24)
+        m2 = shapes.compile_aoi_map(moved, 32, 24)
+        assert m1.bits is not m2.bits
+        same = shapes.Polygon(list(self.shapes[2].vertices))
+        m3 = shapes.compile_aoi_map(self.shapes[:2] + [same], 32, 24)
+        assert m3.bits is shapes.compile_aoi_map(self.shapes[:3], 32, 24).bits
+
+    def test_compile_skips_cache_without_keys(self):
+        class Anywhere(shapes.Shape):
+            def __contains__(self, point):
+                return point[0] > point[1]
+        anywhere = Anywhere()
+        m1 = shapes.compile_aoi_map([anywhere], 32, 24)
+        m2 = shapes.compile_aoi_map([anywhere], 32, 24)
+        assert m1.bits is not m2.bits
+        eq_(list(m1.label_raster.ravel()), list(m2.label_raster.ravel()))
+
+class TestShapeIndex(object):
+    def setup(self):
+        class Anywhere(shapes.Shape):
+            def __contains__(self, point):
+                return point[0] > point[1]
+        rng = np.random.RandomState(3)
+        self.shapes = [Anywhere()]
+        for x, y in rng.randint(0, 200, (40, 2)):
+            self.shapes.append(shapes.Rectangle(x, y, x+rng.randint(1, 30),
+                y+rng.randint(1, 30)))
+            self.shapes.append(shapes.Ellipse(x, y, rng.randint(1, 20),
+                rng.randint(1, 20)))
+            self.shapes.append(shapes.Polygon([(x, y), (x+20, y+5), 
+                (x+3, y+25)]))
+        self.shapes.append(shapes.Rectangle(500, 500, 400, 400))
+        self.index = shapes.ShapeIndex(self.shapes)
+        self.points = np.vstack((rng.randint(-20, 240, (500, 2)),
+            rng.rand(100, 2)*260 - 20, [(np.nan, 5), (10, np.inf)]))
+
+    def test_masks_match_contains_many(self):
+        masks = self.index.masks(self.points)
+        for i, s in enumerate(self.shapes):
+            eq_(list(s.contains_many(self.points)), list(masks[i]))
+
+    def test_counts_and_labels_match_masks(self):
+        masks = self.index.masks(self.points)
+        eq_(list(masks.sum(axis=1)), list(self.index.counts(self.points)))
+        labels = np.where(masks.any(axis=0), masks.argmax(axis=0), -1)
+        eq_(list(labels), list(self.index.labels(self.points)))
+
+    def test_small_cells_give_same_answers(self):
+        index = shapes.ShapeIndex(self.shapes, cell_size=3)
+        eq_(list(self.index.counts(self.points)), 
+            list(index.counts(self.points)))
+
+    def test_empty_index(self):
+        eq_([-1, -1], list(shapes.ShapeIndex([]).labels([(1, 1), (2, 2)])))
+
+    def test_packed_contains_falls_back_to_contains_many(self):
+        circles = [shapes.Ellipse(0, 0, 2, 2), shapes.Ellipse(5, 5, 1, 1)]
+        which = [1, 0, 1, 0]
+        points = [(5, 5), (5, 5), (0, 0), (1, 1)]
+        eq_([True, False, False, True], list(shapes.Shape.packed_contains(
+            circles, which, points)))
+        eq_([True, False, False, True], list(shapes.Ellipse.packed_contains(
+            shapes.Ellipse.pack(circles), which, points)))
+
 class TestShapeParser(object):
     def __init__(self):
         super(TestShapeParser, self).__init__()
@@ -120,6 +333,18 @@ class TestShapeParser(object):
         eq_(s.x2, 60)
         eq_(s.y2, 24)
     
+    def test_parser_makes_polygons_from_obt(self):
+        s = self.parser.parse_obt_str(
+            '3, 0, 1, 60, 24, 10, 40  Triangle, with commas', name='tri')
+        assert isinstance(s, shapes.Polygon)
+        eq_([(0, 1), (60, 24), (10, 40)], s.vertices)
+        eq_(' Triangle, with commas', s.description)
+        eq_('tri', s.name)
+
+    def test_parser_rejects_short_polygons(self):
+        assert self.parser.parse_obt_str('3, 0, 1, 60, 24  Line') is None
+        assert self.parser.parse_obt_str('3, 0, 1, 60, 24, 5  Odd') is None
+
     def test_parser_makes_ellipses_from_obt(self):
         s = self.parser.parse_obt_str(self.ell_str)
         assert isinstance(s, shapes.Ellipse)
@@ -166,6 +391,64 @@ class TestShapeReader(object):
         eq_(len(slist), len(self.shape_cfg))
         
 
+class TestShapeCaches(object):
+    def setup(self):
+        shapes.clear_shape_caches()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.obt_file = path.join(self.tmp_dir, 'STIM.OBT')
+        self.write_obt('1, 0, 1, 60, 24  Rect')
+        self.reader = shapes.ShapeReader(path = self.tmp_dir)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+        shapes.clear_shape_caches()
+
+    def write_obt(self, *objects):
+        with open(self.obt_file, 'w') as f:
+            f.write("[Objects]\n")
+            for i, obj in enumerate(objects):
+                f.write("Object%02d=%s\n" % (i+1, obj))
+
+    def test_reading_twice_shares_shapes(self):
+        s1 = self.reader.find_file_and_create_shapes('stim')
+        s2 = self.reader.find_file_and_create_shapes('stim')
+        assert s1 is not s2
+        assert s1[0] is s2[0]
+
+    def test_changed_files_are_reread(self):
+        s1 = self.reader.shapes_from_obt_file(self.obt_file)
+        self.write_obt('1, 0, 1, 60, 24  Rect', '2, 0, 1, 21, 599  Ellipse')
+        s2 = self.reader.shapes_from_obt_file(self.obt_file)
+        eq_(1, len(s1))
+        eq_(2, len(s2))
+
+    def test_new_files_are_found(self):
+        assert self.reader.find_file_and_create_shapes('other') is None
+        # Make sure the directory's mtime moves.
+        st = os.stat(self.tmp_dir)
+        shutil.copy(self.obt_file, path.join(self.tmp_dir, 'other.obt'))
+        os.utime(self.tmp_dir, (st.st_atime, st.st_mtime + 10))
+        eq_(1, len(self.reader.find_file_and_create_shapes('other')))
+
+    def test_files_added_in_the_same_tick_are_found(self):
+        assert self.reader.find_file_and_create_shapes('other') is None
+        st = os.stat(self.tmp_dir)
+        shutil.copy(self.obt_file, path.join(self.tmp_dir, 'other.obt'))
+        os.utime(self.tmp_dir, (st.st_atime, st.st_mtime))
+        eq_(1, len(self.reader.find_file_and_create_shapes('other')))
+
+    def test_names_with_a_directory(self):
+        os.mkdir(path.join(self.tmp_dir, 'set1'))
+        shutil.copy(self.obt_file, path.join(self.tmp_dir, 'set1', 'img.OBT'))
+        name = path.join('set1', 'img')
+        sf = shapes.ShapeFilename(name, self.tmp_dir)
+        eq_(name + '.OBT', sf.first_valid())
+        eq_(1, len(self.reader.find_file_and_create_shapes(name)))
+
+    def test_missing_directory_has_no_files(self):
+        sf = shapes.ShapeFilename('stim', path.join(self.tmp_dir, 'nope'))
+        assert sf.first_valid() is None
+
 class TestShapeFilename(object):
     def __init__(self):
         super(TestShapeFilename, self).__init__()
@@ -214,6 +497,18 @@ class TestTimelineDecorator(object):
         dec = shapes.TimelineDecorator()
         tls = dec.add_shapes_to_timeline(self.timeline, self.shape_hash)
         assert(not hasattr(self.timeline[0], 'shapes'))
+
+    def test_decorator_shares_scanpaths(self):
+        self.timeline[1].scanpath = mock_objects.iview_points_noisy()
+        dec = shapes.TimelineDecorator(self.reader)
+        tls = dec.find_shape_files_and_add_to_timeline(self.timeline)
+        assert tls[1].scanpath is self.timeline[1].scanpath
+
+    def test_decorator_shares_indexes_between_events(self):
+        self.timeline.events.append(copy.copy(self.timeline[1]))
+        dec = shapes.TimelineDecorator(self.reader)
+        tls = dec.find_shape_files_and_add_to_timeline(self.timeline)
+        assert tls[1].shape_index is tls[2].shape_index
     
     def test_decorator_finds_shapes_in_path(self):
         dec = shapes.TimelineDecorator(self.reader)
@@ -221,6 +516,13 @@ class TestTimelineDecorator(object):
         assert(tls[0].shapes is None)
         assert(tls[1].shapes is not None)
     
+    def test_decorator_adds_aoi_maps_with_screen_size(self):
+        dec = shapes.TimelineDecorator(self.reader, screen_size=(800, 600))
+        tls = dec.find_shape_files_and_add_to_timeline(self.timeline)
+        assert not hasattr(tls[0], 'aoi_map')
+        eq_(tls[1].shapes, tls[1].aoi_map.shapes)
+        eq_(tls[1].shapes, tls[1].shape_index.shapes)
+
     def test_find_shape_file_adds_none_for_failed_match(self):
         dec = shapes.TimelineDecorator(self.reader)
         p = dec.find_file_and_add_shapes_to_presentation(self.timeline[0])
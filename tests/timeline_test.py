@@ -10,6 +10,8 @@
 from os import path
 from gazehound import event, timeline
 from gazehound.readers.timeline import TimelineReader
+from nose.tools import eq_
+import numpy as np
 
 class TestTimeline(object):
     def setup(self):
@@ -49,4 +51,26 @@ class TestTimeline(object):
         p[0].end = (p[1].start + 1)
         
         t = timeline.Timeline(events = p)
-        assert not t.valid()
\ No newline at end of file
+        assert not t.valid()
+
+class TestSegmentReduce(object):
+    def setup(self):
+        self.values = np.arange(10)
+        self.table = np.array([[0, 3], [3, 3], [5, 10], [8, 2], [2, 6]])
+
+    def test_sums_each_segment(self):
+        sums = timeline.segment_reduce(np.add, self.values, self.table)
+        eq_([3, 0, 35, 0, 14], list(sums))
+
+    def test_empty_segments_get_empty_value(self):
+        mins = timeline.segment_reduce(
+            np.minimum, self.values, self.table, empty=-1)
+        eq_([0, -1, 5, -1, 2], list(mins))
+
+    def test_reduces_columns(self):
+        values = np.column_stack((self.values, self.values*2))
+        sums = timeline.segment_reduce(np.add, values, self.table)
+        eq_([[3, 6], [0, 0], [35, 70], [0, 0], [14, 28]], sums.tolist())
+
+    def test_empty_table(self):
+        eq_(0, len(timeline.segment_reduce(np.add, self.values, [])))
@@ -85,8 +85,114 @@ class TestTimelineScanpathCombiner(object):
         post_xy = centered[0].scanpath.as_array(('x', 'y'))
         eq_(pre_xy.shape, post_xy.shape)
         eq_(0, np.sum(pre_xy == post_xy))
+
+    def test_recenter_leaves_viewings_alone(self):
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath
+        ).viewings()
+        before = viewings[0].scanpath.as_array(('x', 'y'))
+        centered = viewings.recenter_on('stim1', 400, 300)
+        assert centered[0] is not viewings[0]
+        assert np.array_equal(before, viewings[0].scanpath.as_array(('x', 'y')))
         
 
+    def test_index_table_matches_viewings(self):
+        combiner = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath
+        )
+        viewings = combiner.viewings()
+        table = viewings.index_table
+        eq_((len(self.timeline), 2), table.shape)
+        assert viewings.indexed_scanpath is self.scanpath
+        for pres, (start, end) in zip(viewings, table):
+            eq_(end - start, len(pres.scanpath))
+            assert np.array_equal(
+                self.scanpath.points[start:end], pres.scanpath.points)
+
+    def test_index_table_is_computed_once(self):
+        combiner = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath
+        )
+        assert combiner.viewings().index_table is combiner.index_table()
+        table = combiner.index_table()
+        combiner.scanpath = mock_objects.iview_scanpath_blinky()
+        assert combiner.index_table() is not table
+        assert combiner.viewings().indexed_scanpath is combiner.scanpath
+
+    def test_index_table_is_current_until_scanpaths_change(self):
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath
+        ).viewings()
+        assert viewings.current_index_table() is viewings.index_table
+        viewings[0].scanpath = viewings[0].scanpath.recenter_by(1, 1)
+        eq_(None, viewings.current_index_table())
+
+    def test_sample_event_ids(self):
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath
+        ).viewings()
+        ids = viewings.sample_event_ids()
+        eq_(len(self.scanpath), len(ids))
+        for i, (start, end) in enumerate(viewings.index_table):
+            ok_(np.all(ids[start:end] == i))
+        eq_(sum(len(pres.scanpath) for pres in viewings), np.sum(ids >= 0))
+        assert viewings.recenter_on('stim1', 400, 300).index_table is None
+
+
+class TestCombinerWithDroppedSamples(object):
+    def setup(self):
+        self.period = 1000.0/60
+        self.times = np.arange(200)*self.period
+        self.timeline = mock_objects.simple_timeline_for_blinky()
+
+    def scanpath(self, times):
+        points = np.column_stack((times, np.arange(len(times))))
+        return gazepoint.IViewScanpath(60, points, ['time', 'x'])
+
+    def test_gap_free_scanpaths_index_directly(self):
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath(np.round(self.times))
+        ).viewings()
+        for pres in viewings:
+            start = int(60*pres.start/1000.0)
+            eq_(start, pres.scanpath[0][1])
+            eq_(int(60*pres.end/1000.0) - start, len(pres.scanpath))
+
+    def test_clock_drift_is_not_a_gap(self):
+        # 16 msec steps drift more than 100 msec from the 60 Hz grid
+        drifting = np.arange(200)*16.0
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath(drifting)
+        ).viewings()
+        direct = viewing.Combiner(
+            timeline = mock_objects.simple_timeline_for_blinky(),
+            scanpath = self.scanpath(np.round(self.times))
+        ).viewings()
+        for pres, expected in zip(viewings, direct):
+            eq_(list(expected.scanpath.as_array(('x',))[:,0]),
+                list(pres.scanpath.as_array(('x',))[:,0]))
+
+    def test_gaps_are_looked_up_in_time_column(self):
+        # Drop a second and a bit before the first event ends
+        times = np.concatenate((self.times[:12], self.times[80:]))
+        viewings = viewing.Combiner(
+            timeline = self.timeline,
+            scanpath = self.scanpath(times)
+        ).viewings()
+        for pres in viewings:
+            expected = times[(times > pres.start - self.period) &
+                (times <= pres.end - self.period)]
+            eq_(list(expected), list(pres.scanpath.as_array(('time',))[:,0]))
+        gt_(len(viewings[0].scanpath), 0)
+
+
 class TestFixatedTimeline(object):
     def setup(self):
         self.fixations = mock_objects.smi_fixation_points()
@@ -117,4 +223,38 @@ class TestFixatedTimeline(object):
         eq_(len(self.viewings[1].scanpath), 4)
         #eq_(self.viewings[1].scanpath[-1], 1)
     
-    
\ No newline at end of file
+    
+
+    def test_viewings_match_midpoint_rule(self):
+        for pres in self.viewings:
+            expected = [p for p in self.fixations
+                if pres.start <= p.time_midpoint() < pres.end]
+            eq_(expected, list(pres.scanpath.points))
+
+    def test_index_table_of_fixations(self):
+        for pres, (start, end) in zip(
+                self.viewings, self.viewings.index_table):
+            eq_(list(self.fixations.points[start:end]),
+                list(pres.scanpath.points))
+
+    def test_viewings_of_fixation_tables(self):
+        table = gazepoint.IViewFixationFactory().table_from_component_list(
+            mock_objects.smi_fixation_ary())
+        viewings = viewing.Combiner(
+            timeline = mock_objects.standard_timeline(),
+            scanpath = table
+        ).viewings()
+        for pres, table_pres in zip(self.viewings, viewings):
+            eq_([p.time for p in pres.scanpath],
+                [p.time for p in table_pres.scanpath])
+
+    def test_viewings_of_unsorted_fixations(self):
+        points = list(reversed(self.fixations.points))
+        viewings = viewing.Combiner(
+            timeline = mock_objects.standard_timeline(),
+            scanpath = gazepoint.Scanpath(points)
+        ).viewings()
+        eq_([len(pres.scanpath) for pres in self.viewings],
+            [len(pres.scanpath) for pres in viewings])
+        eq_(None, viewings.index_table)
+